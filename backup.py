@@ -0,0 +1,178 @@
+# [[ NATIVE ]]
+from typing import Callable, Optional
+import tempfile
+import sqlite3
+import shutil
+import gzip
+import time
+import os
+
+
+# Marker of gzip file
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def copy_pages(source: sqlite3.Connection, target: sqlite3.Connection, pages: int, pause: float,
+               progress: Optional[Callable[[int, int], None]]) -> int:
+    """
+    Copying database by SQLite backup API, source is locked only while one step is copied
+    :param source: Connection of source database
+    :param target: Connection of target database
+    :param pages: Count of pages copied in one step
+    :param pause: Sleep between steps in seconds, other connections use database meanwhile
+    :param progress: Function for progress reporting, gets count of copied and all pages
+    :return: Count of pages
+    """
+    total = 0
+
+    def step(status: int, remaining: int, count: int) -> None:
+        nonlocal total
+        total = count
+        if progress is not None:
+            progress(count - remaining, count)
+        if remaining and pause:
+            time.sleep(pause)
+
+    source.backup(target, pages=pages, progress=step)
+    return total
+
+
+def backup_file(source_path: str, target_path: str, pages: int = 100, pause: float = 0.005, compress: bool = False,
+                progress: Callable[[int, int], None] = None) -> dict:
+    """
+    Online backup of SQLite database, readers and writers are not blocked while backup is running
+    :param source_path: Path of database
+    :param target_path: Path of backup
+    :param pages: Count of pages copied in one step
+    :param pause: Sleep between steps in seconds
+    :param compress: Compress backup by gzip
+    :param progress: Function for progress reporting, gets count of copied and all pages
+    :return: Metrics of backup
+    """
+    started = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(target_path))
+
+    # Backup is written to temporary file, so target is replaced only by finished backup
+    handle, temp_path = tempfile.mkstemp(suffix='.db', dir=directory)
+    os.close(handle)
+    try:
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(temp_path)
+        try:
+            total = copy_pages(source, target, pages, pause, progress)
+            page_size = source.execute('PRAGMA page_size').fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+
+        size = os.path.getsize(temp_path)
+        if compress:
+            # Compressed backup is written to temporary file too, so failed compression does not spoil target
+            handle, packed_path = tempfile.mkstemp(suffix='.gz', dir=directory)
+            os.close(handle)
+            try:
+                with open(temp_path, 'rb') as raw, gzip.open(packed_path, 'wb') as packed:
+                    shutil.copyfileobj(raw, packed, 1024 * 1024)
+                os.replace(packed_path, target_path)
+            finally:
+                if os.path.exists(packed_path):
+                    os.remove(packed_path)
+        else:
+            os.replace(temp_path, target_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    seconds = time.perf_counter() - started
+    return {
+        'pages': total,
+        'bytes': total * page_size,
+        'file_bytes': os.path.getsize(target_path),
+        'compression': size / max(os.path.getsize(target_path), 1),
+        'seconds': seconds,
+        'pages_per_second': total / seconds if seconds else 0.0,
+        'bytes_per_second': total * page_size / seconds if seconds else 0.0,
+    }
+
+
+def restore_file(snapshot_path: str, target_path: str, pages: int = 100, pause: float = 0.005,
+                 progress: Callable[[int, int], None] = None) -> dict:
+    """
+    Restoring SQLite database from backup, compressed backup is found by gzip marker
+    Database is replaced page by page, so connections of application stay valid
+    :param snapshot_path: Path of backup
+    :param target_path: Path of database
+    :param pages: Count of pages copied in one step
+    :param pause: Sleep between steps in seconds
+    :param progress: Function for progress reporting, gets count of copied and all pages
+    :return: Metrics of restore
+    """
+    started = time.perf_counter()
+
+    with open(snapshot_path, 'rb') as file:
+        compressed = file.read(2) == GZIP_MAGIC
+
+    temp_path = None
+    if compressed:
+        handle, temp_path = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(target_path)))
+        os.close(handle)
+        with gzip.open(snapshot_path, 'rb') as packed, open(temp_path, 'wb') as raw:
+            shutil.copyfileobj(packed, raw, 1024 * 1024)
+
+    try:
+        source = sqlite3.connect(temp_path or snapshot_path)
+        target = sqlite3.connect(target_path)
+        try:
+            total = copy_pages(source, target, pages, pause, progress)
+            page_size = source.execute('PRAGMA page_size').fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+
+    seconds = time.perf_counter() - started
+    return {
+        'pages': total,
+        'bytes': total * page_size,
+        'seconds': seconds,
+        'pages_per_second': total / seconds if seconds else 0.0,
+        'bytes_per_second': total * page_size / seconds if seconds else 0.0,
+    }
+
+
+async def load_snapshot(connection, path: str) -> None:
+    """
+    Loading database file into in-memory database
+    :param connection: Connection of in-memory database (aiosqlite)
+    :param path: Path of database file
+    :return:
+    """
+    # Driver is imported only if it is used
+    import aiosqlite
+
+    async with aiosqlite.connect(path) as source:
+        await source.backup(connection)
+
+
+async def save_snapshot(connection, path: str) -> None:
+    """
+    Saving in-memory database to file, file is replaced only by finished copy
+    :param connection: Connection of in-memory database (aiosqlite)
+    :param path: Path of database file
+    :return:
+    """
+    handle, temp_path = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(path)))
+    os.close(handle)
+    try:
+        # Pages are copied by thread of connection
+        target = sqlite3.connect(temp_path, check_same_thread=False)
+        try:
+            await connection.backup(target)
+        finally:
+            target.close()
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
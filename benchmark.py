@@ -0,0 +1,129 @@
+# [[ NATIVE ]]
+from typing import Callable
+import tempfile
+import asyncio
+import timeit
+import os
+
+# [[ SQLALCHEMY ]]
+from sqlalchemy import select, insert, or_
+
+# [[ DATABASE ]]
+import database
+
+# [[ SETTINGS ]]
+from settings import DBType
+
+
+def legacy_books_get(title: str = None, author: str = None, genre_id: int = None):
+    """
+    Building query like books_get did before pre-built statements
+    :param title: Title of book
+    :param author: Author of book
+    :param genre_id: Genre ID of book
+    :return: Query
+    """
+    query = select(database.Books)
+
+    if (title == author) and (title is not None):
+        query = query.where(or_(database.Books.title.like('%{}%'.format(title)),
+                                database.Books.author.like('%{}%'.format(author))))
+    else:
+        if title is not None:
+            query = query.where(database.Books.title.like('%{}%'.format(title)))
+        if author is not None:
+            query = query.where(database.Books.author.like('%{}%'.format(author)))
+
+    if genre_id is not None:
+        query = query.join(database.BookGenre, database.Books.id == database.BookGenre.book_id)
+        query = query.join(database.Genres, database.Genres.id == database.BookGenre.genre_id)
+        query = query.where(database.Genres.id == genre_id)
+
+    return query
+
+
+def legacy_get_table_by_name(query) -> type:
+    """
+    Getting table object like __get_table_by_name did before tables map
+    :param query: Query
+    :return: Table object
+    """
+    for subclass in database.Base.__subclasses__():
+        if hasattr(subclass, '__tablename__') and subclass.__tablename__ == str(query.table):
+            return subclass
+
+
+def measure(name: str, func: Callable, number: int) -> float:
+    """
+    Measuring time of one call
+    :param name: Name of measurement
+    :param func: Measured function
+    :param number: Count of calls
+    :return: Microseconds per call
+    """
+    per_call = min(timeit.repeat(func, number=number, repeat=5)) / number * 1_000_000
+    print('{:<48} {:>10.2f} us'.format(name, per_call))
+    return per_call
+
+
+async def measure_async(name: str, func: Callable, number: int) -> float:
+    """
+    Measuring time of one call of coroutine function
+    :param name: Name of measurement
+    :param func: Coroutine function
+    :param number: Count of calls
+    :return: Microseconds per call
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for _ in range(number):
+        await func()
+    per_call = (loop.time() - start) / number * 1_000_000
+    print('{:<48} {:>10.2f} us'.format(name, per_call))
+    return per_call
+
+
+async def main(db: database.Database) -> None:
+    """
+    Running benchmark
+    :param db: Database for end-to-end measurements
+    :return:
+    """
+    insert_query = insert(database.Books)
+
+    print('[[ PER-CALL PYTHON OVERHEAD ]]')
+    measure('books_get query: built every call', lambda: legacy_books_get('a', 'a', 1), 10_000)
+    measure('books_get query: cache key of new query', lambda: legacy_books_get('a', 'a', 1)._generate_cache_key(), 2_000)
+    before = measure('table of INSERT: scanning subclasses', lambda: legacy_get_table_by_name(insert_query), 100_000)
+    after = measure('table of INSERT: tables map', lambda: database.TABLES.get(str(insert_query.table)), 100_000)
+    print('{:<48} {:>10.1f} x'.format('speedup', before / after))
+
+    print('\n[[ END-TO-END, SQLITE ]]')
+    await db.initialize()
+    genre_id = await db.genres_create(name='Genre')
+    async with db.transaction():
+        for i in range(100):
+            book_id = await db.books_create(title=f'Title {i}', author=f'Author {i}', description='Description')
+            await db.book_genre_create(book_id=book_id, genre_id=genre_id)
+
+    before = await measure_async('books_get: query built every call',
+                                 lambda: db.get_all(legacy_books_get('1', '1', genre_id)), 1_000)
+    after = await measure_async('books_get: pre-built statement',
+                                lambda: db.books_get(title='1', author='1', genre_id=genre_id), 1_000)
+    print('{:<48} {:>10.1f} x'.format('speedup', before / after))
+
+    before = await measure_async('books_get(_id=...): query built every call',
+                                 lambda: db.get_one(select(database.Books).where(database.Books.id == 1)), 1_000)
+    after = await measure_async('books_get(_id=...): pre-built statement', lambda: db.books_get(_id=1), 1_000)
+    print('{:<48} {:>10.1f} x'.format('speedup', before / after))
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+
+        db = database.Database()
+        db.db_type = DBType.SQLITE
+        db.db_name = 'benchmark'
+
+        asyncio.run(main(db))
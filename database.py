@@ -1,26 +1,63 @@
 # [[ NATIVE ]]
-from typing import Union, Sequence, Any, Type, List
-import traceback
+from typing import Union, Sequence, Any, Type, Dict, List, Callable, Awaitable, AsyncIterator, Optional
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from weakref import WeakKeyDictionary
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import sqlite3
+import random
 import warnings
+import multiprocessing
+import zlib
 import os.path
 import logging
 import asyncio
+import time
 
 # [[ SQLALCHEMY ]]
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncAttrs, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy import ForeignKey, ChunkedIteratorResult, Result
-from sqlalchemy import Select, Insert, Update, Delete
-from sqlalchemy import select, insert, delete
-from sqlalchemy.types import JSON
-from sqlalchemy import or_
-
-# [[ AIOMYSQL ]]
-from aiomysql.sa import create_engine
+from sqlalchemy.exc import ResourceClosedError
+from sqlalchemy import event
+from sqlalchemy import Select, Insert, Update, Delete, Join
+from sqlalchemy import select, insert, delete, bindparam
+from sqlalchemy import String, Integer, Index
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.types import JSON, Text, TypeDecorator
+from sqlalchemy import or_, and_
+from sqlalchemy import func as sql_func
+
+# [[ MIGRATIONS ]]
+from migrations import Migration, CreateTables, AddColumn, ModifyColumn, CreateIndex, DropIndex, Batched, Call
+from migrations import log_progress
+from migrations import execute as execute_sql
+
+# [[ BACKUP ]]
+from backup import backup_file, restore_file, load_snapshot, save_snapshot
+
+# [[ INGEST ]]
+from ingest import detect_format, read_chunks, prepare_books
+from ingest import normalize_text, normalize_name, book_hash
+
+# [[ SNAPSHOT ]]
+from snapshot import write_snapshot
+
+# [[ METRICS ]]
+from metrics import Registry
 
 # [[ SETTINGS ]]
 from settings import DBType
-from settings import DB_TYPE, DB_HOST, DB_USER, DB_PASS, DB_NAME
+from settings import DB_TYPE, DB_HOST, DB_USER, DB_PASS, DB_NAME, DB_PARALLELISM, DB_LIBRARIES, DB_MAX_OPEN
+from settings import DB_MEMORY, DB_MEMORY_SNAPSHOT, DB_MEMORY_FLUSH_INTERVAL
+from settings import DB_WRITE_QUEUE, DB_WRITE_QUEUE_DELAY, DB_WRITE_QUEUE_ROWS, DB_WRITE_QUEUE_SIZE
+from settings import DB_RETRY_ATTEMPTS, DB_RETRY_DELAY, DB_RETRY_MAX_DELAY, DB_BUSY_TIMEOUT
+from settings import DB_REPLICAS, DB_REPLICA_SELECTION, DB_REPLICA_CHECK_INTERVAL, DB_READ_YOUR_WRITES
+from settings import DB_METRICS, DB_METRICS_FILE, DB_METRICS_INTERVAL, DB_METRICS_PORT
+from settings import DB_COMPRESS_DESCRIPTIONS, DB_COMPRESS_MIN_LENGTH, DB_COMPRESS_LEVEL
 
 # [[ SETTING UP WARNINGS AND LOGGER ]]
 warnings.filterwarnings('ignore')
@@ -28,6 +65,84 @@ logger = logging.getLogger()
 logger.level = logging.INFO
 
 
+# Beginning of compressed text, text beginning with it is always compressed, so plain text is not mistaken for it
+COMPRESSED_MARKER = b'\x00z'
+
+
+def compress_text(value: str, min_length: int = DB_COMPRESS_MIN_LENGTH,
+                  level: int = DB_COMPRESS_LEVEL) -> Union[str, bytes]:
+    """
+    Compressing long text by zlib, short text and text which is not compressed well is kept plain
+    :param value: Text
+    :param min_length: Min length of compressed text in bytes
+    :param level: Level of compression
+    :return: Plain text or compressed bytes with COMPRESSED_MARKER
+    """
+    data = value.encode('utf-8')
+    marked = data.startswith(COMPRESSED_MARKER)
+    if len(data) < min_length and not marked:
+        return value
+
+    compressed = COMPRESSED_MARKER + zlib.compress(data, level)
+    if len(compressed) >= len(data) and not marked:
+        return value
+    return compressed
+
+
+def is_compressed(value: Union[str, bytes, None]) -> bool:
+    """
+    Checking value of compressed column
+    :param value: Value read from database
+    :return: Value is compressed
+    """
+    return isinstance(value, bytes) and value.startswith(COMPRESSED_MARKER)
+
+
+def decompress_text(value: Union[str, bytes, None]) -> Optional[str]:
+    """
+    Reading value of compressed column, plain values are returned as they are
+    :param value: Value read from database, plain text is read as bytes from BLOB column of MySQL
+    :return: Text
+    """
+    if is_compressed(value):
+        return zlib.decompress(value[len(COMPRESSED_MARKER):]).decode('utf-8')
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text compressed on write if compression is enabled and text is long, rows written before are read as they are
+    SQLite keeps compressed values as BLOB in TEXT column, for MySQL the column is LONGBLOB
+    """
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, enabled: bool = DB_COMPRESS_DESCRIPTIONS, min_length: int = DB_COMPRESS_MIN_LENGTH,
+                 level: int = DB_COMPRESS_LEVEL):
+        """
+        :param enabled: Compressing new values
+        :param min_length: Min length of compressed text in bytes
+        :param level: Level of compression
+        """
+        super(CompressedText, self).__init__()
+        self.enabled = enabled
+        self.min_length = min_length
+        self.level = level
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Union[str, bytes, None]:
+        if value is None:
+            return value
+        # Fix for plain text beginning with marker, it must be compressed, else it is read as compressed
+        if self.enabled or value.startswith(COMPRESSED_MARKER.decode()):
+            return compress_text(value, self.min_length, self.level)
+        return value
+
+    def process_result_value(self, value: Union[str, bytes, None], dialect) -> Optional[str]:
+        return decompress_text(value)
+
+
 class Base(AsyncAttrs, DeclarativeBase):
     """
     Base class for tables, added JSON support
@@ -57,11 +172,35 @@ class Genres(Base):
 
     @staticmethod
     def mysql():
-        return 'CREATE TABLE IF NOT EXISTS promo (' \
+        return 'CREATE TABLE IF NOT EXISTS genres (' \
                'id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,' \
                'name TEXT NOT NULL)'
 
 
+class Authors(Base):
+    """
+    Authors table
+    """
+    __tablename__ = 'authors'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(nullable=False)
+    # Normalized name for lookup, see normalize_name(), NOCASE is needed by SQLite for index seek by LIKE
+    name_key: Mapped[str] = mapped_column(String(255, collation='NOCASE'), nullable=False)
+
+    __table_args__ = (
+        Index('uq_authors_name_key', 'name_key', unique=True),
+    )
+
+    @staticmethod
+    def mysql():
+        return 'CREATE TABLE IF NOT EXISTS authors (' \
+               'id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,' \
+               'name TEXT NOT NULL,' \
+               'name_key VARCHAR(255) NOT NULL,' \
+               'UNIQUE INDEX uq_authors_name_key (name_key))'
+
+
 class Books(Base):
     """
     Books table
@@ -71,15 +210,26 @@ class Books(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(nullable=False)
     author: Mapped[str] = mapped_column(nullable=False)
-    description: Mapped[str] = mapped_column(nullable=False)
+    # Long descriptions are compressed, see CompressedText
+    description: Mapped[str] = mapped_column(CompressedText(), nullable=False)
+    # Hash of normalized content, see book_hash()
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    author_id: Mapped[Optional[int]] = mapped_column(ForeignKey('authors.id'), nullable=True, index=True)
+
+    __table_args__ = (
+        Index('uq_books_content_hash', 'content_hash', unique=True),
+    )
 
     @staticmethod
     def mysql():
-        return 'CREATE TABLE IF NOT EXISTS users (' \
+        return 'CREATE TABLE IF NOT EXISTS books (' \
                'id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,' \
                'title TEXT NOT NULL,' \
                'author TEXT NOT NULL,' \
-               'description TEXT NOT NULL)'
+               'description LONGBLOB NOT NULL,' \
+               'content_hash CHAR(64) NULL,' \
+               'author_id INTEGER NULL,' \
+               'INDEX ix_books_author_id (author_id))'
 
 
 class BookGenre(Base):
@@ -89,290 +239,2098 @@ class BookGenre(Base):
     __tablename__ = 'book_genre'
 
     id: Mapped[int] = mapped_column(primary_key=True)
+    # Genres of book are read by unique index, it starts with book_id
     book_id: Mapped[Books] = mapped_column(ForeignKey('books.id'))
+    # Books of genre are read by index (genre_id, book_id), see Migration 6
     genre_id: Mapped[Genres] = mapped_column(ForeignKey('genres.id'))
 
+    __table_args__ = (
+        Index('uq_book_genre_book_id_genre_id', 'book_id', 'genre_id', unique=True),
+    )
+
     @staticmethod
     def mysql():
-        return 'CREATE TABLE IF NOT EXISTS users (' \
+        return 'CREATE TABLE IF NOT EXISTS book_genre (' \
                'id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,' \
                'book_id INTEGER NOT NULL,' \
                'genre_id INTEGER NOT NULL,' \
+               'UNIQUE INDEX uq_book_genre_book_id_genre_id (book_id, genre_id),' \
                'FOREIGN KEY (book_id) REFERENCES books (id),' \
                'FOREIGN KEY (genre_id) REFERENCES genres (id))'
 
 
-class Database:
+class Counters(Base):
     """
-    Main database class
+    Materialized counters for statistics, changed together with counted rows
+    Kinds: books (key_id is 0), genre and author (key_id is ID of genre or author)
     """
-    def __init__(self):
-        # Setting up main parameters
-        self.db_url = None
+    __tablename__ = 'counters'
 
-        self.db_type: DBType = DB_TYPE
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    key_id: Mapped[int] = mapped_column(nullable=False)
+    value: Mapped[int] = mapped_column(nullable=False)
 
-        self.db_name: str = DB_NAME
-        self.db_user: str = DB_USER
-        self.db_host: str = DB_HOST
-        self.db_pass: str = DB_PASS
+    __table_args__ = (
+        Index('uq_counters_kind_key_id', 'kind', 'key_id', unique=True),
+        Index('ix_counters_kind_value', 'kind', 'value'),
+    )
 
-        # Declaring variables for SQLAlchemy
-        self.engine = None
-        self.session = None
+    @staticmethod
+    def mysql():
+        return 'CREATE TABLE IF NOT EXISTS counters (' \
+               'id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,' \
+               'kind VARCHAR(16) NOT NULL,' \
+               'key_id INTEGER NOT NULL,' \
+               'value BIGINT NOT NULL,' \
+               'UNIQUE INDEX uq_counters_kind_key_id (kind, key_id),' \
+               'INDEX ix_counters_kind_value (kind, value))'
 
-    async def __start(self) -> None:
+
+class SchemaVersion(Base):
+    """
+    Version of database schema, table has one row
+    """
+    __tablename__ = 'schema_version'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(nullable=False)
+
+    @staticmethod
+    def mysql():
+        return 'CREATE TABLE IF NOT EXISTS schema_version (' \
+               'id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,' \
+               'version INTEGER NOT NULL)'
+
+
+class MigrationProgress(Base):
+    """
+    Position of interrupted migration
+    """
+    __tablename__ = 'migration_progress'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(nullable=False)
+    step: Mapped[int] = mapped_column(nullable=False)
+    position: Mapped[int] = mapped_column(nullable=False)
+
+    @staticmethod
+    def mysql():
+        return 'CREATE TABLE IF NOT EXISTS migration_progress (' \
+               'id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,' \
+               'version INTEGER NOT NULL,' \
+               'step INTEGER NOT NULL,' \
+               'position BIGINT NOT NULL)'
+
+
+# Sorting of books: columns of ORDER BY, ID is last for stable order of pages
+BOOKS_ORDER = {
+    'id': ('id', ),
+    'title': ('title', 'id'),
+    'author': ('author', 'id'),
+}
+
+# Modes of adding book, which already exists: raise error, return existing book, update existing book
+ON_DUPLICATE = ('error', 'skip', 'upsert')
+
+# Count of Database.__execute() for INSERT, UPDATE or DELETE, which returns count of changed rows instead of ID
+CHANGED_ROWS = -2
+
+
+async def merge_books(db, book_id: int, duplicate_id: int) -> None:
+    """
+    Merging duplicate into book, genres of duplicate are moved to book
+    Must be called inside unit of work
+    :param db: Database object
+    :param book_id: ID of kept book
+    :param duplicate_id: ID of deleted duplicate
+    :return:
+    """
+    params = {'book_id': book_id}
+    genres = {row[0] for row in await execute_sql(db, 'SELECT genre_id FROM book_genre WHERE book_id = :book_id', params)}
+
+    links = await execute_sql(db, 'SELECT id, genre_id FROM book_genre WHERE book_id = :book_id', {'book_id': duplicate_id})
+    for link_id, genre_id in links:
+        if genre_id in genres:
+            await execute_sql(db, 'DELETE FROM book_genre WHERE id = :id', {'id': link_id})
+        else:
+            await execute_sql(db, 'UPDATE book_genre SET book_id = :book_id WHERE id = :id', {'book_id': book_id,
+                                                                                              'id': link_id})
+            genres.add(genre_id)
+
+    await execute_sql(db, 'DELETE FROM books WHERE id = :id', {'id': duplicate_id})
+
+
+async def dedup_books(db, first_id: int, last_id: int) -> tuple:
+    """
+    Filling content hash of books with first_id < id <= last_id, book is merged into older book with equal hash
+    Lookup of hash needs index on content_hash
+    :param db: Database object
+    :param first_id: Last ID of previous batch
+    :param last_id: Last ID of batch
+    :return: Count of checked and merged books
+    """
+    rows = await execute_sql(db, 'SELECT id, title, author, description FROM books '
+                                 'WHERE id > :first_id AND id <= :last_id AND content_hash IS NULL',
+                             {'first_id': first_id, 'last_id': last_id})
+    merged = 0
+    for _id, title, author, description in rows:
+        content_hash = book_hash(title, author, decompress_text(description))
+        found = await execute_sql(db, 'SELECT id FROM books WHERE content_hash = :hash', {'hash': content_hash})
+        if found:
+            await merge_books(db, found[0][0], _id)
+            merged += 1
+        else:
+            await execute_sql(db, 'UPDATE books SET content_hash = :hash WHERE id = :id', {'hash': content_hash,
+                                                                                           'id': _id})
+
+    return len(rows), merged
+
+
+async def fill_authors(db, first_id: int, last_id: int) -> None:
+    """
+    Linking books with first_id < id <= last_id to authors, authors are created by their names
+    :param db: Database object
+    :param first_id: Last ID of previous batch
+    :param last_id: Last ID of batch
+    :return:
+    """
+    rows = await execute_sql(db, 'SELECT id, author FROM books '
+                                 'WHERE id > :first_id AND id <= :last_id AND author_id IS NULL',
+                             {'first_id': first_id, 'last_id': last_id})
+
+    # Authors of batch, most of books of batch have author from previous rows
+    authors = dict()
+    for _id, author in rows:
+        key = normalize_name(author)
+        if key not in authors:
+            found = await execute_sql(db, 'SELECT id FROM authors WHERE name_key = :key', {'key': key})
+            if not found:
+                await execute_sql(db, 'INSERT INTO authors (name, name_key) VALUES (:name, :key)',
+                                  {'name': author, 'key': key})
+                found = await execute_sql(db, 'SELECT id FROM authors WHERE name_key = :key', {'key': key})
+            authors[key] = found[0][0]
+
+        await execute_sql(db, 'UPDATE books SET author_id = :author_id WHERE id = :id', {'author_id': authors[key],
+                                                                                         'id': _id})
+
+
+async def dedup_book_genres(db) -> None:
+    """
+    Deleting duplicate links of book and genre, first link is kept, counters are recomputed if links are deleted
+    :param db: Database object
+    :return:
+    """
+    # Fix for MySQL, table cannot be selected in subquery of DELETE, but can be selected in derived table
+    duplicates = await execute_sql(db, 'SELECT COUNT(*) FROM book_genre WHERE id NOT IN ('
+                                       'SELECT id FROM (SELECT MIN(id) AS id FROM book_genre '
+                                       'GROUP BY book_id, genre_id) AS kept)')
+    if not duplicates[0][0]:
+        return
+
+    await execute_sql(db, 'DELETE FROM book_genre WHERE id NOT IN ('
+                          'SELECT id FROM (SELECT MIN(id) AS id FROM book_genre GROUP BY book_id, genre_id) AS kept)')
+    await db.stats_recompute()
+
+
+async def compress_descriptions(db, first_id: int, last_id: int, compress: bool = True) -> tuple:
+    """
+    Compressing or decompressing descriptions of books with first_id < id <= last_id
+    :param db: Database object
+    :param first_id: Last ID of previous batch
+    :param last_id: Last ID of batch
+    :param compress: Compressing, else decompressing
+    :return: Count of checked and changed books
+    """
+    rows = await execute_sql(db, 'SELECT id, description FROM books WHERE id > :first_id AND id <= :last_id',
+                             {'first_id': first_id, 'last_id': last_id})
+    changed = 0
+    for _id, stored in rows:
+        if is_compressed(stored) == compress:
+            continue
+
+        value = compress_text(decompress_text(stored)) if compress else decompress_text(stored)
+        if compress and not isinstance(value, bytes):
+            continue
+
+        await execute_sql(db, 'UPDATE books SET description = :description WHERE id = :id', {'description': value,
+                                                                                            'id': _id})
+        changed += 1
+
+    return len(rows), changed
+
+
+async def compress_new_descriptions(db, first_id: int, last_id: int) -> None:
+    """
+    Compressing descriptions by migration, only if compression is enabled
+    :param db: Database object
+    :param first_id: Last ID of previous batch
+    :param last_id: Last ID of batch
+    :return:
+    """
+    if DB_COMPRESS_DESCRIPTIONS:
+        await compress_descriptions(db, first_id, last_id)
+
+
+# Migrations of schema, new migration must be added to the end after changing tables
+MIGRATIONS = (
+    Migration(1, 'initial', [
+        CreateTables([Genres, Books, BookGenre]),
+    ]),
+    Migration(2, 'book genre indexes', [
+        # InnoDB already has indexes for foreign keys
+        CreateIndex('ix_book_genre_book_id', 'book_genre', ['book_id'], backends=(DBType.SQLITE, )),
+        CreateIndex('ix_book_genre_genre_id', 'book_genre', ['genre_id'], backends=(DBType.SQLITE, )),
+    ]),
+    Migration(3, 'book content hash', [
+        AddColumn('books', 'content_hash', 'VARCHAR(64)', 'CHAR(64) NULL'),
+        # Index for finding duplicates while hashes are filled, unique index can be created only without duplicates
+        CreateIndex('ix_books_content_hash', 'books', ['content_hash']),
+        Batched('merge duplicate books', 'books', dedup_books, batch_size=1000),
+        CreateIndex('uq_books_content_hash', 'books', ['content_hash'], unique=True),
+        DropIndex('ix_books_content_hash', 'books'),
+    ]),
+    Migration(4, 'authors', [
+        CreateTables([Authors]),
+        AddColumn('books', 'author_id', 'INTEGER REFERENCES authors (id)', 'INTEGER NULL'),
+        CreateIndex('ix_books_author_id', 'books', ['author_id']),
+        Batched('fill books.author_id', 'books', fill_authors, batch_size=1000),
+    ]),
+    Migration(5, 'counters', [
+        CreateTables([Counters]),
+        Call('count books', lambda db: db.stats_recompute()),
+    ]),
+    Migration(6, 'book sort indexes', [
+        # Fix for MySQL, TEXT columns can be indexed only by prefix, which is not used for ORDER BY
+        CreateIndex('ix_books_title', 'books', ['title COLLATE NOCASE'], backends=(DBType.SQLITE, )),
+        CreateIndex('ix_books_author', 'books', ['author COLLATE NOCASE'], backends=(DBType.SQLITE, )),
+        # Books of genre in order of ID are read from index without sorting
+        CreateIndex('ix_book_genre_genre_id_book_id', 'book_genre', ['genre_id', 'book_id']),
+        # Index of genre_id is prefix of new index
+        DropIndex('ix_book_genre_genre_id', 'book_genre', backends=(DBType.SQLITE, )),
+    ]),
+    Migration(7, 'unique book genre', [
+        Call('delete duplicate book genres', dedup_book_genres),
+        # Links are inserted by conflict-ignoring statements, see book_genre_assign()
+        CreateIndex('uq_book_genre_book_id_genre_id', 'book_genre', ['book_id', 'genre_id'], unique=True),
+        # Index of book_id is prefix of unique index
+        DropIndex('ix_book_genre_book_id', 'book_genre', backends=(DBType.SQLITE, )),
+    ]),
+    Migration(8, 'compressed descriptions', [
+        # Compressed values are not valid text
+        ModifyColumn('books', 'description', 'longblob', 'LONGBLOB NOT NULL'),
+        Batched('compress descriptions', 'books', compress_new_descriptions, batch_size=1000),
+    ]),
+)
+
+# Version of schema
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+# Tables by name, for getting table of query without scanning all subclasses
+TABLES: Dict[str, Type[Base]] = {mapper.class_.__tablename__: mapper.class_ for mapper in Base.registry.mappers}
+
+
+# Retryable errors of SQLite by beginning of message, and of MySQL by error code
+SQLITE_RETRYABLE = {
+    'database is locked': 'busy',
+    'database table is locked': 'locked',
+    'database schema has changed': 'schema_changed',
+}
+MYSQL_RETRYABLE = {
+    1205: 'lock_timeout',
+    1213: 'deadlock',
+    1040: 'too_many_connections',
+    2003: 'connect',
+    2006: 'connection_lost',
+    2013: 'connection_lost',
+}
+# Errors after which statement could be committed, only reads are repeated
+UNSAFE_RETRY = ('connection_lost', )
+
+# Errors of missing table of SQLite by beginning of message, and of MySQL by error code
+SQLITE_NO_TABLE = 'no such table'
+MYSQL_NO_TABLE = 1146
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """
+    Classifying error of database, retryable errors are temporary (lock waits, deadlocks, lost connections)
+    :param exc: Exception, raised by driver or wrapped by SQLAlchemy
+    :return: Reason of retry, or None if error is fatal
+    """
+    # SQLAlchemy keeps error of driver in orig
+    orig = getattr(exc, 'orig', None) or exc
+
+    if isinstance(orig, sqlite3.OperationalError):
+        message = str(orig).lower()
+        for prefix, reason in SQLITE_RETRYABLE.items():
+            if message.startswith(prefix):
+                return reason
+        return None
+
+    code = orig.args[0] if orig.args and isinstance(orig.args[0], int) else None
+    return MYSQL_RETRYABLE.get(code)
+
+
+def is_missing_table(exc: BaseException) -> bool:
+    """
+    Checking if error is caused by missing table, e.g. before first migration
+    :param exc: Exception, raised by driver or wrapped by SQLAlchemy
+    :return: Table does not exist
+    """
+    orig = getattr(exc, 'orig', None) or exc
+
+    if isinstance(orig, sqlite3.OperationalError):
+        return str(orig).lower().startswith(SQLITE_NO_TABLE)
+    return bool(orig.args) and orig.args[0] == MYSQL_NO_TABLE
+
+
+class RetryPolicy:
+    """
+    Count of attempts and delays between them, delay is random (full jitter) and grows exponentially,
+    so contending writers do not retry at the same time
+    """
+    def __init__(self, attempts: int = DB_RETRY_ATTEMPTS, delay: float = DB_RETRY_DELAY,
+                 max_delay: float = DB_RETRY_MAX_DELAY):
         """
-        Starting database
-        :return:
+        :param attempts: Max count of attempts, 1 for no retries
+        :param delay: Max delay before first retry in seconds
+        :param max_delay: Max delay before any retry in seconds
         """
-        if self.db_type == DBType.SQLITE:
-            self.db_url = 'sqlite+aiosqlite:///' + os.path.abspath(f'./{self.db_name}.db')
-            self.engine = create_async_engine(self.db_url)
-            self.session = async_sessionmaker(self.engine, expire_on_commit=False, autoflush=True)
-
-        elif self.db_type == DBType.MYSQL:
-            # For MySQL no need creating engine
-            # Session creating only before executing query
-            pass
+        self.attempts = attempts
+        self.delay = delay
+        self.max_delay = max_delay
 
-    async def __execute(self, query: Union[Select, Insert, Update, Delete], count=0) -> Union[Result, list, dict]:
+    def backoff(self, attempt: int) -> float:
         """
-        Executing query
-        :param query: Query
-        :param count: Count of selecting rows
-        :return: Rows or ID
+        Getting delay before next attempt
+        :param attempt: Number of failed attempt, from 1
+        :return: Delay in seconds
         """
-        if self.db_type == DBType.SQLITE:
-            # Return ID of new row if executing INSERT INTO
-            if not count:
-                query = query.returning(getattr(await self.__get_table_by_name(query), 'id'))
+        return random.uniform(0, min(self.max_delay, self.delay * 2 ** (attempt - 1)))
 
-            await self.__start()
-            async with self.session() as session:
-                session: AsyncSession
-                result: Union[ChunkedIteratorResult, Result, List[dict], dict, None] = await session.execute(query)
-                await session.flush()
 
-                if not count:  # For INSERT INTO
-                    try:
-                        result = result.fetchone()[0]
-                    except:
-                        result = None
-                elif count == 1:  # For SELECT one row
-                    try:
-                        result = result.fetchone()[0].to_dict()
-                    except:
-                        result = dict()
-                elif count == -1:  # For SELECT all rows
-                    try:
-                        result = [item[0].to_dict() for item in result.fetchall()]
-                    except:
-                        result = [dict()]
-                elif count > 1:  # For SELECT many rows
-                    try:
-                        result = [item[0].to_dict() for item in result.fetchmany(count)]
-                    except:
-                        result = [dict()]
+# Metrics of database, measured only if metrics.enabled
+metrics = Registry(DB_METRICS, DB_METRICS_FILE, DB_METRICS_INTERVAL, port=DB_METRICS_PORT)
+QUERY_SECONDS = metrics.histogram('db_query_duration_seconds', 'Latency of queries, count is count of queries',
+                                  ('database', 'operation', 'table'))
+QUERY_ERRORS = metrics.counter('db_query_errors_total', 'Failed queries', ('database', 'operation', 'table'))
+ROWS_RETURNED = metrics.counter('db_rows_returned_total', 'Rows returned by SELECT', ('database', 'table'))
+CACHE_REQUESTS = metrics.counter('db_cache_requests_total', 'Lookups of caches', ('cache', 'result'))
+RETRIES = metrics.counter('db_retries_total', 'Work repeated after errors', ('database', 'reason'))
 
-                # Save changes after INSERT INTO or UPDATE or DELETE
-                await session.commit()
-        elif self.db_type == DBType.MYSQL:
-            while True:
-                # While DataBase is locked engine cannot create
-                try:
-                    self.engine = await create_engine(user=self.db_user, db=self.db_name, host=self.db_host, password=self.db_pass)
-                    await asyncio.sleep(1)
-                    break
-                except Exception as exc:
-                    print(exc)
-                    pass
 
-            async with self.engine.acquire() as conn:
-                async with conn.begin() as transaction:
-                    result_db = await conn.execute(query)
-                    if not count:
-                        # Returning id of new row after INSERT INTO
-                        result_db = await conn.execute('SELECT LAST_INSERT_ID() as id')
-                    # Save changes after INSERT INTO or UPDATE or DELETE
-                    await transaction.commit()
+# Labels of queries, pre-built statements are looked up once
+QUERY_OPERATIONS: WeakKeyDictionary = WeakKeyDictionary()
 
-                    # Transform rows to list of dicts
-                    result = list()
-                    async for row in result_db:
-                        result.append(dict(row))
 
-                    if not count:  # Return id
-                        result = result[0]['id']
-                    elif count == 1:  # Return one row
-                        if not result:
-                            result = None
-                        else:
-                            result = result[0]
+def query_operation(query: Union[Select, Insert, Update, Delete]) -> tuple:
+    """
+    Getting operation and main table of query, for labels of metrics
+    :param query: Query
+    :return: Operation (select, insert, update, delete) and name of table
+    """
+    operation = QUERY_OPERATIONS.get(query)
+    if operation is not None:
+        return operation
 
-        return result
+    if isinstance(query, Select):
+        froms = query.get_final_froms()
+        table = froms[0] if froms else None
+        while isinstance(table, Join):
+            table = table.left
+        operation = 'select', getattr(table, 'name', '')
+    else:
+        operation = type(query).__name__.lower(), query.table.name
+
+    QUERY_OPERATIONS[query] = operation
+    return operation
 
-    async def get_one(self, query: Union[Select]) -> dict:
+
+class WriteQueue:
+    """
+    Write-behind queue, writes are coalesced into group commits
+    """
+    def __init__(self, database: 'Database', delay: float, rows: int, size: int):
         """
-        SELECT one row
-        :param query: Query
-        :return: Row
+        :param database: Database object
+        :param delay: Max time of waiting for next writes before commit, in seconds
+        :param rows: Max count of writes in one commit
+        :param size: Max count of waiting writes, writers wait while queue is full
         """
-        return await self.__execute(query, 1)
+        self.database = database
+        self.delay = delay
+        self.rows = rows
+        self.size = size
 
-    async def get_all(self, query: Union[Select]) -> list:
+        # Queue and writer task are bound to event loop
+        self.loop = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def submit(self, func: Callable[[], Awaitable]) -> asyncio.Future:
         """
-        SELECT all rows
-        :param query: Query
-        :return: Rows
+        Adding unit of work to queue, waits while queue is full
+        :param func: Coroutine function, executed inside group transaction
+        :return: Future with result of function, resolved after commit
         """
-        # Fix for returning all rows, if there are more than 1000
-        if self.db_type == DBType.MYSQL:
-            query = query.limit(18446744073709551610)
-        elif self.db_type == DBType.SQLITE:
-            query = query.limit(9223372036854775807)
-        return await self.__execute(query, -1)
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.queue = asyncio.Queue(self.size)
+            self.task = loop.create_task(self.__run())
+
+        future = loop.create_future()
+        await self.queue.put((func, future))
+        return future
 
-    async def get_many(self, query: Union[Select], count: int = 1) -> list:
+    async def flush(self) -> None:
         """
-        SELECT many rows
-        :param query: Query
-        :param count: Count of rows for selecting
-        :return: Rows
+        Waiting for commit of all queued writes
+        :return:
         """
-        return await self.__execute(query, count)
+        if self.queue is not None and self.loop is asyncio.get_running_loop():
+            await self.queue.join()
 
-    async def exec(self, query: Union[Insert, Update, Delete]) -> Any:
+    async def close(self) -> None:
         """
-        INSERT INTO or UPDATE or DELETE
-        :param query: Query
-        :return: Row ID
+        Committing queued writes and stopping writer task
+        :return:
         """
-        return await self.__execute(query)
+        await self.flush()
+        if self.task is not None:
+            self.task.cancel()
+            if self.loop is asyncio.get_running_loop():
+                try:
+                    await self.task
+                except asyncio.CancelledError:
+                    pass
+        self.loop = None
+        self.queue = None
+        self.task = None
 
-    @staticmethod
-    async def __get_table_by_name(query) -> Type[Base]:
+    async def __run(self) -> None:
         """
-        Getting table object by name
-        :param query: Query
-        :return: Table object
+        Writer, collecting writes for delay or until rows count and committing them
+        :return:
+        """
+        while True:
+            batch = [await self.queue.get()]
+            deadline = self.loop.time() + self.delay
+
+            while len(batch) < self.rows:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self.__commit(batch)
+            except Exception as exc:
+                # Fix for hanging writers, writer task must not die with unresolved futures
+                for func, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def __commit(self, batch: list) -> None:
+        """
+        Executing writes in one transaction
+        If some write fails, transaction is repeated with SAVEPOINT for every write, so failed write does not
+        cancel others
+        :param batch: Writes with futures
+        :return:
+        """
+        try:
+            results = await self.database.retry(lambda: self.__execute_batch(batch, savepoint=False))
+        except Exception:
+            self.database.count_retry('write_queue_savepoints')
+            try:
+                results = await self.__execute_batch(batch, savepoint=True)
+            except Exception as exc:
+                # Commit failed, nothing is saved
+                for func, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+
+        for future, result, exc in results:
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    async def __execute_batch(self, batch: list, savepoint: bool) -> list:
+        """
+        Executing writes in one transaction
+        :param batch: Writes with futures
+        :param savepoint: Create SAVEPOINT for every write and collect errors, else first error cancels transaction
+        :return: Futures with results and errors
+        """
+        results = list()
+        async with self.database.transaction():
+            for func, future in batch:
+                if not savepoint:
+                    results.append((future, await func(), None))
+                    continue
+                try:
+                    async with self.database.transaction():
+                        results.append((future, await func(), None))
+                except Exception as exc:
+                    results.append((future, None, exc))
+        return results
+
+
+class Replicas:
+    """
+    Pool of read replicas with health checks
+    """
+    def __init__(self, databases: Sequence['Database'], selection: str = DB_REPLICA_SELECTION,
+                 check_interval: float = DB_REPLICA_CHECK_INTERVAL):
+        """
+        :param databases: Databases of replicas
+        :param selection: Choosing replica, 'round_robin' or 'least_connections'
+        :param check_interval: Interval of health checks in seconds
+        """
+        self.databases = list(databases)
+        self.selection = selection
+        self.check_interval = check_interval
+
+        self.healthy: Dict[int, bool] = {id(database): True for database in self.databases}
+        self.in_use: Dict[int, int] = {id(database): 0 for database in self.databases}
+
+        self.__next = 0
+        self.__checked_at = 0.0
+
+        # Running health check, task is referenced, so it is not collected by garbage collector while it is running
+        self.__task: Optional[asyncio.Task] = None
+
+    def choose(self) -> Optional['Database']:
+        """
+        Choosing healthy replica, health check is started if it is time
+        :return: Database of replica or None, if there are no healthy replicas
         """
-        for subclass in Base.__subclasses__():
-            if hasattr(subclass, '__tablename__') and subclass.__tablename__ == str(query.table):
-                return subclass
+        if time.monotonic() - self.__checked_at > self.check_interval and (self.__task is None or self.__task.done()):
+            self.__task = asyncio.get_running_loop().create_task(self.check())
 
-    async def __create_tables(self) -> None:
+        healthy = [database for database in self.databases if self.healthy[id(database)]]
+        if not healthy:
+            return None
+
+        if self.selection == 'least_connections':
+            return min(healthy, key=lambda database: self.in_use[id(database)])
+
+        self.__next = (self.__next + 1) % len(healthy)
+        return healthy[self.__next]
+
+    def mark(self, database: 'Database', healthy: bool) -> None:
         """
-        Create tables if not exists
+        Setting health of replica
+        :param database: Database of replica
+        :param healthy: Replica is healthy
         :return:
         """
-        if self.db_type == DBType.SQLITE:
-            async with self.engine.begin() as connection:
-                await connection.run_sync(Base.metadata.create_all)
-        elif self.db_type == DBType.MYSQL:  # Fix for mysql, because SQLAlchemy cannot create table by metadata
-            for subclass in Base.__subclasses__():
-                if hasattr(subclass, '__tablename__'):
-                    try:
-                        logging.info('Initializing table {}'.format(subclass.__tablename__))
-                        await self.__execute(subclass.mysql(), 0)  # noqa
-                    except Exception as exc:
-                        print(traceback.format_exception(exc))
-                        print(subclass.mysql())
-                        raise exc
+        if self.healthy[id(database)] != healthy:
+            logging.warning('Replica {} is {}'.format(database.db_host if database.db_type == DBType.MYSQL else
+                                                      database.db_name, 'healthy' if healthy else 'unhealthy'))
+        self.healthy[id(database)] = healthy
 
-    async def __insert_data(self) -> None:
+    async def check(self) -> None:
         """
-        Inserting default data
+        Checking all replicas
+        :return:
+        """
+        try:
+            for database in self.databases:
+                try:
+                    await execute_sql(database, 'SELECT 1')
+                    self.mark(database, True)
+                except Exception:
+                    self.mark(database, False)
+        finally:
+            self.__checked_at = time.monotonic()
+
+    async def close(self) -> None:
+        """
+        Stopping running health check
         :return:
         """
+        task, self.__task = self.__task, None
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+class Database:
+    """
+    Main database class
+    """
+    def __init__(self, db_name: str = None, db_host: str = None, replicas: Sequence[str] = None,
+                 memory: bool = None, snapshot: bool = None):
+        """
+        :param db_name: Name of database file (SQLite) or schema (MySQL), from settings by default
+        :param db_host: Host of database (MySQL), from settings by default
+        :param replicas: Hosts (MySQL) or names of database copies (SQLite) for reads
+        :param memory: Keep SQLite database in memory, from settings by default
+        :param snapshot: Load in-memory database from its file and save it back, from settings by default
+        """
+        # Setting up main parameters
+        self.db_url = None
+
+        self.db_type: DBType = DB_TYPE
+
+        self.db_name: str = db_name or DB_NAME
+        self.db_user: str = DB_USER
+        self.db_host: str = db_host or DB_HOST
+        self.db_pass: str = DB_PASS
+
+        # In-memory SQLite database, see flush_memory()
+        self.memory: bool = (DB_MEMORY if memory is None else memory) and self.db_type == DBType.SQLITE
+        self.memory_snapshot: bool = DB_MEMORY_SNAPSHOT if snapshot is None else snapshot
+        self.memory_flush_interval: float = DB_MEMORY_FLUSH_INTERVAL
+
+        # Name of database in labels of metrics, replicas of MySQL have the same schema name
+        self.metrics_name: str = self.db_name if self.db_type == DBType.SQLITE else \
+            '{}/{}'.format(self.db_host, self.db_name)
+
+        # Read replicas, reads of session after its write go to primary for read_your_writes seconds
+        self.replicas: Optional[Replicas] = None
+        self.read_your_writes: float = DB_READ_YOUR_WRITES
+        if replicas:
+            self.set_replicas([Database(db_host=replica) if self.db_type == DBType.MYSQL else Database(db_name=replica)
+                               for replica in replicas])
+
+        # Time of last write, for session (see begin_session) or for all callers without session
+        self.__session: ContextVar = ContextVar('session', default=None)
+        self.__last_write = [0.0]
+
+        # Retries after temporary errors, see retry()
+        self.retry_policy = RetryPolicy()
+        self.retries: Dict[str, int] = dict()
+
+        # Count of concurrent queries for gather()
+        self.parallelism: int = DB_PARALLELISM.get(self.db_type, 1)
+
+        # Declaring variables for SQLAlchemy
+        self.engine = None
+        self.session = None
+
+        # Sessions of writes (SQLite), they begin with BEGIN IMMEDIATE, see __sqlite_begin()
+        self.write_session = None
+
+        # Event loop of engine, engine is created once for every loop
+        self.__loop = None
+
+        # Count of units of work, queries and streams using engine, only idle databases are closed
+        self.in_use = 0
+        self.initialized = False
+
+        # Pre-built statements, see __statement()
+        self.__statements: Dict[tuple, Any] = dict()
+
+        # The only connection of in-memory database is used by one unit of work at once, see __exclusive()
+        self.__memory_lock: Optional[asyncio.Lock] = None
+        self.__flush_task: Optional[asyncio.Task] = None
+
+        # Writers of SQLite file wait for each other in event loop, busy timeout is left for other processes
+        self.__write_lock: Optional[asyncio.Lock] = None
+
+        # Checked out connections of SQLite, counted only with metrics, see pool_connections()
+        self.__connections = 0
+
+        # Session (SQLite) or connection (MySQL) of current unit of work, see transaction()
+        self.__transaction: ContextVar = ContextVar('transaction', default=None)
+
+        # Write-behind queue, see enable_write_queue()
+        self.write_queue: Optional[WriteQueue] = None
+        if DB_WRITE_QUEUE:
+            self.enable_write_queue()
+
+    def enable_write_queue(self, delay: float = DB_WRITE_QUEUE_DELAY, rows: int = DB_WRITE_QUEUE_ROWS,
+                           size: int = DB_WRITE_QUEUE_SIZE) -> None:
+        """
+        Enable write-behind queue, writes outside transaction() are saved by group commits
+        :param delay: Max time of waiting for next writes before commit, in seconds
+        :param rows: Max count of writes in one commit
+        :param size: Max count of waiting writes
+        :return:
+        """
+        self.write_queue = WriteQueue(self, delay, rows, size)
+
+    async def disable_write_queue(self) -> None:
+        """
+        Disable write-behind queue after commit of queued writes
+        :return:
+        """
+        if self.write_queue is not None:
+            await self.write_queue.close()
+            self.write_queue = None
+
+    def set_replicas(self, databases: Sequence['Database'], selection: str = DB_REPLICA_SELECTION) -> None:
+        """
+        Setting read replicas
+        :param databases: Databases of replicas, empty for disabling replicas
+        :param selection: Choosing replica, 'round_robin' or 'least_connections'
+        :return:
+        """
+        self.replicas = Replicas(databases, selection) if databases else None
+
+    def begin_session(self) -> None:
+        """
+        Starting session in current context, reads after write of session are routed to primary,
+        so session reads its writes even if replicas are behind
+        :return:
+        """
+        self.__session.set([0.0])
+
+    def __last_write_of_session(self) -> list:
+        """
+        Getting time of last write for current session
+        :return: List with time by time.monotonic
+        """
+        return self.__session.get() or self.__last_write
+
+    async def __execute_replica(self, query: Union[Select], count: int, params: dict = None) -> Any:
+        """
+        Executing SELECT on replica, primary is used if there are no healthy replicas or replica fails
+        :param query: Query
+        :param count: Count of selecting rows
+        :param params: Values of bound parameters
+        :return: Rows
+        """
+        replica = self.replicas.choose()
+        if replica is None:
+            return await self.__execute(query, count, params, primary=True)
+
+        self.replicas.in_use[id(replica)] += 1
+        try:
+            return await replica.__execute(query, count, params)
+        except Exception as exc:
+            logging.warning('Query on replica failed: {}'.format(exc))
+            self.replicas.mark(replica, False)
+            self.count_retry('replica_to_primary')
+            return await self.__execute(query, count, params, primary=True)
+        finally:
+            self.replicas.in_use[id(replica)] -= 1
+
+    async def write(self, query: Union[Insert, Update, Delete], params: dict = None) -> asyncio.Future:
+        """
+        INSERT INTO or UPDATE or DELETE through write queue, without waiting for commit
+        :param query: Query
+        :param params: Values of bound parameters
+        :return: Future with row ID, resolved after commit
+        """
+        if self.write_queue is None:
+            raise RuntimeError('Write queue is not enabled')
+        return await self.write_queue.submit(lambda: self.__execute(query, 0, params))
+
+    async def run_in_transaction(self, func: Callable[[], Awaitable]) -> Any:
+        """
+        Running function as unit of work, with write queue it is saved by group commit
+        :param func: Coroutine function
+        :return: Result of function
+        """
+        if self.__transaction.get() is not None:
+            async with self.transaction():
+                return await func()
+
+        if self.write_queue is not None:
+            return await (await self.write_queue.submit(func))
+
+        # Whole unit of work is replayed after rollback
+        async def attempt() -> Any:
+            async with self.transaction():
+                return await func()
+
+        return await self.retry(attempt)
+
+    async def retry(self, func: Callable[[], Awaitable], idempotent: bool = False) -> Any:
+        """
+        Running function again after retryable error, see classify_error() and retry_policy
+        Function must be replayable, e.g. whole unit of work, which is rolled back after error
+        :param func: Coroutine function
+        :param idempotent: Function can run twice (e.g. reads), it is repeated even if commit could be done
+        :return: Result of function
+        """
+        attempt = 0
+        while True:
+            try:
+                return await func()
+            except Exception as exc:
+                attempt += 1
+                reason = classify_error(exc)
+                if reason is None or attempt >= self.retry_policy.attempts or \
+                        (reason in UNSAFE_RETRY and not idempotent):
+                    raise
+
+                self.count_retry(reason)
+                await asyncio.sleep(self.retry_policy.backoff(attempt))
+
+    def count_retry(self, reason: str) -> None:
+        """
+        Counting retry
+        :param reason: Reason of retry
+        :return:
+        """
+        self.retries[reason] = self.retries.get(reason, 0) + 1
+        if metrics.enabled:
+            RETRIES.inc((self.metrics_name, reason))
+
+    async def __unit_of_work(self, func: Callable[[], Awaitable]) -> Any:
+        """
+        Running function in current unit of work, or in new one if there is no current
+        :param func: Coroutine function
+        :return: Result of function
+        """
+        if self.__transaction.get() is not None:
+            return await func()
+        return await self.run_in_transaction(func)
+
+    async def __start(self) -> None:
+        """
+        Starting database
+        :return:
+        """
+        # Engine and its pool are bound to event loop
+        loop = asyncio.get_running_loop()
+        if self.engine is not None and self.__loop is loop:
+            return
+
+        # Fix for leaked connections, engine of previous event loop is disposed before new one is created
+        if self.engine is not None:
+            await self.__dispose_stale()
+        self.__loop = loop
+
+        if metrics.enabled:
+            metrics.start()
+
+        if self.db_type == DBType.SQLITE and self.memory:
+            # All sessions share one connection, otherwise every connection has its own empty database
+            self.db_url = 'sqlite+aiosqlite://'
+            self.engine = create_async_engine(self.db_url, poolclass=StaticPool)
+            self.session = async_sessionmaker(self.engine, expire_on_commit=False, autoflush=True)
+            self.write_session = async_sessionmaker(self.engine.execution_options(sqlite_begin='BEGIN IMMEDIATE'),
+                                                    expire_on_commit=False, autoflush=True)
+            event.listen(self.engine.sync_engine, 'connect', self.__sqlite_connect)
+            event.listen(self.engine.sync_engine, 'begin', self.__sqlite_begin)
+
+            # Queries wait until snapshot is loaded
+            self.__memory_lock = asyncio.Lock()
+            async with self.__memory_lock:
+                if self.memory_snapshot and os.path.exists(self.db_file):
+                    async with self.engine.connect() as conn:
+                        await load_snapshot((await conn.get_raw_connection()).driver_connection, self.db_file)
+                    logging.info('Database {} is loaded into memory'.format(self.db_name))
+
+            if self.memory_snapshot and self.memory_flush_interval:
+                self.__flush_task = loop.create_task(self.__flush_periodically())
+
+        elif self.db_type == DBType.SQLITE:
+            self.db_url = 'sqlite+aiosqlite:///' + self.db_file
+            self.engine = create_async_engine(self.db_url)
+            self.session = async_sessionmaker(self.engine, expire_on_commit=False, autoflush=True)
+            self.write_session = async_sessionmaker(self.engine.execution_options(sqlite_begin='BEGIN IMMEDIATE'),
+                                                    expire_on_commit=False, autoflush=True)
+
+            # Fix for SAVEPOINT, driver must not begin transactions by itself
+            event.listen(self.engine.sync_engine, 'connect', self.__sqlite_connect)
+            event.listen(self.engine.sync_engine, 'begin', self.__sqlite_begin)
+            self.__write_lock = asyncio.Lock()
+
+            # Pool of SQLite does not keep connections, so checked out connections are counted by events
+            if metrics.enabled:
+                self.__connections = 0
+                event.listen(self.engine.sync_engine, 'checkout', self.__sqlite_checkout)
+                event.listen(self.engine.sync_engine, 'checkin', self.__sqlite_checkin)
+
+        elif self.db_type == DBType.MYSQL:
+            # Driver is imported only if it is used
+            from aiomysql.sa import create_engine
+
+            # While DataBase is locked engine cannot create, fatal errors (e.g. access denied) are raised
+            self.engine = await self.retry(lambda: create_engine(user=self.db_user, db=self.db_name, host=self.db_host,
+                                                                 password=self.db_pass))
+            await asyncio.sleep(1)
+
+    def __sqlite_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        """
+        Counting checked out connection
+        :param dbapi_connection: Driver connection
+        :param connection_record: Pool record
+        :param connection_proxy: Connection of pool
+        :return:
+        """
+        self.__connections += 1
+
+    def __sqlite_checkin(self, dbapi_connection, connection_record) -> None:
+        """
+        Counting returned connection
+        :param dbapi_connection: Driver connection
+        :param connection_record: Pool record
+        :return:
+        """
+        self.__connections -= 1
+
+    def pool_connections(self) -> tuple:
+        """
+        Getting connections of pool
+        :return: Count of connections in use and idle connections
+        """
+        if self.engine is None:
+            return 0, 0
+        if self.db_type == DBType.SQLITE:
+            pool = self.engine.sync_engine.pool
+            return self.__connections, pool.checkedin() if hasattr(pool, 'checkedin') else 0
+        elif self.db_type == DBType.MYSQL:
+            return self.engine.size - self.engine.freesize, self.engine.freesize
+
+    async def __dispose_stale(self) -> None:
+        """
+        Disposing engine created in previous event loop
+        :return:
+        """
+        engine, self.engine = self.engine, None
+        if self.__flush_task is not None:
+            self.__flush_task.cancel()
+            self.__flush_task = None
+
+        # Connections of SQLite are closed by threads of driver, MySQL connections are bound to their loop
+        try:
+            if self.db_type == DBType.SQLITE:
+                await engine.dispose()
+            elif self.db_type == DBType.MYSQL:
+                engine.terminate()
+        except RuntimeError:
+            logging.warning('Engine of database {} is not disposed, its event loop is closed'.format(self.db_name))
+
+    @asynccontextmanager
+    async def __use(self) -> AsyncIterator[None]:
+        """
+        Starting database and counting its use, see Libraries.close_idle()
+        :return:
+        """
+        self.in_use += 1
+        try:
+            await self.__start()
+            yield
+        finally:
+            self.in_use -= 1
+
+    @asynccontextmanager
+    async def __exclusive(self, write: bool = False) -> AsyncIterator[None]:
+        """
+        Using the only connection of in-memory database, or write lock of SQLite file for writes
+        Other databases are not locked
+        :param write: Unit of work or statement writes
+        :return:
+        """
+        lock = self.__memory_lock or (self.__write_lock if write else None)
+        if lock is None:
+            yield
+            return
+        async with lock:
+            yield
+
+    async def flush_memory(self) -> None:
+        """
+        Saving in-memory database to its file
+        :return:
+        """
+        if not self.memory or not self.memory_snapshot or self.engine is None:
+            return
+
+        # Queued writes are saved before snapshot
+        if self.write_queue is not None:
+            await self.write_queue.flush()
+
+        async with self.__exclusive():
+            async with self.engine.connect() as conn:
+                await save_snapshot((await conn.get_raw_connection()).driver_connection, self.db_file)
+
+    async def __flush_periodically(self) -> None:
+        """
+        Saving in-memory database every flush interval
+        :return:
+        """
+        while True:
+            await asyncio.sleep(self.memory_flush_interval)
+            try:
+                await self.flush_memory()
+            except Exception as exc:
+                logging.warning('In-memory database {} is not saved: {}'.format(self.db_name, exc))
+
+    @property
+    def db_file(self) -> str:
+        """
+        Path of SQLite database file
+        :return: Path
+        """
+        return os.path.abspath(f'./{self.db_name}.db')
+
+    async def backup(self, path: str, pages: int = 100, pause: float = 0.005, compress: bool = False,
+                     progress: Callable[[int, int], None] = None) -> dict:
+        """
+        Online backup of SQLite database by pages, queries are not blocked while backup is running
+        :param path: Path of backup
+        :param pages: Count of pages copied in one step
+        :param pause: Sleep between steps in seconds
+        :param compress: Compress backup by gzip
+        :param progress: Function for progress reporting, called from thread of backup
+        :return: Metrics of backup
+        """
+        if self.db_type != DBType.SQLITE:
+            raise NotImplementedError('Online backup is supported only for SQLite')
+
+        # Queued writes are saved before backup
+        if self.write_queue is not None:
+            await self.write_queue.flush()
+
+        # Backup is copied from file of in-memory database
+        if self.memory:
+            await self.flush_memory()
+
+        return await asyncio.to_thread(backup_file, self.db_file, path, pages, pause, compress, progress)
+
+    async def restore(self, path: str, pages: int = 100, pause: float = 0.005,
+                      progress: Callable[[int, int], None] = None) -> dict:
+        """
+        Restoring SQLite database from backup, compressed or not
+        :param path: Path of backup
+        :param pages: Count of pages copied in one step
+        :param pause: Sleep between steps in seconds
+        :param progress: Function for progress reporting, called from thread of restore
+        :return: Metrics of restore
+        """
+        if self.db_type != DBType.SQLITE:
+            raise NotImplementedError('Restore is supported only for SQLite')
+
+        if self.write_queue is not None:
+            await self.write_queue.flush()
+
+        metrics = await asyncio.to_thread(restore_file, path, self.db_file, pages, pause, progress)
+
+        # In-memory database is loaded again from restored file by next query
+        if self.memory:
+            await self.close(flush=False)
+
+        # Schema of backup can be older, it is checked by next initialize()
+        self.initialized = False
+        return metrics
+
+    async def snapshot(self, path: str) -> dict:
+        """
+        Writing read-only snapshot of catalog, see snapshot.py
+        :param path: Path of snapshot
+        :return: Count of books, genres and size of file
+        """
+        # Rows are read in one transaction, so snapshot is consistent
+        async with self.transaction(savepoint=False, write=False):
+            books = await execute_sql(self, 'SELECT id, title, author FROM books ORDER BY id')
+            genres = await execute_sql(self, 'SELECT id, name FROM genres ORDER BY id')
+            links = await execute_sql(self, 'SELECT book_id, genre_id FROM book_genre ORDER BY book_id, genre_id')
+
+        return await asyncio.to_thread(write_snapshot, path, books, genres, links)
+
+    async def close(self, flush: bool = True) -> None:
+        """
+        Closing engine and its connections, engine is created again by next query
+        :param flush: Save in-memory database to its file
+        :return:
+        """
+        if self.write_queue is not None:
+            await self.write_queue.close()
+        if self.replicas is not None:
+            await self.replicas.close()
+
+        if self.__flush_task is not None:
+            self.__flush_task.cancel()
+            self.__flush_task = None
+        if flush and self.engine is not None and self.__loop is asyncio.get_running_loop():
+            await self.flush_memory()
+
+        engine, self.engine = self.engine, None
+        self.__memory_lock = None
+        self.__write_lock = None
+
+        # Engine of other event loop cannot be closed from this loop
+        if engine is None or self.__loop is not asyncio.get_running_loop():
+            return
+
+        if self.db_type == DBType.SQLITE:
+            await engine.dispose()
+        elif self.db_type == DBType.MYSQL:
+            engine.close()
+            await engine.wait_closed()
+
+    @staticmethod
+    def __sqlite_connect(dbapi_connection, connection_record) -> None:
+        """
+        Disable transactions handling of driver, and wait for lock of other connection instead of failing at once
+        :param dbapi_connection: Driver connection
+        :param connection_record: Pool record
+        :return:
+        """
+        dbapi_connection.isolation_level = None
+
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA busy_timeout = {}'.format(int(DB_BUSY_TIMEOUT * 1000)))
+        cursor.close()
+
+    @staticmethod
+    def __sqlite_begin(connection) -> None:
+        """
+        Emit BEGIN by ourselves
+        Fix for deadlock of SQLite: two transactions, which read and then write, wait for each other to release
+        SHARED lock, and busy timeout does not help them. BEGIN IMMEDIATE of writes takes RESERVED lock at once,
+        so writers wait in busy handler one after another
+        :param connection: Connection
+        :return:
+        """
+        connection.exec_driver_sql(connection.get_execution_options().get('sqlite_begin', 'BEGIN'))
+
+    @asynccontextmanager
+    async def transaction(self, savepoint: bool = True, write: bool = True) -> AsyncIterator[Any]:
+        """
+        Unit of work, all queries inside are executed on one connection and saved by one commit
+        Nested call creates SAVEPOINT, or joins outer transaction if savepoint is False
+        :param savepoint: Create SAVEPOINT for nested call
+        :param write: Unit of work writes, SQLite takes write lock at its beginning (ignored by nested call)
+        :return: Session or connection
+        """
+        current = self.__transaction.get()
+
+        # Nested unit of work
+        if current is not None:
+            if not savepoint:
+                yield current
+            elif self.db_type == DBType.SQLITE:
+                async with current.begin_nested():
+                    yield current
+            elif self.db_type == DBType.MYSQL:
+                async with current.begin_nested():
+                    yield current
+            return
+
+        async with self.__use():
+            if self.db_type == DBType.SQLITE:
+                async with self.__exclusive(write), (self.write_session if write else self.session)() as session:
+                    session: AsyncSession
+                    async with session.begin():
+                        token = self.__transaction.set(session)
+                        try:
+                            yield session
+                        finally:
+                            self.__transaction.reset(token)
+            elif self.db_type == DBType.MYSQL:
+                async with self.engine.acquire() as conn:
+                    async with conn.begin():
+                        token = self.__transaction.set(conn)
+                        try:
+                            yield conn
+                        finally:
+                            self.__transaction.reset(token)
+
+    async def __execute(self, query: Union[Select, Insert, Update, Delete], count=0, params: dict = None,
+                        primary: bool = False) -> Union[Result, list, dict]:
+        """
+        Executing query
+        :param query: Query
+        :param count: Count of selecting rows, 0 for ID of new row, CHANGED_ROWS for count of changed rows
+        :param params: Values of bound parameters
+        :param primary: Do not route SELECT to replicas
+        :return: Rows, ID or count of changed rows
+        """
+        # Session or connection of unit of work, changes are saved by transaction()
+        current = self.__transaction.get()
+        write = count in (0, CHANGED_ROWS)
+
+        if write:
+            self.__last_write_of_session()[0] = time.monotonic()
+        elif not primary and current is None and self.replicas is not None and \
+                time.monotonic() - self.__last_write_of_session()[0] > self.read_your_writes:
+            # SELECT outside unit of work goes to replica, if session has not written recently
+            return await self.__execute_replica(query, count, params)
+
+        # Write outside unit of work is saved by group commit of write queue
+        if write and current is None and self.write_queue is not None:
+            return await (await self.write_queue.submit(lambda: self.__execute(query, count, params)))
+
+        # Single statement is rolled back after error, reads can be repeated even after lost connection
+        if current is None:
+            return await self.retry(lambda: self.__measured(query, count, params, None), idempotent=not write)
+        return await self.__measured(query, count, params, current)
+
+    async def __measured(self, query: Union[Select, Insert, Update, Delete], count: int, params: dict,
+                         current: Any) -> Union[Result, list, dict]:
+        """
+        Executing query, with metrics if they are enabled
+        :param query: Query
+        :param count: Count of selecting rows
+        :param params: Values of bound parameters
+        :param current: Session or connection of unit of work, or None
+        :return: Rows or ID
+        """
+        if not metrics.enabled:
+            return await self.__query(query, count, params, current)
+
+        operation, table = query_operation(query)
+        started = time.perf_counter()
+        try:
+            result = await self.__query(query, count, params, current)
+        except Exception:
+            QUERY_ERRORS.inc((self.metrics_name, operation, table))
+            raise
+        finally:
+            QUERY_SECONDS.observe((self.metrics_name, operation, table), time.perf_counter() - started)
+
+        if count and count != CHANGED_ROWS:
+            ROWS_RETURNED.inc((self.metrics_name, table), len(result) if isinstance(result, list) else int(bool(result)))
+        return result
+
+    async def __query(self, query: Union[Select, Insert, Update, Delete], count: int, params: dict,
+                      current: Any) -> Union[Result, list, dict]:
+        """
+        Executing query on connection of unit of work, or on new connection
+        :param query: Query
+        :param count: Count of selecting rows
+        :param params: Values of bound parameters
+        :param current: Session or connection of unit of work, or None
+        :return: Rows or ID
+        """
+        if self.db_type == DBType.SQLITE:
+            # Return ID of new row if executing INSERT INTO
+            # Pre-built statements already have RETURNING
+            if not count and not query._returning:
+                query = query.returning(self.__get_table_by_name(query).id)
+
+            if current is not None:
+                return self.__fetch_sqlite(await current.execute(query, params), count)
+
+            write = count in (0, CHANGED_ROWS)
+            async with self.__use(), self.__exclusive(write), \
+                    (self.write_session if write else self.session)() as session:
+                session: AsyncSession
+                result = self.__fetch_sqlite(await session.execute(query, params), count)
+                await session.flush()
+
+                # Save changes after INSERT INTO or UPDATE or DELETE
+                await session.commit()
+        elif self.db_type == DBType.MYSQL:
+            if current is not None:
+                return await self.__fetch_mysql(current, await current.execute(query, params or {}), count)
+
+            async with self.__use(), self.engine.acquire() as conn:
+                async with conn.begin() as transaction:
+                    result_db = await conn.execute(query, params or {})
+                    result = await self.__fetch_mysql(conn, result_db, count)
+                    # Save changes after INSERT INTO or UPDATE or DELETE
+                    await transaction.commit()
+
+        return result
+
+    @staticmethod
+    def __fetch_sqlite(result: Union[ChunkedIteratorResult, Result], count: int) -> Union[list, dict, int, None]:
+        """
+        Fetching rows of executed query (SQLite)
+        :param result: Result of query
+        :param count: Count of selecting rows
+        :return: Rows or ID
+        """
+        # Errors of database are raised, only missing rows are returned as empty values
+        if not count:  # For INSERT INTO, None if no row is changed
+            try:
+                row = result.fetchone()
+            except ResourceClosedError:  # Statement without RETURNING
+                row = None
+            result = row[0] if row is not None else None
+        elif count == CHANGED_ROWS:  # For INSERT, UPDATE or DELETE without RETURNING
+            result = result.rowcount
+        elif count == 1:  # For SELECT one row
+            row = result.fetchone()
+            result = Database.__row_to_dict(row) if row is not None else dict()
+        elif count == -1:  # For SELECT all rows
+            result = [Database.__row_to_dict(item) for item in result.fetchall()]
+        elif count > 1:  # For SELECT many rows
+            result = [Database.__row_to_dict(item) for item in result.fetchmany(count)]
+
+        return result
+
+    @staticmethod
+    def __row_to_dict(row) -> dict:
+        """
+        Transform row to dict, row is table object or columns (e.g. with aggregates)
+        :param row: Row of result
+        :return: Row as dict
+        """
+        if len(row) == 1 and isinstance(row[0], Base):
+            return row[0].to_dict()
+        return dict(row._mapping)
+
+    @staticmethod
+    async def __fetch_mysql(conn, result_db, count: int) -> Union[list, dict, int, None]:
+        """
+        Fetching rows of executed query (MySQL)
+        :param conn: Connection
+        :param result_db: Result of query
+        :param count: Count of selecting rows
+        :return: Rows or ID
+        """
+        if count == CHANGED_ROWS:
+            return result_db.rowcount
+
+        if not count:
+            # Returning id of new row after INSERT INTO
+            result_db = await conn.execute('SELECT LAST_INSERT_ID() as id')
+
+        # Transform rows to list of dicts
+        result = list()
+        async for row in result_db:
+            result.append(dict(row))
+
+        if not count:  # Return id
+            result = result[0]['id']
+        elif count == 1:  # Return one row
+            if not result:
+                result = None
+            else:
+                result = result[0]
+
+        return result
+
+    async def get_one(self, query: Union[Select], params: dict = None) -> dict:
+        """
+        SELECT one row
+        :param query: Query
+        :param params: Values of bound parameters
+        :return: Row
+        """
+        return await self.__execute(query, 1, params)
+
+    async def get_all(self, query: Union[Select], params: dict = None) -> list:
+        """
+        SELECT all rows
+        :param query: Query
+        :param params: Values of bound parameters
+        :return: Rows
+        """
+        return await self.__execute(self.__limit_all(query), -1, params)
+
+    async def get_many(self, query: Union[Select], count: int = 1, params: dict = None) -> list:
+        """
+        SELECT many rows
+        :param query: Query
+        :param count: Count of rows for selecting
+        :param params: Values of bound parameters
+        :return: Rows
+        """
+        return await self.__execute(query, count, params)
+
+    async def exec(self, query: Union[Insert, Update, Delete], params: dict = None) -> Any:
+        """
+        INSERT INTO or UPDATE or DELETE
+        :param query: Query
+        :param params: Values of bound parameters
+        :return: Row ID
+        """
+        return await self.__execute(query, 0, params)
+
+    async def stream(self, query: Union[Select], params: dict = None, size: int = 500) -> AsyncIterator[list]:
+        """
+        SELECT rows in chunks, connection is held until all chunks are read
+        :param query: Query
+        :param params: Values of bound parameters
+        :param size: Count of rows in chunk
+        :return: Chunks of rows
+        """
+        if not metrics.enabled:
+            async for rows in self.__stream(query, params, size):
+                yield rows
+            return
+
+        # Latency is time of first chunk, next chunks wait for reader
+        _, table = query_operation(query)
+        labels = (self.metrics_name, 'select', table)
+        started = time.perf_counter()
+        first = True
+        try:
+            async for rows in self.__stream(query, params, size):
+                if first:
+                    QUERY_SECONDS.observe(labels, time.perf_counter() - started)
+                    first = False
+                ROWS_RETURNED.inc((self.metrics_name, table), len(rows))
+                yield rows
+        except Exception:
+            QUERY_ERRORS.inc(labels)
+            raise
+        if first:
+            QUERY_SECONDS.observe(labels, time.perf_counter() - started)
+
+    async def __stream(self, query: Union[Select], params: dict, size: int) -> AsyncIterator[list]:
+        """
+        SELECT rows in chunks
+        :param query: Query
+        :param params: Values of bound parameters
+        :param size: Count of rows in chunk
+        :return: Chunks of rows
+        """
+        current = self.__transaction.get()
+
+        if self.db_type == DBType.SQLITE:
+            if current is not None:
+                result = await current.stream(query, params)
+                async for partition in result.partitions(size):
+                    yield [self.__row_to_dict(row) for row in partition]
+                return
+
+            # Rows of in-memory database are read at once, so reader does not hold the only connection
+            if self.memory:
+                async with self.__use(), self.__exclusive(), self.session() as session:
+                    session: AsyncSession
+                    rows = [self.__row_to_dict(row) for row in (await session.execute(query, params)).fetchall()]
+                for index in range(0, len(rows), size):
+                    yield rows[index:index + size]
+                return
+
+            async with self.__use(), self.session() as session:
+                session: AsyncSession
+                result = await session.stream(query, params)
+                async for partition in result.partitions(size):
+                    yield [self.__row_to_dict(row) for row in partition]
+        elif self.db_type == DBType.MYSQL:
+            if current is not None:
+                result = await current.execute(query, params or {})
+                while rows := await result.fetchmany(size):
+                    yield [dict(row) for row in rows]
+                return
+
+            async with self.__use(), self.engine.acquire() as conn:
+                result = await conn.execute(query, params or {})
+                while rows := await result.fetchmany(size):
+                    yield [dict(row) for row in rows]
+
+    async def gather(self, *coros: Awaitable, limit: int = None) -> list:
+        """
+        Executing independent queries concurrently, but not more than limit at once
+        :param coros: Coroutines
+        :param limit: Count of concurrent queries, parallelism of database by default
+        :return: Results in order of coroutines
+        """
+        # Connection of unit of work cannot execute queries concurrently
+        if self.__transaction.get() is not None:
+            limit = 1
+
+        semaphore = asyncio.Semaphore(limit or self.parallelism)
+
+        async def bounded(coro: Awaitable) -> Any:
+            async with semaphore:
+                return await coro
+
+        return list(await asyncio.gather(*(bounded(coro) for coro in coros)))
+
+    async def get_many_by_ids(self, table: Type[Base], ids: Sequence[int]) -> list:
+        """
+        SELECT rows by IDs concurrently
+        :param table: Table object
+        :param ids: Row IDs
+        :return: Rows in order of IDs
+        """
+        query = self.__statement((table.__tablename__, 'id'), lambda: select(table).where(table.id == bindparam('id')), 1)
+
+        return await self.gather(*(self.__execute(query, 1, {'id': _id}) for _id in ids))
+
+    def __limit_all(self, query: Select) -> Select:
+        """
+        Fix for returning all rows, if there are more than 1000
+        :param query: Query
+        :return: Query with limit
+        """
+        if self.db_type == DBType.MYSQL:
+            query = query.limit(18446744073709551610)
+        elif self.db_type == DBType.SQLITE:
+            query = query.limit(9223372036854775807)
+        return query
+
+    def __statement(self, key: tuple, build: Callable[[], Any], count: int = 0) -> Any:
+        """
+        Getting pre-built statement, it is built only at first call
+        Values are passed by bound parameters, so cache key of statement is stable
+        :param key: Shape of statement
+        :param build: Function for building statement
+        :param count: Count of selecting rows, like in __execute
+        :return: Statement
+        """
+        statement = self.__statements.get(key)
+        if metrics.enabled:
+            CACHE_REQUESTS.inc(('statements', 'miss' if statement is None else 'hit'))
+        if statement is None:
+            statement = build()
+            if count == -1:
+                statement = self.__limit_all(statement)
+            elif not count and self.db_type == DBType.SQLITE:
+                statement = statement.returning(self.__get_table_by_name(statement).id)
+            self.__statements[key] = statement
+        return statement
+
+    @staticmethod
+    def __get_table_by_name(query) -> Type[Base]:
+        """
+        Getting table object by name
+        :param query: Query
+        :return: Table object
+        """
+        return TABLES.get(str(query.table))
+
+    async def __insert_data(self) -> None:
+        """
+        Inserting default data
+        :return:
+        """
+
+        """
+        Example:
+                
+        data = (
+            (func.now(), 1, 'text'),  # func.now - if need insert datetime.now()
+            (func.now(), 2, 'blah'),
+        )
+        
+        data_statement = (insert(Table).values(dt=dt, value=value, key=key).prefix_with('OR IGNORE') for dt, value, key in data)
+
+        for statement in (statement_data,):
+            for row in statement:
+                # Inserting row from statement
+                await session.execute(row)
+
+        # Save changes
+        await session.commit()
+        """
+        pass
+
+    async def initialize(self) -> None:
+        """
+        Initializing database
+        :return:
+        """
+        logging.info('Initializing database')
+
+        await self.__start()
+
+        # Schema is up to date, nothing to create
+        if await self.schema_version() == SCHEMA_VERSION:
+            self.initialized = True
+            logging.info('Database schema is up to date')
+            return
+
+        await self.migrate()
+        await self.__insert_data()
+        self.initialized = True
+
+        logging.info('Database initialized')
+
+    async def schema_version(self) -> int:
+        """
+        Getting version of database schema
+        :return: Version, 0 if database is not initialized
+        """
+        # Version is read from primary, replica can be behind it
+        try:
+            row = await self.__execute(select(SchemaVersion), 1, primary=True)
+        except Exception as exc:
+            if not is_missing_table(exc):
+                raise
+            return 0  # Table is not created yet
+
+        return row['version'] if row else 0
+
+    async def migrate(self, progress: Callable = log_progress) -> int:
+        """
+        Applying migrations newer than version of schema
+        Interrupted migration continues from saved step and position
+        :param progress: Function for progress reporting, see migrations.log_progress
+        :return: Version of schema
+        """
+        await self.__start()
+        await CreateTables([SchemaVersion, MigrationProgress]).run(self, MIGRATIONS[0], 0, None, lambda *args: None)
+
+        version = await self.schema_version()
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+
+            # Continue interrupted migration
+            saved = await self.get_one(select(MigrationProgress).where(MigrationProgress.version == migration.version))
+            first_step, position = (saved['step'], saved['position']) if saved else (0, 0)
+
+            for index, step in enumerate(migration.steps):
+                if index < first_step:
+                    continue
+
+                async def checkpoint(value: int, step_index: int = index) -> None:
+                    await self.__save_progress(migration.version, step_index, value)
+
+                await step.run(self, migration, position, checkpoint, progress)
+                await self.__save_progress(migration.version, index + 1, 0)
+                position = 0
+
+            async with self.transaction():
+                await self.exec(delete(MigrationProgress).where(MigrationProgress.version == migration.version))
+                await self.exec(delete(SchemaVersion))
+                await self.exec(insert(SchemaVersion).values(version=migration.version))
+            version = migration.version
+
+            logging.info('Database schema migrated to version {}'.format(version))
+
+        return version
+
+    async def __save_progress(self, version: int, step: int, position: int) -> None:
+        """
+        Saving position of migration, joins transaction of done work if it exists
+        :param version: Version of migration
+        :param step: Index of step
+        :param position: Position inside step
+        :return:
+        """
+        async with self.transaction(savepoint=False):
+            await self.exec(delete(MigrationProgress).where(MigrationProgress.version == version))
+            await self.exec(insert(MigrationProgress).values(version=version, step=step, position=position))
+
+    # [[ BOOKS ]]
+    async def books_get(self, _id: int = None, title: str = None, author: str = None, genre_id: int = None,
+                        order: str = 'id', descending: bool = False, limit: int = None, offset: int = 0):
+        """
+        Get books by parameters
+        :param _id: Row ID
+        :param title: Title of book
+        :param author: Author of book
+        :param genre_id: Genre ID of book
+        :param order: Sorting by id, title or author, see BOOKS_ORDER
+        :param descending: Sorting in descending order
+        :param limit: Count of rows in page, all rows by default
+        :param offset: Count of skipped rows
+        :return: Row or Rows
+        """
+        # If selecting book by id
+        if _id is not None:
+            query = self.__statement(('books', 'id'), lambda: select(Books).where(Books.id == bindparam('id')), 1)
+            return await self.__execute(query, 1, {'id': _id})
+
+        query, params = self.__books_query(title=title, author=author, genre_id=genre_id, order=order,
+                                           descending=descending, limit=limit, offset=offset)
+        return await self.__execute(query, -1, params)
+
+    async def books_stream(self, title: str = None, author: str = None, genre_id: int = None, size: int = 500,
+                           order: str = 'id', descending: bool = False, limit: int = None,
+                           offset: int = 0) -> AsyncIterator[list]:
+        """
+        Get books by parameters in chunks, for large results
+        :param title: Title of book
+        :param author: Author of book
+        :param genre_id: Genre ID of book
+        :param size: Count of rows in chunk
+        :param order: Sorting by id, title or author, see BOOKS_ORDER
+        :param descending: Sorting in descending order
+        :param limit: Count of rows, all rows by default
+        :param offset: Count of skipped rows
+        :return: Chunks of rows
+        """
+        query, params = self.__books_query(title=title, author=author, genre_id=genre_id, order=order,
+                                           descending=descending, limit=limit, offset=offset)
+        async for rows in self.stream(query, params, size):
+            yield rows
+
+    def __books_query(self, title: str = None, author: str = None, genre_id: int = None, order: str = 'id',
+                      descending: bool = False, limit: int = None, offset: int = 0) -> tuple:
+        """
+        Getting pre-built query for selecting books and values of its parameters
+        :param title: Title of book
+        :param author: Author of book
+        :param genre_id: Genre ID of book
+        :param order: Sorting by id, title or author, see BOOKS_ORDER
+        :param descending: Sorting in descending order
+        :param limit: Count of rows in page
+        :param offset: Count of skipped rows
+        :return: Query and parameters
+        """
+        if order not in BOOKS_ORDER:
+            raise ValueError('Unknown order {}, expected one of {}'.format(order, ', '.join(BOOKS_ORDER)))
+
+        # If selecting book by Title or Author
+        either = (title == author) and (title is not None)
+        params = dict()
+        if title is not None:
+            params['title'] = '%{}%'.format(title)
+        if author is not None:
+            params['author'] = '%{}%'.format(author)
+        if genre_id is not None:
+            params['genre_id'] = genre_id
+
+        # Page is selected by bound parameters, so statement is the same for all pages
+        paged = limit is not None or bool(offset)
+        if paged:
+            params['limit'] = limit if limit is not None else -1 if self.db_type == DBType.SQLITE else 2 ** 64 - 1
+            params['offset'] = offset
+
+        key = ('books', either, title is not None, author is not None, genre_id is not None, order, descending, paged)
+        query = self.__statement(key, lambda: self.__books_select(either, title is not None, author is not None,
+                                                                  genre_id is not None, order, descending, paged),
+                                 1 if paged else -1)  # Not -1 for page, because LIMIT is set by parameter
+        return query, params
+
+    def __books_select(self, either: bool, title: bool, author: bool, genre: bool, order: str, descending: bool,
+                       paged: bool) -> Select:
+        """
+        Building query for selecting books
+        :param either: Filter by Title or Author
+        :param title: Filter by Title
+        :param author: Filter by Author
+        :param genre: Filter by genre
+        :param order: Sorting by id, title or author
+        :param descending: Sorting in descending order
+        :param paged: Select page by parameters limit and offset
+        :return: Query
+        """
+        query = select(Books)
+
+        if either:
+            query = query.where(or_(Books.title.like(bindparam('title')), Books.author.like(bindparam('author'))))
+        else:
+            if title:
+                query = query.where(Books.title.like(bindparam('title')))
+            if author:
+                query = query.where(Books.author.like(bindparam('author')))
+
+        # Filtering books by genre, ID of genre is in book_genre already
+        if genre:
+            query = query.join(BookGenre, Books.id == BookGenre.book_id)
+            query = query.where(BookGenre.genre_id == bindparam('genre_id'))
+
+        # Sorting is case insensitive, like indexes of title and author (SQLite), ID makes order of pages stable
+        columns = [getattr(Books, name) for name in BOOKS_ORDER[order]]
+        if self.db_type == DBType.SQLITE:
+            columns = [column.collate('NOCASE') if column is not Books.id else column for column in columns]
+        # Fix for filter by genre, order of book_id is known from index of book_genre, but order of books.id is not
+        if genre:
+            columns = [BookGenre.book_id if column is Books.id else column for column in columns]
+        query = query.order_by(*(column.desc() if descending else column.asc() for column in columns))
+
+        if paged:
+            query = query.limit(bindparam('limit')).offset(bindparam('offset'))
+
+        return query
+
+    async def books_create(self, title: str, author: str, description: str, on_duplicate: str = 'error',
+                           content_hash: str = None, author_id: int = None):
+        """
+        Add new book
+        :param title: Title of book
+        :param author: Author of book
+        :param description: Description of book
+        :param on_duplicate: Mode for book with equal content, see ON_DUPLICATE
+        :param content_hash: Content hash, if it is computed already (e.g. by import)
+        :param author_id: ID of author, if it is known already (e.g. by import)
+        :return: Row ID of new or existing book
+        """
+        if on_duplicate not in ON_DUPLICATE:
+            raise ValueError('Unknown mode {}, expected one of {}'.format(on_duplicate, ', '.join(ON_DUPLICATE)))
+
+        query = self.__statement(('books', 'create', on_duplicate), lambda: self.__books_insert(on_duplicate))
+        content_hash = content_hash or book_hash(title, author, description)
+
+        async def create() -> int:
+            existing = None
+            if on_duplicate != 'error':
+                existing = await self.__execute(self.__statement(
+                    ('books', 'content_hash'),
+                    lambda: select(Books).where(Books.content_hash == bindparam('content_hash')), 1),
+                    1, {'content_hash': content_hash}, primary=True)
+                if existing and on_duplicate == 'skip':
+                    return existing['id']
+
+            book_author_id = author_id or await self.authors_create(author)
+
+            # Conflict is still resolved by query, if same book is added concurrently
+            book_id = await self.__execute(query, 0, {'title': title, 'author': author, 'description': description,
+                                                      'content_hash': content_hash, 'author_id': book_author_id})
+
+            if not existing:
+                await self.counters_add('books', 0, 1)
+                await self.counters_add('author', book_author_id, 1)
+            elif existing['author_id'] != book_author_id:
+                if existing['author_id'] is not None:
+                    await self.counters_add('author', existing['author_id'], -1)
+                await self.counters_add('author', book_author_id, 1)
+
+            return book_id
+
+        return await self.__unit_of_work(create)
+
+    def __books_insert(self, on_duplicate: str) -> Insert:
+        """
+        Building query for adding book, conflict on content hash is resolved by one statement
+        :param on_duplicate: Mode for book with equal content, see ON_DUPLICATE
+        :return: Query
+        """
+        values = {'title': bindparam('title'), 'author': bindparam('author'), 'description': bindparam('description'),
+                  'content_hash': bindparam('content_hash'), 'author_id': bindparam('author_id')}
+
+        if on_duplicate == 'error':
+            return insert(Books).values(**values)
+
+        if self.db_type == DBType.SQLITE:
+            query = sqlite_insert(Books).values(**values)
+            # Updating of existing row returns its ID by RETURNING
+            if on_duplicate == 'skip':
+                update = {'content_hash': query.excluded.content_hash}
+            else:
+                update = {'title': query.excluded.title, 'author': query.excluded.author,
+                          'description': query.excluded.description, 'author_id': query.excluded.author_id}
+            return query.on_conflict_do_update(index_elements=[Books.content_hash], set_=update)
+        elif self.db_type == DBType.MYSQL:
+            query = mysql_insert(Books).values(**values)
+            # Fix for MySQL, LAST_INSERT_ID() returns ID of existing row
+            update = {'id': sql_func.last_insert_id(Books.id)}
+            if on_duplicate == 'upsert':
+                update.update(title=query.inserted.title, author=query.inserted.author,
+                              description=query.inserted.description, author_id=query.inserted.author_id)
+            return query.on_duplicate_key_update(**update)
+
+    async def books_create_many(self, books: Sequence[dict], on_duplicate: str = 'skip') -> list:
+        """
+        Add many books by few statements, e.g. for import, must be called inside unit of work
+        Books must have content hash and ID of author, see prepare_books()
+        Only skip mode is done by bulk statements, books of other modes are added one by one
+        :param books: Books with title, author, description, content_hash and author_id
+        :param on_duplicate: Mode for book with equal content, see ON_DUPLICATE
+        :return: Row IDs of new or existing books in order of books
+        """
+        if on_duplicate != 'skip':
+            return [await self.books_create(title=book['title'], author=book['author'],
+                                            description=book['description'], on_duplicate=on_duplicate,
+                                            content_hash=book['content_hash'], author_id=book['author_id'])
+                    for book in books]
+        if not books:
+            return list()
+
+        select_ids = self.__statement(('books', 'content_hashes'), lambda: select(Books.id, Books.content_hash).where(
+            Books.content_hash.in_(bindparam('hashes', expanding=True))), -1)
+
+        def build() -> Insert:
+            # Fix for ORM session, INSERT of mapped class with list of parameters is executed as ORM bulk INSERT
+            table = Books.__table__
+            if self.db_type == DBType.SQLITE:
+                return sqlite_insert(table).on_conflict_do_nothing(index_elements=[table.c.content_hash])
+            elif self.db_type == DBType.MYSQL:
+                return mysql_insert(table).prefix_with('IGNORE')
+
+        hashes = list(dict.fromkeys(book['content_hash'] for book in books))
+        ids = {row['content_hash']: row['id'] for row in await self.__execute(select_ids, -1, {'hashes': hashes})}
+
+        # Duplicates in books are added once, rows are inserted by one statement with many parameters
+        new = dict()
+        for book in books:
+            if book['content_hash'] not in ids and book['content_hash'] not in new:
+                new[book['content_hash']] = {name: book[name] for name in ('title', 'author', 'description',
+                                                                          'content_hash', 'author_id')}
+        if new:
+            await self.__execute(self.__statement(('books', 'create_many'), build), 0, list(new.values()))
+            ids.update({row['content_hash']: row['id'] for row in await self.__execute(
+                select_ids, -1, {'hashes': list(new)})})
+
+            await self.counters_add('books', 0, len(new))
+            authors = Counter(book['author_id'] for book in new.values())
+            for author_id, count in authors.items():
+                await self.counters_add('author', author_id, count)
+
+        return [ids[book['content_hash']] for book in books]
+
+    async def books_dedup(self, batch_size: int = 1000, progress: Callable[[int, int], None] = None) -> dict:
+        """
+        Merging duplicate books by batches of IDs, for rows without content hash (e.g. added by older version)
+        :param batch_size: Count of IDs in one batch, every batch is committed
+        :param progress: Function for progress reporting, gets last checked and max ID
+        :return: Count of checked and merged books
+        """
+        total = (await execute_sql(self, 'SELECT MAX(id) FROM books'))[0][0] or 0
+
+        result = {'checked': 0, 'merged': 0}
+        position = 0
+        while position < total:
+            last_id = min(position + batch_size, total)
+            async with self.transaction(savepoint=False):
+                checked, merged = await dedup_books(self, position, last_id)
+            result['checked'] += checked
+            result['merged'] += merged
+            position = last_id
+
+            if progress is not None:
+                progress(position, total)
+
+        # Merged books were added without counting, e.g. by older version
+        if result['checked']:
+            await self.stats_recompute()
+
+        return result
+
+    async def books_compress(self, compress: bool = True, batch_size: int = 1000,
+                             progress: Callable[[int, int], None] = None) -> dict:
+        """
+        Compressing existing descriptions by batches of IDs, e.g. after compression is enabled
+        :param compress: Compressing, else decompressing (e.g. after compression is disabled)
+        :param batch_size: Count of IDs in one batch, every batch is committed
+        :param progress: Function for progress reporting, gets last checked and max ID
+        :return: Count of checked and changed books
+        """
+        total = (await execute_sql(self, 'SELECT MAX(id) FROM books'))[0][0] or 0
 
-        """
-        Example:
-                
-        data = (
-            (func.now(), 1, 'text'),  # func.now - if need insert datetime.now()
-            (func.now(), 2, 'blah'),
-        )
-        
-        data_statement = (insert(Table).values(dt=dt, value=value, key=key).prefix_with('OR IGNORE') for dt, value, key in data)
+        result = {'checked': 0, 'changed': 0}
+        position = 0
+        while position < total:
+            last_id = min(position + batch_size, total)
+            async with self.transaction(savepoint=False):
+                checked, changed = await compress_descriptions(self, position, last_id, compress)
+            result['checked'] += checked
+            result['changed'] += changed
+            position = last_id
 
-        for statement in (statement_data,):
-            for row in statement:
-                # Inserting row from statement
-                await session.execute(row)
+            if progress is not None:
+                progress(position, total)
 
-        # Save changes
-        await session.commit()
+        return result
+
+    async def descriptions_report(self, batch_size: int = 1000) -> dict:
         """
-        pass
+        Size of stored descriptions and time of reading them, for checking effect of compression
+        :param batch_size: Count of IDs read by one query
+        :return: Count of books and compressed books, plain and stored bytes, seconds of reading and decompressing
+        """
+        total = (await execute_sql(self, 'SELECT MAX(id) FROM books'))[0][0] or 0
+
+        report = {'books': 0, 'compressed': 0, 'plain_bytes': 0, 'stored_bytes': 0, 'read_seconds': 0.0,
+                  'decompress_seconds': 0.0}
+        position = 0
+        while position < total:
+            last_id = min(position + batch_size, total)
+            started = time.perf_counter()
+            rows = await execute_sql(self, 'SELECT description FROM books WHERE id > :first_id AND id <= :last_id',
+                                     {'first_id': position, 'last_id': last_id})
+            report['read_seconds'] += time.perf_counter() - started
+            position = last_id
+
+            for stored, in rows:
+                started = time.perf_counter()
+                text = decompress_text(stored)
+                report['decompress_seconds'] += time.perf_counter() - started
+
+                report['books'] += 1
+                report['compressed'] += is_compressed(stored)
+                report['plain_bytes'] += len(text.encode('utf-8'))
+                report['stored_bytes'] += len(stored) if isinstance(stored, bytes) else len(stored.encode('utf-8'))
+
+        report['ratio'] = report['plain_bytes'] / report['stored_bytes'] if report['stored_bytes'] else 1.0
+        return report
 
-    async def initialize(self) -> None:
+    async def books_delete(self, _id: int):
         """
-        Initializing database
+        Delete book
+        :param _id: Row ID
         :return:
         """
-        logging.info('Initializing database')
+        query = self.__statement(('books', 'delete'), lambda: delete(Books).where(Books.id == bindparam('id')))
 
-        await self.__start()
-        await self.__create_tables()
-        await self.__insert_data()
+        async def remove() -> None:
+            book = await self.__execute(self.__statement(
+                ('books', 'id'), lambda: select(Books).where(Books.id == bindparam('id')), 1), 1, {'id': _id},
+                primary=True)
+            if not book:
+                return
 
-        logging.info('Database initialized')
+            await self.__execute(query, 0, {'id': _id})
+            await self.counters_add('books', 0, -1)
+            if book['author_id'] is not None:
+                await self.counters_add('author', book['author_id'], -1)
 
-    # [[ BOOKS ]]
-    async def books_get(self, _id: int = None, title: str = None, author: str = None, genre_id: int = None):
+        return await self.__unit_of_work(remove)
+
+    async def books_by_author(self, author_id: int = None, name: str = None):
         """
-        Get books by parameters
+        Get books of author by index of author
+        :param author_id: ID of author
+        :param name: Name of author, case and whitespace are not taken into account
+        :return: Rows
+        """
+        if author_id is not None:
+            query = self.__statement(('books', 'author_id'),
+                                     lambda: select(Books).where(Books.author_id == bindparam('author_id')), -1)
+            return await self.__execute(query, -1, {'author_id': author_id})
+
+        query = self.__statement(('books', 'author_name'),
+                                 lambda: select(Books).join(Authors, Authors.id == Books.author_id)
+                                                      .where(Authors.name_key == bindparam('key')), -1)
+        return await self.__execute(query, -1, {'key': normalize_name(name or '')})
+
+    # [[ AUTHORS ]]
+    async def authors_get(self, _id: int = None, name: str = None):
+        """
+        Get authors with count of their books, authors without books are skipped
         :param _id: Row ID
-        :param title: Title of book
-        :param author: Author of book
-        :param genre_id: Genre ID of book
-        :return: Row or Rows
+        :param name: Beginning of author name, case and whitespace are not taken into account
+        :return: Row or Rows with keys id, name, books
         """
-        query = select(Books)
-
-        # If selecting book by id
         if _id is not None:
-            return await self.get_one(query.where(Books.id == _id))
-
-        # If selecting book by Title or Author
-        if (title == author) and (title is not None):
-            query = query.where(or_(Books.title.like('%{}%'.format(title)), Books.author.like('%{}%'.format(author))))
-        else:
-            if title is not None:
-                query = query.where(Books.title.like('%{}%'.format(title)))
-            if author is not None:
-                query = query.where(Books.author.like('%{}%'.format(author)))
+            query = self.__statement(('authors', 'id'), lambda: self.__authors_select().where(
+                Authors.id == bindparam('id')), 1)
+            return await self.__execute(query, 1, {'id': _id})
 
-        # Filtering books by genre
-        if genre_id is not None:
-            query = query.join(BookGenre, Books.id == BookGenre.book_id)
-            query = query.join(Genres, Genres.id == BookGenre.genre_id)
-            query = query.where(Genres.id == genre_id)
+        if name is not None:
+            # Search by beginning of name is index seek
+            query = self.__statement(('authors', 'name'), lambda: self.__authors_select().where(
+                Authors.name_key.like(bindparam('name'))), -1)
+            return await self.__execute(query, -1, {'name': normalize_name(name) + '%'})
 
-        return await self.get_all(query)
+        query = self.__statement(('authors', ), self.__authors_select, -1)
+        return await self.__execute(query, -1)
 
-    async def books_create(self, title: str, author: str, description: str):
+    @staticmethod
+    def __authors_select() -> Select:
         """
-        Add new book
-        :param title: Title of book
-        :param author: Author of book
-        :param description: Description of book
-        :return: Row ID of new book
+        Building query for selecting authors with count of books
+        :return: Query
         """
-        query = insert(Books).values(title=title, author=author, description=description)
-
-        return await self.exec(query)
+        return select(Authors.id, Authors.name, sql_func.count(Books.id).label('books')) \
+            .join(Books, Books.author_id == Authors.id) \
+            .group_by(Authors.id, Authors.name, Authors.name_key) \
+            .order_by(Authors.name_key)
 
-    async def books_delete(self, _id: int):
+    async def authors_create(self, name: str, key: str = None) -> int:
         """
-        Delete book
-        :param _id: Row ID
-        :return:
+        Add author, if author with equal normalized name does not exist
+        :param name: Name of author
+        :param key: Normalized name, if it is computed already (e.g. by import)
+        :return: Row ID of new or existing author
         """
-        query = delete(Books).where(Books.id == _id)
-
-        return await self.exec(query)
+        def build() -> Insert:
+            values = {'name': bindparam('name'), 'name_key': bindparam('key')}
+            if self.db_type == DBType.SQLITE:
+                query = sqlite_insert(Authors).values(**values)
+                return query.on_conflict_do_update(index_elements=[Authors.name_key],
+                                                   set_={'name_key': query.excluded.name_key})
+            elif self.db_type == DBType.MYSQL:
+                return mysql_insert(Authors).values(**values).on_duplicate_key_update(
+                    id=sql_func.last_insert_id(Authors.id))
+
+        query = self.__statement(('authors', 'create'), build)
+        return await self.__execute(query, 0, {'name': name, 'key': key or normalize_name(name)})
 
     # [[ GENRES ]]
     async def genres_get(self, _id: int = None, name: str = None):
@@ -382,15 +2340,17 @@ class Database:
         :param name: Genre name
         :return: Row or Rows
         """
-        query = select(Genres)
-
         if _id is not None:
-            return await self.get_one(query.where(Genres.id == _id))
+            query = self.__statement(('genres', 'id'), lambda: select(Genres).where(Genres.id == bindparam('id')), 1)
+            return await self.__execute(query, 1, {'id': _id})
 
         if name is not None:
-            query = query.where(Genres.name.like('%{}%'.format(name)))
+            query = self.__statement(('genres', 'name'),
+                                     lambda: select(Genres).where(Genres.name.like(bindparam('name'))), -1)
+            return await self.__execute(query, -1, {'name': '%{}%'.format(name)})
 
-        return await self.get_all(query)
+        query = self.__statement(('genres', ), lambda: select(Genres), -1)
+        return await self.__execute(query, -1)
 
     async def genres_create(self, name: str):
         """
@@ -398,9 +2358,9 @@ class Database:
         :param name: Name of genre
         :return: Row ID of new genre
         """
-        query = insert(Genres).values(name=name)
+        query = self.__statement(('genres', 'create'), lambda: insert(Genres).values(name=bindparam('name')))
 
-        return await self.exec(query)
+        return await self.__execute(query, 0, {'name': name})
 
     async def genres_delete(self, _id: int):
         """
@@ -408,9 +2368,15 @@ class Database:
         :param _id: Row ID
         :return:
         """
-        query = delete(Genres).where(Genres.id == _id)
+        query = self.__statement(('genres', 'delete'), lambda: delete(Genres).where(Genres.id == bindparam('id')))
+        counter = self.__statement(('counters', 'delete'), lambda: delete(Counters).where(
+            Counters.kind == bindparam('kind'), Counters.key_id == bindparam('key_id')))
+
+        async def remove() -> None:
+            await self.__execute(query, 0, {'id': _id})
+            await self.__execute(counter, 0, {'kind': 'genre', 'key_id': _id})
 
-        return await self.exec(query)
+        return await self.__unit_of_work(remove)
 
     # [[ BOOK GENRE ]]
     async def book_genre_get(self, _id: int = None, book_id: int = None, genre_id: int = None):
@@ -421,18 +2387,38 @@ class Database:
         :param genre_id: ID of genre
         :return: Row or Rows
         """
-        query = select(BookGenre)
-
         if _id is not None:
-            return await self.get_one(query.where(BookGenre.id == _id))
+            query = self.__statement(('book_genre', 'id'),
+                                     lambda: select(BookGenre).where(BookGenre.id == bindparam('id')), 1)
+            return await self.__execute(query, 1, {'id': _id})
 
+        params = dict()
         if book_id is not None:
-            query = query.where(BookGenre.book_id == book_id)
-
+            params['book_id'] = book_id
         if genre_id is not None:
-            query = query.where(BookGenre.genre_id == genre_id)
+            params['genre_id'] = genre_id
+
+        query = self.__statement(('book_genre', book_id is not None, genre_id is not None),
+                                 lambda: self.__book_genre_select(book_id is not None, genre_id is not None), -1)
+        return await self.__execute(query, -1, params)
+
+    @staticmethod
+    def __book_genre_select(book: bool, genre: bool) -> Select:
+        """
+        Building query for selecting book genres
+        :param book: Filter by book
+        :param genre: Filter by genre
+        :return: Query
+        """
+        query = select(BookGenre)
+
+        if book:
+            query = query.where(BookGenre.book_id == bindparam('book_id'))
 
-        return await self.get_all(query)
+        if genre:
+            query = query.where(BookGenre.genre_id == bindparam('genre_id'))
+
+        return query
 
     async def book_genre_create(self, book_id: int, genre_id: int):
         """
@@ -441,9 +2427,172 @@ class Database:
         :param genre_id: ID of genre
         :return: Row ID of new book genre
         """
-        query = insert(BookGenre).values(book_id=book_id, genre_id=genre_id)
+        query = self.__statement(('book_genre', 'create'), lambda: insert(BookGenre).values(book_id=bindparam('book_id'),
+                                                                                           genre_id=bindparam('genre_id')))
+
+        async def create() -> int:
+            book_genre_id = await self.__execute(query, 0, {'book_id': book_id, 'genre_id': genre_id})
+            await self.counters_add('genre', genre_id, 1)
+            return book_genre_id
+
+        return await self.__unit_of_work(create)
+
+    async def book_genre_link(self, book_id: int, genres_id: Sequence[int]) -> None:
+        """
+        Linking book with genres, which are not linked yet
+        :param book_id: ID of book
+        :param genres_id: IDs of genres
+        :return:
+        """
+        async def link() -> None:
+            await self.__book_genre_insert([book_id], list(dict.fromkeys(genres_id)))
+
+        await self.__unit_of_work(link)
+
+    async def book_genre_link_many(self, links: Sequence[tuple]) -> int:
+        """
+        Linking books with genres by one statement for every genre, existing links are skipped
+        Must be called inside unit of work, counters are changed by count of inserted links
+        :param links: Pairs of book ID and genre ID
+        :return: Count of new links
+        """
+        books_by_genre: Dict[int, List[int]] = dict()
+        for book_id, genre_id in dict.fromkeys(links):
+            books_by_genre.setdefault(genre_id, list()).append(book_id)
+
+        def build() -> Insert:
+            # Fix for ORM session, INSERT of mapped class with list of parameters is executed as ORM bulk INSERT
+            table = BookGenre.__table__
+            insert_ = sqlite_insert if self.db_type == DBType.SQLITE else mysql_insert
+            return self.__book_genre_ignore(insert_(table))
+
+        query = self.__statement(('book_genre', 'create_many'), build, CHANGED_ROWS)
+        added = 0
+        for genre_id, books_id in books_by_genre.items():
+            count = await self.__execute(query, CHANGED_ROWS, [{'book_id': book_id, 'genre_id': genre_id}
+                                                               for book_id in books_id])
+            if count:
+                await self.counters_add('genre', genre_id, count)
+            added += count
+        return added
+
+    def __book_genre_ignore(self, query: Insert) -> Insert:
+        """
+        Ignoring links, which exist already (unique key of book and genre)
+        :param query: Query of inserting links
+        :return: Query
+        """
+        if self.db_type == DBType.SQLITE:
+            return query.on_conflict_do_nothing(index_elements=[BookGenre.book_id, BookGenre.genre_id])
+        elif self.db_type == DBType.MYSQL:
+            return query.prefix_with('IGNORE')
+
+    async def __book_genre_insert(self, books_id: Sequence[int], genres_id: Sequence[int]) -> int:
+        """
+        Linking every book with every genre by one statement for every genre, only existing books and genres are linked
+        Must be called inside unit of work, counters are changed by count of inserted links
+        :param books_id: IDs of books
+        :param genres_id: IDs of genres
+        :return: Count of new links
+        """
+        if not books_id or not genres_id:
+            return 0
+
+        genres = await self.__execute(self.__statement(('genres', 'ids'), lambda: select(Genres.id).where(
+            Genres.id.in_(bindparam('ids', expanding=True))), -1), -1, {'ids': list(genres_id)})
+
+        def build() -> Insert:
+            source = select(Books.id, bindparam('genre_id', type_=Integer)) \
+                .where(Books.id.in_(bindparam('books_id', expanding=True)))
+            # Fix for ORM session, INSERT of mapped class with parameters is executed as bulk INSERT
+            table = BookGenre.__table__
+            insert_ = sqlite_insert if self.db_type == DBType.SQLITE else mysql_insert
+            return self.__book_genre_ignore(insert_(table).from_select([table.c.book_id, table.c.genre_id], source))
+
+        query = self.__statement(('book_genre', 'insert'), build, CHANGED_ROWS)
+        added = 0
+        for genre in genres:
+            # Existing links are ignored by INSERT, so only inserted rows are counted
+            count = await self.__execute(query, CHANGED_ROWS, {'books_id': list(books_id), 'genre_id': genre['id']})
+            if count:
+                await self.counters_add('genre', genre['id'], count)
+            added += count
+        return added
+
+    def __genre_books_statement(self) -> Select:
+        """
+        Statement of selecting books, which have genre, among given books
+        :return: Statement
+        """
+        return self.__statement(('book_genre', 'genre_books'), lambda: select(BookGenre.book_id).where(
+            BookGenre.genre_id == bindparam('genre_id'), BookGenre.book_id.in_(bindparam('books_id', expanding=True))),
+            -1)
+
+    async def book_genre_assign(self, genre_id: int, books_id: Sequence[int]) -> int:
+        """
+        Adding genre to books by one statement, books which have this genre already are skipped
+        :param genre_id: ID of genre
+        :param books_id: IDs of books
+        :return: Count of new links
+        """
+        async def assign() -> int:
+            return await self.__book_genre_insert(list(dict.fromkeys(books_id)), [genre_id])
+
+        return await self.__unit_of_work(assign)
+
+    async def book_genre_remove(self, genre_id: int, books_id: Sequence[int]) -> int:
+        """
+        Removing genre from books by one statement
+        :param genre_id: ID of genre
+        :param books_id: IDs of books
+        :return: Count of removed links
+        """
+        linked_query = self.__genre_books_statement()
+        query = self.__statement(('book_genre', 'remove_genre'), lambda: delete(BookGenre).where(
+            BookGenre.genre_id == bindparam('genre_id'), BookGenre.book_id.in_(bindparam('books_id', expanding=True))))
+
+        async def remove() -> int:
+            books_id_ = list(dict.fromkeys(books_id))
+            if not books_id_:
+                return 0
+
+            # Counter is changed by count of existing links
+            linked = [row['book_id'] for row in await self.__execute(linked_query, -1, {'genre_id': genre_id,
+                                                                                        'books_id': books_id_})]
+            if not linked:
+                return 0
+
+            await self.__execute(query, 0, {'genre_id': genre_id, 'books_id': linked})
+            await self.counters_add('genre', genre_id, -len(linked))
+            return len(linked)
+
+        return await self.__unit_of_work(remove)
+
+    async def book_genre_set(self, book_id: int, genres_id: Sequence[int]) -> dict:
+        """
+        Setting genres of book, only difference with current genres is written
+        :param book_id: ID of book
+        :param genres_id: IDs of genres
+        :return: Count of added and removed links
+        """
+        query = self.__statement(('book_genre', 'remove_genres'), lambda: delete(BookGenre).where(
+            BookGenre.book_id == bindparam('book_id'), BookGenre.genre_id.in_(bindparam('genres_id', expanding=True))))
+
+        async def update() -> dict:
+            linked = {row['genre_id'] for row in await self.book_genre_get(book_id=book_id) if row}
+            genres_id_ = list(dict.fromkeys(genres_id))
+
+            removed = sorted(linked - set(genres_id_))
+            if removed:
+                await self.__execute(query, 0, {'book_id': book_id, 'genres_id': removed})
+                for genre_id in removed:
+                    await self.counters_add('genre', genre_id, -1)
 
-        return await self.exec(query)
+            added = await self.__book_genre_insert([book_id], [genre_id for genre_id in genres_id_
+                                                               if genre_id not in linked])
+            return {'added': added, 'removed': len(removed)}
+
+        return await self.__unit_of_work(update)
 
     async def book_genre_delete(self, _id: int):
         """
@@ -451,82 +2600,673 @@ class Database:
         :param _id: Row ID
         :return:
         """
-        query = delete(BookGenre).where(BookGenre.id == _id)
+        query = self.__statement(('book_genre', 'delete'),
+                                 lambda: delete(BookGenre).where(BookGenre.id == bindparam('id')))
+
+        async def remove() -> None:
+            book_genre = await self.__execute(self.__statement(
+                ('book_genre', 'id'), lambda: select(BookGenre).where(BookGenre.id == bindparam('id')), 1), 1,
+                {'id': _id}, primary=True)
+            if not book_genre:
+                return
+
+            await self.__execute(query, 0, {'id': _id})
+            await self.counters_add('genre', book_genre['genre_id'], -1)
+
+        return await self.__unit_of_work(remove)
+
+    # [[ STATISTICS ]]
+    async def counters_add(self, kind: str, key_id: int, delta: int) -> None:
+        """
+        Changing counter, counter is created if not exists
+        :param kind: Kind of counter, see Counters
+        :param key_id: ID of counted object
+        :param delta: Change of value
+        :return:
+        """
+        def build() -> Insert:
+            values = {'kind': bindparam('kind'), 'key_id': bindparam('key_id'), 'value': bindparam('delta')}
+            if self.db_type == DBType.SQLITE:
+                query = sqlite_insert(Counters).values(**values)
+                return query.on_conflict_do_update(index_elements=[Counters.kind, Counters.key_id],
+                                                   set_={'value': Counters.value + query.excluded.value})
+            elif self.db_type == DBType.MYSQL:
+                query = mysql_insert(Counters).values(**values)
+                return query.on_duplicate_key_update(value=Counters.value + query.inserted.value)
+
+        query = self.__statement(('counters', 'add'), build)
+        await self.__execute(query, 0, {'kind': kind, 'key_id': key_id, 'delta': delta})
+
+    async def stats_get(self, top: int = 10) -> dict:
+        """
+        Statistics of catalog by counters, without counting rows
+        :param top: Count of authors with most books
+        :return: Count of books, genres and top authors with count of books
+        """
+        total = self.__statement(('counters', 'books'), lambda: select(Counters).where(Counters.kind == 'books'), 1)
+        genres = self.__statement(('counters', 'genres'), lambda: select(
+            Genres.id, Genres.name, sql_func.coalesce(Counters.value, 0).label('books'))
+            .outerjoin(Counters, and_(Counters.kind == 'genre', Counters.key_id == Genres.id))
+            .order_by(sql_func.coalesce(Counters.value, 0).desc(), Genres.name), -1)
+        authors = self.__statement(('counters', 'authors'), lambda: select(
+            Authors.id, Authors.name, Counters.value.label('books'))
+            .join(Authors, Authors.id == Counters.key_id)
+            .where(Counters.kind == 'author', Counters.value > 0)
+            .order_by(Counters.value.desc())
+            .limit(bindparam('top')), 1)  # Not -1, because LIMIT is set by parameter
+
+        total, genres, authors = await self.gather(self.__execute(total, 1), self.__execute(genres, -1),
+                                                   self.__execute(authors, -1, {'top': top}))
+
+        return {'books': total['value'] if total else 0, 'genres': genres, 'authors': authors}
+
+    async def stats_recompute(self) -> dict:
+        """
+        Recomputing counters by counting rows, for consistency check
+        Counters can drift only if the same book is added concurrently, or rows are changed outside of this module
+        :return: Count of counters and count of fixed counters
+        """
+        async with self.transaction(savepoint=False):
+            actual = {('books', 0): (await execute_sql(self, 'SELECT COUNT(*) FROM books'))[0][0]}
+            for genre_id, value in await execute_sql(self, 'SELECT genre_id, COUNT(*) FROM book_genre '
+                                                           'GROUP BY genre_id'):
+                actual['genre', genre_id] = value
+            for author_id, value in await execute_sql(self, 'SELECT author_id, COUNT(*) FROM books '
+                                                            'WHERE author_id IS NOT NULL GROUP BY author_id'):
+                actual['author', author_id] = value
+
+            stored = {(kind, key_id): value
+                      for kind, key_id, value in await execute_sql(self, 'SELECT kind, key_id, value FROM counters')}
+
+            fixed = 0
+            for key in set(actual) | set(stored):
+                if actual.get(key, 0) == stored.get(key, 0):
+                    continue
+
+                kind, key_id = key
+                await execute_sql(self, 'DELETE FROM counters WHERE kind = :kind AND key_id = :key_id',
+                                  {'kind': kind, 'key_id': key_id})
+                await execute_sql(self, 'INSERT INTO counters (kind, key_id, value) VALUES (:kind, :key_id, :value)',
+                                  {'kind': kind, 'key_id': key_id, 'value': actual.get(key, 0)})
+                fixed += 1
+
+        return {'counters': len(actual), 'fixed': fixed}
+
+
+class Libraries:
+    """
+    Registry of databases of branch libraries, every library has its own engine and pool
+    """
+    def __init__(self, default: Database, libraries: Dict[str, str] = None, max_open: int = DB_MAX_OPEN):
+        """
+        :param default: Database for requests without library key
+        :param libraries: Names of databases by keys of libraries
+        :param max_open: Max count of open SQLite databases
+        """
+        self.default = default
+        self.names: Dict[str, str] = dict(libraries or {})
+        self.max_open = max_open
+
+        # Databases in order of usage, least recently used is first
+        self.databases: OrderedDict[str, Database] = OrderedDict()
+
+    def add(self, key: str, db_name: str) -> None:
+        """
+        Register library
+        :param key: Key of library
+        :param db_name: Name of database file (SQLite) or schema (MySQL)
+        :return:
+        """
+        self.names[key] = db_name
+
+    def get(self, key: str = None) -> Database:
+        """
+        Getting database of library
+        :param key: Key of library, default database if None
+        :return: Database object
+        """
+        if key is None:
+            return self.default
+
+        database = self.databases.get(key)
+        if metrics.enabled:
+            CACHE_REQUESTS.inc(('libraries', 'miss' if database is None else 'hit'))
+        if database is None:
+            if key not in self.names:
+                raise KeyError('Unknown library {}'.format(key))
+            database = self.databases[key] = Database(db_name=self.names[key])
+        self.databases.move_to_end(key)
+
+        return database
+
+    async def open(self, key: str = None) -> Database:
+        """
+        Getting initialized database of library, closing idle SQLite databases over limit
+        :param key: Key of library, default database if None
+        :return: Database object
+        """
+        database = self.get(key)
+        if not database.initialized:
+            await database.initialize()
+
+        await self.close_idle()
+        return database
+
+    async def close_idle(self) -> None:
+        """
+        Closing least recently used idle SQLite databases, so count of open files is limited
+        :return:
+        """
+        # In-memory database without snapshot would lose its data
+        opened = [database for database in self.databases.values()
+                  if database.engine is not None and database.db_type == DBType.SQLITE and
+                  not (database.memory and not database.memory_snapshot)]
+
+        # Databases with running queries are not closed, limit is exceeded until they are idle
+        idle = [database for database in opened if not database.in_use]
+        for database in idle[:max(0, len(opened) - self.max_open)]:
+            await database.close()
+
+    async def close(self) -> None:
+        """
+        Closing all databases
+        :return:
+        """
+        for database in self.databases.values():
+            await database.close()
+
+
+db = Database(replicas=DB_REPLICAS)
+libraries = Libraries(db, DB_LIBRARIES)
+
+
+def pool_connections() -> dict:
+    """
+    Collecting connections of pools of all databases for metrics
+    :return: Count of connections by database and state
+    """
+    databases = [db, *libraries.databases.values()]
+    if db.replicas is not None:
+        databases += db.replicas.databases
+
+    values = dict()
+    for database in databases:
+        in_use, idle = database.pool_connections()
+        values[(database.metrics_name, 'in_use')] = in_use
+        values[(database.metrics_name, 'idle')] = idle
+    return values
+
+
+metrics.gauge('db_pool_connections', 'Connections of pools', ('database', 'state'), pool_connections)
 
-        return await self.exec(query)
+
+def transaction(savepoint: bool = True, write: bool = True, library: str = None):
+    """
+    Unit of work for functions of this module
+    :param savepoint: Create SAVEPOINT for nested call
+    :param write: Unit of work writes, SQLite takes write lock at its beginning
+    :param library: Key of library
+    :return: Context manager
+    """
+    return libraries.get(library).transaction(savepoint=savepoint, write=write)
+
+
+def begin_session(library: str = None) -> None:
+    """
+    Starting session in current context, session reads its writes even if replicas are behind
+    :param library: Key of library
+    :return:
+    """
+    libraries.get(library).begin_session()
+
+
+async def gather(*coros: Awaitable, limit: int = None, library: str = None) -> list:
+    """
+    Executing independent queries concurrently
+    :param coros: Coroutines
+    :param limit: Count of concurrent queries
+    :param library: Key of library
+    :return: Results in order of coroutines
+    """
+    return await libraries.get(library).gather(*coros, limit=limit)
+
+
+async def snapshot(path: str, library: str = None) -> dict:
+    """
+    Writing read-only snapshot of catalog for instant start of application
+    :param path: Path of snapshot
+    :param library: Key of library
+    :return: Count of books, genres and size of file
+    """
+    database = await libraries.open(library)
+    return await database.snapshot(path)
 
 
-db = Database()
+async def backup(path: str, pages: int = 100, pause: float = 0.005, compress: bool = False,
+                 progress: Callable[[int, int], None] = None, library: str = None) -> dict:
+    """
+    Online backup of database
+    :param path: Path of backup
+    :param pages: Count of pages copied in one step
+    :param pause: Sleep between steps in seconds
+    :param compress: Compress backup by gzip
+    :param progress: Function for progress reporting
+    :param library: Key of library
+    :return: Metrics of backup
+    """
+    return await libraries.get(library).backup(path, pages=pages, pause=pause, compress=compress, progress=progress)
+
+
+async def restore(path: str, pages: int = 100, pause: float = 0.005, progress: Callable[[int, int], None] = None,
+                  library: str = None) -> dict:
+    """
+    Restoring database from backup
+    :param path: Path of backup
+    :param pages: Count of pages copied in one step
+    :param pause: Sleep between steps in seconds
+    :param progress: Function for progress reporting
+    :param library: Key of library
+    :return: Metrics of restore
+    """
+    return await libraries.get(library).restore(path, pages=pages, pause=pause, progress=progress)
 
 
 # [[ BOOKS ]]
-async def books_get(_id: int = None, title: str = None, author: str = None, genre_id: int = None):
+async def books_get(_id: int = None, title: str = None, author: str = None, genre_id: int = None,
+                    order: str = 'id', descending: bool = False, limit: int = None, offset: int = 0,
+                    library: str = None):
     """
     Get books from database
     :param _id: Row ID
     :param title: Title of book
     :param author: Author of book
     :param genre_id: Description of book
+    :param order: Sorting by id, title or author
+    :param descending: Sorting in descending order
+    :param limit: Count of rows in page, all rows by default
+    :param offset: Count of skipped rows
+    :param library: Key of library
     :return: Row or Rows
     """
-    return await db.books_get(_id=_id, title=title, author=author, genre_id=genre_id)
+    database = await libraries.open(library)
+    return await database.books_get(_id=_id, title=title, author=author, genre_id=genre_id, order=order,
+                                    descending=descending, limit=limit, offset=offset)
+
+
+async def books_stream(title: str = None, author: str = None, genre_id: int = None, size: int = 500,
+                       order: str = 'id', descending: bool = False, limit: int = None, offset: int = 0,
+                       library: str = None):
+    """
+    Get books from database in chunks
+    :param title: Title of book
+    :param author: Author of book
+    :param genre_id: Genre ID of book
+    :param size: Count of rows in chunk
+    :param order: Sorting by id, title or author
+    :param descending: Sorting in descending order
+    :param limit: Count of rows, all rows by default
+    :param offset: Count of skipped rows
+    :param library: Key of library
+    :return: Chunks of rows
+    """
+    database = await libraries.open(library)
+    async for rows in database.books_stream(title=title, author=author, genre_id=genre_id, size=size, order=order,
+                                            descending=descending, limit=limit, offset=offset):
+        yield rows
 
 
-async def books_add(title: str, author: str, description: str, genres_id: Sequence[int]):
+async def books_add(title: str, author: str, description: str, genres_id: Sequence[int], on_duplicate: str = 'skip',
+                    library: str = None):
     """
-    Add new book
+    Add new book, genres of duplicate are added to existing book
     :param title: Title of book
     :param author: Author of book
     :param description: Description of book
     :param genres_id: Genres of book
-    :return: Row ID of new book
+    :param on_duplicate: Mode for book with equal content, see ON_DUPLICATE
+    :param library: Key of library
+    :return: Row ID of new or existing book
+    """
+    database = await libraries.open(library)
+
+    async def add() -> int:
+        book_id = await database.books_create(title=title, author=author, description=description,
+                                              on_duplicate=on_duplicate)
+        await database.book_genre_link(book_id=book_id, genres_id=genres_id)
+
+        return book_id
+
+    return await database.run_in_transaction(add)
+
+
+async def books_add_many(books: Sequence[dict], on_duplicate: str = 'skip', library: str = None) -> list:
+    """
+    Add many books by one transaction, e.g. for import
+    :param books: Books with keys title, author, description and genres_id
+    :param on_duplicate: Mode for book with equal content, see ON_DUPLICATE
+    :param library: Key of library
+    :return: Row IDs of new or existing books in order of books
+    """
+    database = await libraries.open(library)
+
+    async def add() -> list:
+        ids = list()
+        for book in books:
+            book_id = await database.books_create(title=book['title'], author=book['author'],
+                                                  description=book['description'], on_duplicate=on_duplicate)
+            await database.book_genre_link(book_id=book_id, genres_id=book.get('genres_id', ()))
+            ids.append(book_id)
+
+        return ids
+
+    return await database.run_in_transaction(add)
+
+
+async def books_import(path: str, fmt: str = None, processes: int = None, chunk_size: int = 1000,
+                       ordered: bool = True, on_duplicate: str = 'skip', progress: Callable[[int, int], None] = None,
+                       library: str = None) -> dict:
+    """
+    Importing books from CSV or JSON lines file (see ingest.py) by pipeline:
+    worker processes parse and normalize chunks, one writer adds every chunk by one transaction
+    :param path: Path of source file
+    :param fmt: Format of file, it is detected by extension by default
+    :param processes: Count of worker processes, count of CPUs by default
+    :param chunk_size: Count of records in chunk
+    :param ordered: Chunks are written in order of file, else as they are parsed (IDs are not in order of file)
+    :param on_duplicate: Mode for book with equal content, see ON_DUPLICATE
+    :param progress: Function for progress reporting, gets count of imported and invalid books
+    :param library: Key of library
+    :return: Count of imported and invalid books, chunks, new genres, seconds and books per second
+    """
+    database = await libraries.open(library)
+    fmt = fmt or detect_format(path)
+    processes = processes or os.cpu_count() or 1
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+
+    result = {'books': 0, 'invalid': 0, 'chunks': 0, 'genres': 0}
+
+    # IDs of genres and authors by normalized names, authors are cached only after commit of their chunk
+    genre_ids = {normalize_text(genre['name']): genre['id'] for genre in await database.genres_get()}
+    author_ids: Dict[str, int] = dict()
+
+    async def write(books: list, invalid: int, genres: dict) -> None:
+        for key, name in genres.items():
+            if key not in genre_ids:
+                genre_ids[key] = await database.genres_create(name=name)
+                result['genres'] += 1
+
+        new_authors: Dict[str, int] = dict()
+
+        async def add() -> None:
+            new_authors.clear()
+            for book in books:
+                key = book['author_key']
+                book['author_id'] = author_ids.get(key) or new_authors.get(key)
+                if book['author_id'] is None:
+                    book['author_id'] = new_authors[key] = await database.authors_create(book['author'], key=key)
+
+            books_id = await database.books_create_many(books, on_duplicate=on_duplicate)
+            await database.book_genre_link_many([(book_id, genre_ids[key])
+                                                 for book_id, book in zip(books_id, books) for key in book['genres']])
+
+        await database.run_in_transaction(add)
+        author_ids.update(new_authors)
+
+        result['books'] += len(books)
+        result['invalid'] += invalid
+        result['chunks'] += 1
+        if progress is not None:
+            progress(result['books'], result['invalid'])
+
+    # Fix for forking of process with threads of database drivers, workers are started by spawn
+    executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'))
+    chunks = read_chunks(path, fmt, chunk_size)
+    # Parsed chunks in order of file (ordered) or as set of futures, at most two chunks per process
+    pending = deque() if ordered else set()
+    writing: Optional[asyncio.Task] = None
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is not None:
+                future = loop.run_in_executor(executor, prepare_books, chunk[1], fmt, chunk[0])
+                if ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+                if len(pending) < processes * 2:
+                    continue
+            elif not pending:
+                break
+
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending -= done
+
+            for future in done:
+                parsed = await future
+                # One writer, next chunk is written after previous one, while workers parse next chunks
+                if writing is not None:
+                    await writing
+                writing = loop.create_task(write(*parsed))
+
+        if writing is not None:
+            await writing
+    finally:
+        if writing is not None and not writing.done():
+            writing.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        chunks.close()
+
+    result['seconds'] = time.perf_counter() - started
+    result['books_per_second'] = result['books'] / result['seconds'] if result['seconds'] else 0.0
+    return result
+
+
+async def books_dedup(batch_size: int = 1000, progress: Callable[[int, int], None] = None,
+                      library: str = None) -> dict:
+    """
+    Merging duplicate books
+    :param batch_size: Count of IDs in one batch
+    :param progress: Function for progress reporting
+    :param library: Key of library
+    :return: Count of checked and merged books
+    """
+    database = await libraries.open(library)
+    return await database.books_dedup(batch_size=batch_size, progress=progress)
+
+
+async def books_compress(compress: bool = True, batch_size: int = 1000,
+                         progress: Callable[[int, int], None] = None, library: str = None) -> dict:
+    """
+    Compressing or decompressing existing descriptions
+    :param compress: Compressing, else decompressing
+    :param batch_size: Count of IDs in one batch
+    :param progress: Function for progress reporting
+    :param library: Key of library
+    :return: Count of checked and changed books
     """
-    book_id = await db.books_create(title=title, author=author, description=description)
+    database = await libraries.open(library)
+    return await database.books_compress(compress=compress, batch_size=batch_size, progress=progress)
 
-    for genre_id in genres_id:
-        await db.book_genre_create(book_id=book_id, genre_id=genre_id)
 
-    return book_id
+async def descriptions_report(library: str = None) -> dict:
+    """
+    Report of size and reading time of descriptions
+    :param library: Key of library
+    :return: Report, see Database.descriptions_report
+    """
+    database = await libraries.open(library)
+    return await database.descriptions_report()
 
 
-async def books_delete(_id: int):
+async def books_delete(_id: int, library: str = None):
     """
     Delete book
     :param _id: Row ID
+    :param library: Key of library
     :return:
     """
-    await db.books_delete(_id=_id)
+    database = await libraries.open(library)
+
+    async def remove() -> None:
+        # Links are deleted first, they are referencing the book
+        book_genres = await database.book_genre_get(book_id=_id)
+        for book_genre in book_genres:
+            await database.book_genre_delete(_id=book_genre['id'])
+
+        await database.books_delete(_id=_id)
+
+    await database.run_in_transaction(remove)
+
+
+async def books_by_author(author_id: int = None, name: str = None, library: str = None):
+    """
+    Get books of author
+    :param author_id: ID of author
+    :param name: Name of author
+    :param library: Key of library
+    :return: Rows
+    """
+    database = await libraries.open(library)
+    return await database.books_by_author(author_id=author_id, name=name)
+
+
+# [[ STATISTICS ]]
+async def stats_get(top: int = 10, library: str = None) -> dict:
+    """
+    Get statistics of catalog
+    :param top: Count of authors with most books
+    :param library: Key of library
+    :return: Count of books, genres and top authors with count of books
+    """
+    database = await libraries.open(library)
+    return await database.stats_get(top=top)
+
+
+async def stats_recompute(library: str = None) -> dict:
+    """
+    Recompute counters of statistics
+    :param library: Key of library
+    :return: Count of counters and count of fixed counters
+    """
+    database = await libraries.open(library)
+    return await database.stats_recompute()
+
 
-    book_genres = await db.book_genre_get(book_id=_id)
-    for book_genre in book_genres:
-        await db.book_genre_delete(_id=book_genre['id'])
+# [[ AUTHORS ]]
+async def authors_get(_id: int = None, name: str = None, library: str = None):
+    """
+    Get authors with count of their books
+    :param _id: Row ID
+    :param name: Beginning of author name
+    :param library: Key of library
+    :return: Row or Rows
+    """
+    database = await libraries.open(library)
+    return await database.authors_get(_id=_id, name=name)
 
 
 # [[ GENRES ]]
-async def genres_get(_id: int = None, name: str = None):
+async def genres_get(_id: int = None, name: str = None, library: str = None):
     """
     Get genre
     :param _id: Row ID
     :param name: Name of genre
+    :param library: Key of library
     :return: Row or Rows
     """
-    return await db.genres_get(_id=_id, name=name)
+    database = await libraries.open(library)
+    return await database.genres_get(_id=_id, name=name)
+
+
+async def genres_get_many(ids: Sequence[int], library: str = None):
+    """
+    Get genres by IDs
+    :param ids: Row IDs
+    :param library: Key of library
+    :return: Rows
+    """
+    database = await libraries.open(library)
+    return await database.get_many_by_ids(Genres, ids)
 
 
-async def genres_add(name: str):
+async def genres_add(name: str, library: str = None):
     """
     Add new genre
     :param name: Name of genre
+    :param library: Key of library
     :return: Row ID
     """
-    return await db.genres_create(name=name)
+    database = await libraries.open(library)
+    return await database.genres_create(name=name)
+
+
+async def genres_delete(_id: int, library: str = None):
+    """
+    Delete genre
+    :param _id: Row ID
+    :param library: Key of library
+    :return:
+    """
+    database = await libraries.open(library)
+
+    async def remove() -> None:
+        # Links are deleted first, they are referencing the genre
+        book_genres = await database.book_genre_get(genre_id=_id)
+        for book_genre in book_genres:
+            await database.book_genre_delete(_id=book_genre['id'])
+
+        await database.genres_delete(_id=_id)
+
+    await database.run_in_transaction(remove)
 
 
 # [[ BOOK GENRE ]]
-async def book_genre_get(book_id: int):
+async def book_genre_get(book_id: int, library: str = None):
     """
     Get book genre
     :param book_id: Row ID of book
+    :param library: Key of library
     :return: Row or Rows
     """
-    return await db.book_genre_get(book_id=book_id)
+    database = await libraries.open(library)
+    return await database.book_genre_get(book_id=book_id)
+
+
+async def assign_genre(genre_id: int, book_ids: Sequence[int], library: str = None) -> int:
+    """
+    Add genre to many books by one transaction
+    :param genre_id: Row ID of genre
+    :param book_ids: Row IDs of books, books which have this genre already are skipped
+    :param library: Key of library
+    :return: Count of new links
+    """
+    database = await libraries.open(library)
+    return await database.book_genre_assign(genre_id=genre_id, books_id=book_ids)
+
+
+async def remove_genre(genre_id: int, book_ids: Sequence[int], library: str = None) -> int:
+    """
+    Remove genre from many books by one transaction
+    :param genre_id: Row ID of genre
+    :param book_ids: Row IDs of books
+    :param library: Key of library
+    :return: Count of removed links
+    """
+    database = await libraries.open(library)
+    return await database.book_genre_remove(genre_id=genre_id, books_id=book_ids)
+
+
+async def set_book_genres(book_id: int, genre_ids: Sequence[int], library: str = None) -> dict:
+    """
+    Set genres of book, only difference with current genres is written
+    :param book_id: Row ID of book
+    :param genre_ids: Row IDs of genres
+    :param library: Key of library
+    :return: Count of added and removed links
+    """
+    database = await libraries.open(library)
+    return await database.book_genre_set(book_id=book_id, genres_id=genre_ids)
@@ -0,0 +1,178 @@
+# [[ NATIVE ]]
+from typing import Iterator, Sequence, Tuple, List
+import unicodedata
+import hashlib
+import json
+import csv
+import os
+
+
+# Formats of source files, format is detected by extension
+FORMATS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+
+# Fields of book in source file, genres are names separated by GENRES_SEPARATOR (CSV) or list (JSON lines)
+FIELDS = ('title', 'author', 'description', 'genres')
+GENRES_SEPARATOR = ';'
+
+
+def detect_format(path: str) -> str:
+    """
+    Detecting format of source file by extension
+    :param path: Path of file
+    :return: Format
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError('Unknown format of {}, expected one of {}'.format(path, ', '.join(FORMATS)))
+    return FORMATS[extension]
+
+
+def read_chunks(path: str, fmt: str, chunk_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+    """
+    Reading source file by chunks of lines, lines are parsed by workers, see parse_records()
+    Chunk ends only at end of record, so quoted CSV field with line breaks is not split
+    :param path: Path of file
+    :param fmt: Format of file
+    :param chunk_size: Count of records in chunk
+    :return: Names of CSV columns (empty for JSON lines) and lines of chunk
+    """
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        fields: List[str] = list()
+        if fmt == 'csv':
+            fields = [name.strip().lower() for name in next(csv.reader([file.readline()]), [])]
+
+        lines: List[str] = list()
+        records = 0
+        quoted = False
+        for line in file:
+            lines.append(line)
+            # Escaped quote is doubled, so odd count of quotes opens or closes quoted field
+            if fmt == 'csv' and line.count('"') % 2:
+                quoted = not quoted
+            if quoted:
+                continue
+
+            records += 1
+            if records >= chunk_size:
+                yield fields, lines
+                lines = list()
+                records = 0
+
+        if lines:
+            yield fields, lines
+
+
+def parse_records(lines: Sequence[str], fmt: str, fields: Sequence[str]) -> Tuple[list, int]:
+    """
+    Parsing lines of chunk into records, invalid records are skipped
+    :param lines: Lines of chunk
+    :param fmt: Format of file
+    :param fields: Names of CSV columns
+    :return: Records with FIELDS (genres as list of names) and count of invalid records
+    """
+    records = list()
+    invalid = 0
+
+    if fmt == 'csv':
+        rows = (dict(zip(fields, row)) for row in csv.reader(lines) if row)
+    else:
+        rows = list()
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                invalid += 1
+
+    for row in rows:
+        if not isinstance(row, dict) or not all(isinstance(row.get(name), str) for name in FIELDS[:3]):
+            invalid += 1
+            continue
+
+        genres = row.get('genres') or list()
+        if isinstance(genres, str):
+            genres = genres.split(GENRES_SEPARATOR)
+        records.append({'title': row['title'], 'author': row['author'], 'description': row['description'],
+                        'genres': [str(genre) for genre in genres]})
+
+    return records, invalid
+
+
+def normalize_text(value: str) -> str:
+    """
+    Normalizing text for comparison: Unicode form, case and whitespace
+    :param value: Text
+    :return: Normalized text
+    """
+    return ' '.join(unicodedata.normalize('NFKC', value).casefold().split())
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalized name of author, it is limited by length of indexed column
+    :param name: Name of author
+    :return: Key of author
+    """
+    return normalize_text(name)[:255]
+
+
+def book_hash(title: str, author: str, description: str) -> str:
+    """
+    Hash of normalized content of book, books with equal hash are duplicates
+    Case, Unicode forms and whitespace are not taken into account
+    :param title: Title of book
+    :param author: Author of book
+    :param description: Description of book
+    :return: SHA-256 in hex
+    """
+    parts = (normalize_text(value) for value in (title, author, description))
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def clean_text(value: str) -> str:
+    """
+    Cleaning imported text: Unicode form and whitespace around text
+    :param value: Text
+    :return: Cleaned text
+    """
+    return unicodedata.normalize('NFC', value).strip()
+
+
+def prepare_books(lines: Sequence[str], fmt: str, fields: Sequence[str]) -> tuple:
+    """
+    Parsing and normalizing chunk of source file, it is run by worker processes of books_import()
+    Everything, which does not need database, is done here: cleaning, content hash, keys of author and genres
+    :param lines: Lines of chunk
+    :param fmt: Format of file
+    :param fields: Names of CSV columns
+    :return: Books, count of invalid records and names of genres by their keys
+    """
+    records, invalid = parse_records(lines, fmt, fields)
+
+    books = list()
+    genres = dict()
+    for record in records:
+        title, author, description = (clean_text(record[name]) for name in ('title', 'author', 'description'))
+        if not title or not author:
+            invalid += 1
+            continue
+
+        # Genres are resolved by normalized names, first spelling is used for new genre
+        genre_keys = list()
+        for name in record['genres']:
+            name = ' '.join(clean_text(name).split())
+            key = normalize_text(name)
+            if key and key not in genre_keys:
+                genre_keys.append(key)
+                genres.setdefault(key, name)
+
+        books.append({'title': title, 'author': author, 'description': description,
+                      'content_hash': book_hash(title, author, description), 'author_key': normalize_name(author),
+                      'genres': genre_keys})
+
+    return books, invalid, genres
@@ -0,0 +1,14 @@
+# [[ NATIVE ]]
+from typing import List
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Percentile of sorted values
+    :param values: Sorted values
+    :param percent: Percent from 0 to 100
+    :return: Value
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
@@ -0,0 +1,260 @@
+# [[ NATIVE ]]
+from typing import Dict, List, Callable, Awaitable
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+import argparse
+import tempfile
+import logging
+import asyncio
+import random
+import time
+import sys
+import os
+
+# [[ DATABASE ]]
+import database as db
+
+# [[ LATENCY ]]
+from latency import percentile
+
+# [[ SETTINGS ]]
+from settings import DBType
+
+
+def is_lock_error(exc: BaseException) -> bool:
+    """
+    Checking if error is caused by lock of database
+    :param exc: Exception
+    :return: Error is lock wait, busy database or deadlock
+    """
+    orig = getattr(exc, 'orig', exc)
+    code = orig.args[0] if orig.args and isinstance(orig.args[0], int) else None
+    message = str(orig).lower()
+    return code in (1205, 1213) or 'locked' in message or 'busy' in message or 'deadlock' in message
+
+
+class Worker:
+    """
+    Client of database, running random operations by mix
+    """
+    def __init__(self, mix: Dict[str, int], books: int, genres: int, retries: int, seed: int):
+        self.mix = mix
+        self.books = books
+        self.genres = genres
+        self.retries = retries
+        self.random = random.Random(seed)
+
+        # Statistics
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.lock_errors = 0
+        self.retried = 0
+
+        self.operations: Dict[str, Callable[[], Awaitable]] = {
+            'books_get': self.books_get,
+            'books_add': self.books_add,
+            'books_delete': self.books_delete,
+            'genres_get': self.genres_get,
+        }
+
+    async def books_get(self) -> None:
+        if self.random.random() < 0.5:
+            await db.books_get(_id=self.random.randint(1, self.books))
+        else:
+            search = str(self.random.randint(0, 99))
+            await db.books_get(title=search, author=search)
+
+    async def books_add(self) -> None:
+        number = self.random.randint(0, 10 ** 9)
+        genres_id = self.random.sample(range(1, self.genres + 1), k=min(2, self.genres))
+        await db.books_add(title='Title {}'.format(number), author='Author {}'.format(number % 1000),
+                           description='Description {}'.format(number), genres_id=genres_id)
+
+    async def books_delete(self) -> None:
+        await db.books_delete(_id=self.random.randint(1, self.books))
+
+    async def genres_get(self) -> None:
+        if self.random.random() < 0.5:
+            await db.genres_get(_id=self.random.randint(1, self.genres))
+        else:
+            await db.genres_get()
+
+    async def run(self, deadline: float) -> None:
+        """
+        Running operations until deadline
+        :param deadline: Time of finish by time.perf_counter
+        :return:
+        """
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+
+        while time.perf_counter() < deadline:
+            name = self.random.choices(names, weights)[0]
+            started = time.perf_counter()
+
+            for attempt in range(self.retries + 1):
+                try:
+                    await self.operations[name]()
+                except Exception as exc:
+                    if is_lock_error(exc):
+                        self.lock_errors += 1
+                        if attempt < self.retries:
+                            self.retried += 1
+                            await asyncio.sleep(0.01 * 2 ** attempt)
+                            continue
+                    self.errors[name] += 1
+                    break
+                else:
+                    self.latencies[name].append(time.perf_counter() - started)
+                    break
+
+
+async def run_process(args: dict, process: int) -> dict:
+    """
+    Running coroutines of one process
+    :param args: Arguments of load test
+    :param process: Number of process
+    :return: Statistics
+    """
+    db.db.db_type = args['db_type']
+    db.db.db_name = args['db_name']
+    if args['write_queue']:
+        db.db.enable_write_queue()
+
+    deadline = time.perf_counter() + args['duration']
+    workers = [Worker(args['mix'], args['books'], args['genres'], args['retries'], seed=process * 1000 + i)
+               for i in range(args['coroutines'])]
+    await asyncio.gather(*(worker.run(deadline) for worker in workers))
+
+    stats = {'latencies': defaultdict(list), 'errors': defaultdict(int), 'lock_errors': 0, 'retried': 0}
+    for worker in workers:
+        for name, values in worker.latencies.items():
+            stats['latencies'][name] += values
+        for name, value in worker.errors.items():
+            stats['errors'][name] += value
+        stats['lock_errors'] += worker.lock_errors
+        stats['retried'] += worker.retried
+    stats['db_retries'] = sum(db.db.retries.values())
+    return {key: dict(value) if isinstance(value, defaultdict) else value for key, value in stats.items()}
+
+
+def process_main(args: dict, process: int) -> dict:
+    """
+    Entry point of worker process
+    :param args: Arguments of load test
+    :param process: Number of process
+    :return: Statistics
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    return asyncio.run(run_process(args, process))
+
+
+async def seed(books: int, genres: int) -> None:
+    """
+    Creating tables and filling database
+    :param books: Count of books
+    :param genres: Count of genres
+    :return:
+    """
+    await db.db.initialize()
+
+    async with db.transaction():
+        for i in range(genres):
+            await db.genres_add(name='Genre {}'.format(i))
+
+        for i in range(books):
+            book_id = await db.db.books_create(title='Title {}'.format(i), author='Author {}'.format(i % 1000),
+                                               description='Description {}'.format(i))
+            await db.db.book_genre_create(book_id=book_id, genre_id=i % genres + 1)
+
+
+def report(stats: List[dict], elapsed: float) -> None:
+    """
+    Printing results of load test
+    :param stats: Statistics of processes
+    :param elapsed: Duration in seconds
+    :return:
+    """
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    for item in stats:
+        for name, values in item['latencies'].items():
+            latencies[name] += values
+        for name, value in item['errors'].items():
+            errors[name] += value
+
+    print('{:<14} {:>8} {:>9} {:>9} {:>9} {:>9} {:>7}'.format('operation', 'count', 'ops/s', 'p50 ms', 'p95 ms',
+                                                              'p99 ms', 'errors'))
+    total = 0
+    for name in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies[name])
+        total += len(values)
+        print('{:<14} {:>8} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>7}'.format(
+            name, len(values), len(values) / elapsed, percentile(values, 50) * 1000, percentile(values, 95) * 1000,
+            percentile(values, 99) * 1000, errors[name]))
+
+    print('\nTotal: {} operations, {:.1f} ops/s, {} lock errors, {} retries, {} retries in database'.format(
+        total, total / elapsed, sum(item['lock_errors'] for item in stats), sum(item['retried'] for item in stats),
+        sum(item['db_retries'] for item in stats)))
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """
+    Parsing mix of operations, like "books_get=70,books_add=10"
+    :param value: Text of mix
+    :return: Weights by operations
+    """
+    mix = dict()
+    for item in value.split(','):
+        name, weight = item.split('=')
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+def main() -> None:
+    """
+    Parsing arguments and running load test
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Load test of library database')
+    parser.add_argument('--mix', type=parse_mix, default='books_get=60,books_add=15,books_delete=5,genres_get=20',
+                        help='weights of operations: books_get, books_add, books_delete, genres_get')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--coroutines', type=int, default=8, help='coroutines in every process')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--books', type=int, default=10000, help='count of seeded books')
+    parser.add_argument('--genres', type=int, default=20, help='count of seeded genres')
+    parser.add_argument('--retries', type=int, default=3, help='retries after lock errors')
+    parser.add_argument('--no-seed', action='store_true', help='use existing database from settings')
+    parser.add_argument('--write-queue', action='store_true', help='save writes by group commits of write queue')
+    args = parser.parse_args()
+
+    # Fix for Windows
+    if sys.platform in ('win32', 'cygwin',):
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # SQLite database is seeded in temporary directory
+        if not args.no_seed:
+            if db.db.db_type == DBType.SQLITE:
+                os.chdir(directory)
+                db.db.db_name = 'loadtest'
+            print('Seeding {} books, {} genres'.format(args.books, args.genres))
+            asyncio.run(seed(args.books, args.genres))
+
+        process_args = {'db_type': db.db.db_type, 'db_name': db.db.db_name, 'mix': args.mix,
+                        'duration': args.duration, 'coroutines': args.coroutines, 'books': args.books,
+                        'genres': args.genres, 'retries': args.retries, 'write_queue': args.write_queue}
+
+        print('Running {} processes x {} coroutines for {}s'.format(args.processes, args.coroutines, args.duration))
+        with ProcessPoolExecutor(args.processes) as executor:
+            stats = list(executor.map(process_main, [process_args] * args.processes, range(args.processes)))
+
+        os.chdir(cwd)
+
+    report(stats, args.duration)
+
+
+if __name__ == '__main__':
+    main()
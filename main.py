@@ -1,14 +1,30 @@
 # [[ NATIVE ]]
-from typing import Sequence, Union
+from typing import Sequence, Union, Optional, Any
+from collections import OrderedDict
+import threading
 import asyncio
+import logging
+import time
 import sys
+import os
+
+# Start time of application, for startup timing report
+START_TIME = time.perf_counter()
+
+# Profiling mode, flag is removed before Kivy parses arguments of command line
+PROFILE = '--profile' in sys.argv
+if PROFILE:
+    sys.argv.remove('--profile')
 
 # [[ KIVY ]]
 import kivy
 
 from kivy.app import App
+from kivy.clock import Clock
 
 from kivy.core.window import Window
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics.texture import Texture
 
 # [[ KIVY . LAYOUTS ]]
 from kivy.uix.gridlayout import GridLayout
@@ -23,11 +39,21 @@ from kivy.uix.dropdown import DropDown
 from kivy.uix.button import Button
 from kivy.uix.widget import Widget
 from kivy.uix.label import Label
+from kivy.uix.image import Image
 from kivy.uix.popup import Popup
 
 # [[ DATABASE ]]
 import database as db
 
+# [[ SNAPSHOT ]]
+from snapshot import Snapshot
+
+# [[ PROFILING ]]
+import profiling
+
+# [[ SETTINGS ]]
+from settings import DB_SNAPSHOT
+
 # [[ CODE ]]
 kivy.require('2.3.0')
 
@@ -37,56 +63,260 @@ Window.size = (800, 400)
 Window.minimum_width, Window.minimum_height = (800, 400)
 Window.clearcolor = (0.15, 0.1, 0.25, 1)
 
+# [[ SORTING ]]
+# Sorting of books list: name in menu -> order and descending for db.books_get
+BOOKS_SORT = {
+    'Oldest': ('id', False),
+    'Newest': ('id', True),
+    'Title A-Z': ('title', False),
+    'Title Z-A': ('title', True),
+    'Author A-Z': ('author', False),
+    'Author Z-A': ('author', True),
+}
+
+# [[ TEXT CACHES ]]
+# Count of cached lines of books list and rendered descriptions, every item holds textures in video memory
+BOOK_LINES_CACHE = 200
+DESCRIPTIONS_CACHE = 20
+
+# Width of description in ViewBookDialog
+DESCRIPTION_WIDTH = 360
+
+# [[ STARTUP TIMINGS ]]
+startup_timings = {'import': time.perf_counter() - START_TIME}
+
+
+def next_frame(callback) -> None:
+    """
+    Calling function after next frame is drawn
+    :param callback: Function without arguments
+    :return:
+    """
+    def on_flip(instance: Window) -> None:
+        Window.unbind(on_flip=on_flip)
+        callback()
+
+    Window.bind(on_flip=on_flip)
+
+
+# Handlers are wrapped by profiler, so it is enabled before classes are defined
+if PROFILE:
+    profiling.enable('profile', next_frame).wrap_module(db, exclude=('gather', ))
+
+
+# [[ SNAPSHOT ]]
+# Snapshot of catalog, it is shown while database is started in background, None when database is ready
+snapshot: Optional[Snapshot] = None
+warm_up: Optional[threading.Thread] = None
+
+# Catalog is changed by application, snapshot is written again on stop
+catalog_changed = False
+
+
+def start_database() -> None:
+    """
+    Starting database (migrations, etc.) in own event loop of background thread
+    Engine of this loop is closed, engine of application loop is created by first query
+    :return:
+    """
+    async def start() -> None:
+        await db.db.initialize()
+        await db.db.close()
+
+    try:
+        asyncio.run(start())
+    except Exception:
+        logging.exception('Database is not started in background')
+
+
+def wait_database() -> bool:
+    """
+    Waiting for database started in background, snapshot is closed after it
+    :return: Database was not ready before
+    """
+    global snapshot, warm_up
+    if warm_up is None:
+        return False
+
+    warm_up.join()
+    warm_up = None
+    if snapshot is not None:
+        snapshot.close()
+        snapshot = None
+    return True
+
+
+# Event loop of application, engine of database is bound to it, so the same loop runs all queries
+loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def run(coro):
+    """
+    Running coroutine in event loop of application, database engine is created once for this loop
+    :param coro: Coroutine
+    :return: Result of coroutine
+    """
+    global loop
+    wait_database()
+
+    # Loop is created once at start, see __main__
+    if loop is None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    return loop.run_until_complete(coro)
+
+
+def run_change(coro):
+    """
+    Running coroutine, which changes catalog, see run()
+    :param coro: Coroutine
+    :return: Result of coroutine
+    """
+    global catalog_changed
+    catalog_changed = True
+    return run(coro)
+
+
+def genres_get(name: str = None) -> list:
+    """
+    Getting genres from snapshot while database is started, else from database
+    :param name: Name of genre
+    :return: Rows
+    """
+    if snapshot is not None:
+        return snapshot.genres_get(name=name)
+    return run(db.genres_get(name=name))
+
+
+class LRUCache:
+    """
+    Cache with limited count of items, least recently used item is removed first
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.items: OrderedDict = OrderedDict()
+
+    def get(self, key: tuple) -> Any:
+        """
+        Getting item
+        :param key: Key of item
+        :return: Item or None
+        """
+        item = self.items.get(key)
+        if item is not None:
+            self.items.move_to_end(key)
+        return item
+
+    def put(self, key: tuple, item: Any) -> Any:
+        """
+        Adding item
+        :param key: Key of item
+        :param item: Item
+        :return: Item
+        """
+        self.items[key] = item
+        self.items.move_to_end(key)
+        if len(self.items) > self.size:
+            self.items.popitem(last=False)
+        return item
+
+
+def render_text(text: str, width: int, **options) -> Texture:
+    """
+    Rendering text with wrapping by width, height of texture is height of text layout
+    :param text: Text
+    :param width: Width of text
+    :param options: Options of label, like halign
+    :return: Texture
+    """
+    label = CoreLabel(text=text, text_size=(width, None), **options)
+    label.refresh()
+    return label.texture
+
+
+def book_version(book: dict) -> int:
+    """
+    Version of shown text of book, content hash is not used, because it does not see changes of case
+    :param book: Row of book from database
+    :return: Version
+    """
+    return hash((book['title'], book['author'], book.get('description')))
+
+
+# Lines of books list by ID and version of book, lines are reused with their rendered labels
+book_lines = LRUCache(BOOK_LINES_CACHE)
+
+# Rendered descriptions by ID and version of book
+descriptions = LRUCache(DESCRIPTIONS_CACHE)
+
 
 # [[ OBJECTS ]]
 class ViewBookDialog(Popup):
     """
-    Window for view information about book
+    Window for view information about book, one window is used for all books
     """
-    def __init__(self, main_widget: 'BookLine', **kwargs):
+    def __init__(self, **kwargs):
         super(ViewBookDialog, self).__init__(**kwargs)
 
         # Setting up layout
-        self.title = main_widget.title
         self.content = BoxLayout(orientation='vertical')
-        self.text_content = BoxLayout(orientation='vertical',
-                                      size_hint_y=None,
-                                      height=(len(main_widget.description) // 40) * 33)
+        self.text_content = BoxLayout(orientation='vertical', size_hint_y=None)
         self.container = ScrollView(do_scroll_y=True, do_scroll_x=False)
         self.size_hint = (None, None)
         self.size = (400, 400)
 
-        # Fix height if description is small
-        if self.text_content.height < 150:
-            self.text_content.height = 150
-
         # Declaring UI objects
-        self.label_author = Label(text='Author: ' + main_widget.author,
-                                  size_hint_max_y=35,
+        self.label_author = Label(size_hint_y=None,
+                                  height=35,
                                   halign='left',
                                   valign='middle')
-        self.label_genres = Label(text='Genres: ' + main_widget.genres,
-                                  size_hint_max_y=35,
+        self.label_genres = Label(size_hint_y=None,
+                                  height=35,
                                   halign='left',
                                   valign='middle')
-        self.label_description = Label(text='Description:\n' + main_widget.description,
-                                       halign='left',
-                                       valign='top')
+        # Description is drawn from cached texture, see show()
+        self.image_description = Image(size_hint=(None, None))
 
         # Fix for labels, it needed for correct work left align
         self.label_author.bind(size=self.label_author.setter('text_size'))
         self.label_genres.bind(size=self.label_genres.setter('text_size'))
-        self.label_description.bind(size=self.label_description.setter('text_size'))
 
         # Adding widgets to layout
         self.text_content.add_widget(self.label_author)
         self.text_content.add_widget(self.label_genres)
-        self.text_content.add_widget(self.label_description)
+        self.text_content.add_widget(self.image_description)
         self.container.add_widget(self.text_content)
 
         self.content.add_widget(self.container)
         self.content.add_widget(Button(text='Close', on_release=self.dismiss, size_hint_max_y=50))
 
+    def show(self, book_line: 'BookLine') -> None:
+        """
+        Showing book, description is rendered once for every version of book
+        :param book_line: Line of book from books list
+        :return:
+        """
+        self.title = book_line.title
+        self.label_author.text = 'Author: ' + book_line.author
+
+        # Descriptions are not in snapshot, they are read from database
+        if book_line.description is None:
+            book_line.description = (run(db.books_get(_id=book_line.book_id)) or {}).get('description') or ''
+        self.label_genres.text = 'Genres: ' + book_line.genres
+
+        key = (book_line.book_id, book_line.version)
+        texture = descriptions.get(key) or descriptions.put(key, render_text('Description:\n' + book_line.description,
+                                                                             DESCRIPTION_WIDTH, halign='left',
+                                                                             valign='top'))
+        self.image_description.texture = texture
+        self.image_description.size = texture.size
+
+        # Height is measured by text layout
+        self.text_content.height = self.label_author.height + self.label_genres.height + texture.height
+        self.container.scroll_y = 1
+
+        self.open()
+
 
 class BookLine(ButtonBehavior, GridLayout):
     """
@@ -110,20 +340,35 @@ class BookLine(ButtonBehavior, GridLayout):
         self.genres = 'Genres'
 
         self.book_id = None
+        # Version of book text, see book_version()
+        self.version = None
 
-    async def create(self, book_id: int) -> 'BookLine':
+    async def create(self, book: dict) -> 'BookLine':
         """
         Construct line with book information
-        :param book_id: ID of book from database
+        :param book: Row of book from database
+        :return:
+        """
+        # Getting genres of book
+        genres_id = await db.book_genre_get(book_id=book['id'])
+        genres = await db.genres_get_many([row['genre_id'] for row in genres_id])
+
+        return self.fill(book, genres)
+
+    def fill(self, book: dict, genres: Sequence[dict]) -> 'BookLine':
+        """
+        Filling line with book information
+        :param book: Row of book
+        :param genres: Rows of genres of book
         :return:
         """
-        self.book_id = book_id
+        self.book_id = book['id']
+        self.version = book_version(book)
+        self.genres = ', '.join([genre['name'] for genre in genres])
 
-        # Getting information about book
-        book = await db.books_get(_id=book_id)
-        genres_id = await db.book_genre_get(book_id=book_id)
-        genres = [await db.genres_get(_id=row['genre_id']) for row in genres_id]
-        genres = ', '.join([genre['name'] for genre in genres])
+        # Labels are not changed, if line is reused from cache
+        if self.children:
+            return self
 
         # Declaring UI objects
         label_title = Label(text=book['title'], halign='left', valign='middle', font_size=24)
@@ -139,8 +384,7 @@ class BookLine(ButtonBehavior, GridLayout):
         # For access from ViewBookDialog
         self.author = book['author']
         self.title = book['title']
-        self.genres = genres
-        self.description = book['description']
+        self.description = book.get('description')
 
         # Adding widgets to layout
         self.add_widget(book_layout)
@@ -148,21 +392,23 @@ class BookLine(ButtonBehavior, GridLayout):
 
         return self
 
+    @profiling.handler('delete_book')
     def delete(self, instance: Button) -> None:
         """
         [Event] Delete book from database and update list of books from main layout
         :param instance: Button object
         :return:
         """
-        asyncio.run(db.books_delete(_id=self.book_id))
+        run_change(db.books_delete(_id=self.book_id))
         self.main_widget.main_widget.search_book()
 
+    @profiling.handler('view_book')
     def on_release(self) -> None:
         """
         [Event] Open information about book if line is clicked
         :return:
         """
-        ViewBookDialog(self).open()
+        self.main_widget.main_widget.view_dialog.show(self)
 
 
 class BooksList(GridLayout):
@@ -181,23 +427,51 @@ class BooksList(GridLayout):
 
         self.books_count = 0
 
-        asyncio.run(self.load_books())
+        self.load_books()
 
-    async def load_books(self, search_string: str = None, genre_id: int = None) -> None:
+    def load_books(self, search_string: str = None, genre_id: int = None, order: str = 'id',
+                   descending: bool = False) -> None:
         """
-        Loading books and creating BookLine for this list
+        Loading books and creating BookLine for this list, books are read from snapshot while database is started
         :param search_string: Text for search by Author or Title of book
         :param genre_id: Genre ID for search by genre
+        :param order: Sorting by id, title or author
+        :param descending: Sorting in descending order
         :return:
         """
         self.clear_widgets()
 
-        books = await db.books_get(title=search_string, author=search_string, genre_id=genre_id)
+        used = set()
+        if snapshot is not None:
+            books = snapshot.books_get(title=search_string, author=search_string, genre_id=genre_id, order=order,
+                                       descending=descending)
+            lines = [self.book_line(book, used).fill(book, snapshot.book_genres(book['id'])) for book in books]
+        else:
+            books = run(db.books_get(title=search_string, author=search_string, genre_id=genre_id, order=order,
+                                     descending=descending))
+            # Lines are loaded concurrently, but added in order of books
+            lines = run(db.gather(*(self.book_line(book, used).create(book) for book in books)))
         self.books_count = len(books)
-        for book in books:
-            book_line = await BookLine(self).create(book['id'])
+
+        for book_line in lines:
             self.add_widget(book_line)
 
+    def book_line(self, book: dict, used: set) -> BookLine:
+        """
+        Getting line of book from cache, new line is created for new book or new version of book
+        :param book: Row of book from database
+        :param used: Lines of this list, for same book twice in list, because widget can have only one parent
+        :return: Line, it is filled by create() or fill()
+        """
+        key = (book['id'], book_version(book))
+        book_line = book_lines.get(key)
+
+        if book_line is None or book_line in used:
+            book_line = book_lines.put(key, BookLine(self))
+        used.add(book_line)
+
+        return book_line
+
 
 class AddGenreDialog(Popup):
     """
@@ -241,7 +515,7 @@ class AddGenreDialog(Popup):
         self.dropdown = DropDown(on_select=self.select_genre)
         self.dropdown_btn = Button(text='Choose', on_release=self.dropdown.open, size_hint_max_y=50)
 
-        genres = asyncio.run(db.genres_get())
+        genres = genres_get()
         for genre in genres:
             btn = Button(text=genre['name'],
                          size_hint_y=None,
@@ -275,6 +549,7 @@ class AddGenreDialog(Popup):
 
         self.dismiss()
 
+    @profiling.handler('add_genre')
     def add_genre(self, instance: Button) -> None:
         """
         [Event] Add genre to new book and close popup
@@ -288,10 +563,10 @@ class AddGenreDialog(Popup):
 
         # If user entered new genre, adding this to database
         if self.textinput_genre.text:
-            self.genre_id = asyncio.run(db.genres_add(name=self.textinput_genre.text))
+            self.genre_id = run_change(db.genres_add(name=self.textinput_genre.text))
 
         # Getting genre information from database
-        genre = asyncio.run(db.genres_get(_id=self.genre_id))['name']
+        genre = run(db.genres_get(_id=self.genre_id))['name']
 
         # Refresh data for next times
         self.genre_id = None
@@ -308,7 +583,7 @@ class AddGenreDialog(Popup):
 
         # Updating dropdown, adding new genre, if it is new
         self.dropdown.clear_widgets()
-        genres = asyncio.run(db.genres_get())
+        genres = run(db.genres_get())
         for genre in genres:
             btn = Button(text=genre['name'],
                          size_hint_y=None,
@@ -368,7 +643,7 @@ class AddGenreDialog(Popup):
         if genre_name is not None:
             self.dropdown_btn.text = genre_name
 
-        self.genre_id = asyncio.run(db.genres_get(name=genre_name))[0]['id']
+        self.genre_id = run(db.genres_get(name=genre_name))[0]['id']
 
         # Disable "Add" button if user not chosen genre
         self.btn_add.disabled = False
@@ -460,6 +735,7 @@ class AddBookDialog(Popup):
         self.label_genres.text = 'Genres: '
         self.dismiss()
 
+    @profiling.handler('add_book_dialog')
     def add_book(self, instance: Button) -> None:
         """
         [Event] If user add new book
@@ -467,7 +743,8 @@ class AddBookDialog(Popup):
         :return:
         """
         # Add new book to database, and add chosen genres
-        genres_id = [asyncio.run(db.genres_get(name=genre))[0]['id'] for genre in self.genres]
+        genres = run(db.gather(*(db.genres_get(name=genre) for genre in self.genres)))
+        genres_id = [genre[0]['id'] for genre in genres]
         self.main_widget.add_book(author=self.input_author.text,
                                   title=self.input_title.text,
                                   genres_id=genres_id,
@@ -512,6 +789,44 @@ class AddBookDialog(Popup):
         self.main_widget.update()
 
 
+class StatsDialog(Popup):
+    """
+    Window with statistics of catalog
+    """
+    def __init__(self, **kwargs):
+        super(StatsDialog, self).__init__(**kwargs)
+
+        # Setting up layout
+        self.title = 'Statistics'
+        self.size_hint = (None, None)
+        self.size = (400, 400)
+        self.content = BoxLayout(orientation='vertical')
+        self.container = ScrollView(do_scroll_y=True, do_scroll_x=False)
+        self.label_stats = Label(halign='left', valign='top', size_hint_y=None, padding=(10, 10))
+
+        # Fix for label, height of text is needed for ScrollView
+        self.label_stats.bind(width=lambda instance, width: setattr(instance, 'text_size', (width, None)),
+                              texture_size=lambda instance, size: setattr(instance, 'height', size[1]))
+
+        self.container.add_widget(self.label_stats)
+        self.content.add_widget(self.container)
+        self.content.add_widget(Button(text='Close', on_release=self.dismiss, size_hint_max_y=50))
+
+    @profiling.handler('stats')
+    def on_open(self) -> None:
+        """
+        [Event] Loading statistics, it is read from counters, so it is fast for large catalog
+        :return:
+        """
+        stats = run(db.stats_get())
+
+        lines = ['Books: {}'.format(stats['books']), '', 'Genres:']
+        lines += ['    {}: {}'.format(genre['name'], genre['books']) for genre in stats['genres']]
+        lines += ['', 'Top authors:']
+        lines += ['    {}: {}'.format(author['name'], author['books']) for author in stats['authors']]
+        self.label_stats.text = '\n'.join(lines)
+
+
 class MainScreen(GridLayout):
     """
     Main layout
@@ -525,6 +840,8 @@ class MainScreen(GridLayout):
 
         # Declaring and setting up UI objects
         self.popup = AddBookDialog(self)
+        self.view_dialog = ViewBookDialog()
+        self.stats_popup = StatsDialog()
 
         self.scrollview = ScrollView(do_scroll_y=True, do_scroll_x=False)
 
@@ -535,10 +852,21 @@ class MainScreen(GridLayout):
         self.dropdown = DropDown(on_select=self.select_genre)
         self.dropdown_btn = Button(text='All', on_release=self.dropdown.open, size_hint_max_x=150)
 
+        # Sorting of books, it is done by database with indexes
+        self.sort_dropdown = DropDown(on_select=self.select_sort)
+        self.sort_btn = Button(text='Oldest', on_release=self.sort_dropdown.open, size_hint_max_x=150)
+        for sort_name in BOOKS_SORT:
+            self.sort_dropdown.add_widget(Button(text=sort_name,
+                                                 size_hint_y=None,
+                                                 height=40,
+                                                 on_release=lambda instance: self.sort_dropdown.select(instance.text)))
+
         self.text_input_search = TextInput(hint_text='Search by title or author', multiline=False, font_size=32)
         self.text_input_search.bind(text=self.search_book)
         self.panel.add_widget(self.text_input_search)
         self.panel.add_widget(self.dropdown_btn)
+        self.panel.add_widget(self.sort_btn)
+        self.panel.add_widget(Button(text='Stats', size_hint_max_x=80, on_release=self.stats_popup.open))
         self.panel.add_widget(Button(text='+', size_hint_max_x=50, on_release=self.popup.open))
 
         self.scrollview.add_widget(self.books_list)
@@ -549,6 +877,7 @@ class MainScreen(GridLayout):
 
         self.select_genre()
 
+    @profiling.handler('search_book')
     def search_book(self, instance: TextInput = None, text: str = None, genre: str = None) -> None:
         """
         Search books by Title/Author/Genre
@@ -569,10 +898,11 @@ class MainScreen(GridLayout):
         # Getting genre from dropdown if it was not passed
         if genre is None:
             genre = self.dropdown_btn.text
-        genre_id = asyncio.run(db.genres_get(name=genre))[0]['id'] if genre != 'All' else None
+        genre_id = genres_get(name=genre)[0]['id'] if genre != 'All' else None
 
         # Getting books by filters from database
-        asyncio.run(self.books_list.load_books(text or None, genre_id))
+        order, descending = BOOKS_SORT[self.sort_btn.text]
+        self.books_list.load_books(text or None, genre_id, order, descending)
 
         # Setting up height for books list, it needed for correct work ScrollView
         self.books_list.height = self.books_list.books_count * BookLine().height + \
@@ -582,6 +912,7 @@ class MainScreen(GridLayout):
         self.add_widget(self.scrollview)
         self.add_widget(self.panel)
 
+    @profiling.handler('add_book')
     def add_book(self, title: str, author: str, genres_id: Sequence[int], description: str) -> None:
         """
         Adding new book
@@ -591,9 +922,10 @@ class MainScreen(GridLayout):
         :param description: Description of book
         :return:
         """
-        asyncio.run(db.books_add(title=title, author=author, genres_id=genres_id, description=description))
+        run_change(db.books_add(title=title, author=author, genres_id=genres_id, description=description))
         self.search_book()
 
+    @profiling.handler('select_genre')
     def select_genre(self, instance: DropDown = None, genre_name: str = None) -> None:
         """
         [Event] Selecting genre in DropDown menu (filter books by genre)
@@ -608,6 +940,17 @@ class MainScreen(GridLayout):
 
         self.search_book(genre=genre_name)
 
+    @profiling.handler('select_sort')
+    def select_sort(self, instance: DropDown = None, sort_name: str = None) -> None:
+        """
+        [Event] Selecting sorting of books in DropDown menu
+        :param instance: DropDown object
+        :param sort_name: Selected value from DropDown
+        :return:
+        """
+        self.sort_btn.text = sort_name
+        self.search_book()
+
     def update(self) -> None:
         """
         Updating MainScreen layout after making changes
@@ -617,7 +960,7 @@ class MainScreen(GridLayout):
 
         # Adding genres for dropdown menu (filter books by genre)
         self.dropdown.clear_widgets()
-        genres = [{'name': 'All'}] + asyncio.run(db.genres_get())
+        genres = [{'name': 'All'}] + genres_get()
         for genre in genres:
             btn = Button(text=genre['name'],
                          size_hint_y=None,
@@ -644,13 +987,70 @@ class BooksApp(App):
         self.title = 'Library database'
         return MainScreen()
 
+    def on_start(self) -> None:
+        """
+        [Event] Application started, waiting for first frame
+        :return:
+        """
+        Window.bind(on_flip=self.on_first_paint)
+
+        if warm_up is not None:
+            Clock.schedule_interval(self.check_database, 0.1)
+
+    def check_database(self, dt: float) -> bool:
+        """
+        [Event] Checking database started in background, books list is reloaded from database when it is ready
+        :param dt: Time since last check
+        :return: False, when checking is finished
+        """
+        if warm_up is not None and warm_up.is_alive():
+            return True
+
+        wait_database()
+        logging.info('Database is ready, {:.3f}s after start'.format(time.perf_counter() - START_TIME))
+
+        # Books of snapshot can be old, e.g. if application was not closed correctly
+        self.root.select_genre(genre_name=self.root.dropdown_btn.text)
+        return False
+
+    def on_stop(self) -> None:
+        """
+        [Event] Application stopped, reporting profiles and saving snapshot for next start, if catalog is changed
+        :return:
+        """
+        if profiling.profiler is not None:
+            profiling.profiler.report()
+
+        # Snapshot of unchanged catalog is up to date, it is also written by manage.py snapshot
+        if not catalog_changed and os.path.exists(DB_SNAPSHOT):
+            return
+
+        try:
+            logging.info('Snapshot saved: {}'.format(run(db.snapshot(DB_SNAPSHOT))))
+        except Exception:
+            logging.exception('Snapshot is not saved')
+
+    def on_first_paint(self, instance: Window) -> None:
+        """
+        [Event] First frame is shown, reporting startup timings
+        :param instance: Window object
+        :return:
+        """
+        Window.unbind(on_flip=self.on_first_paint)
+
+        total = time.perf_counter() - START_TIME
+        startup_timings['first paint'] = total - sum(startup_timings.values())
+
+        logging.info('Startup: {} (total {:.3f}s)'.format(
+            ', '.join('{} {:.3f}s'.format(name, value) for name, value in startup_timings.items()), total))
+
 
 async def main() -> None:
     """
     Running asynchronous functions
     :return:
     """
-    await db.Database().initialize()
+    await db.db.initialize()
 
 
 if __name__ == '__main__':
@@ -666,14 +1066,27 @@ if __name__ == '__main__':
         # END Fix for Windows
         #################
 
-        # Creating coroutines
-        loop = asyncio.get_event_loop()
-        coro = asyncio.wait([
-            loop.create_task(main())
-        ])
-
-        # Running coroutines
-        loop.run_until_complete(coro)
+        # Catalog is shown from snapshot at once, database is started in background
+        started = time.perf_counter()
+        if os.path.exists(DB_SNAPSHOT):
+            try:
+                snapshot = Snapshot(DB_SNAPSHOT)
+            except (OSError, ValueError) as exc:
+                logging.warning('Snapshot is not opened: {}'.format(exc))
+
+        if snapshot is not None:
+            warm_up = threading.Thread(target=start_database, name='database', daemon=True)
+            warm_up.start()
+            startup_timings['snapshot'] = time.perf_counter() - started
+        else:
+            # Creating coroutines
+            coro = asyncio.wait([
+                loop.create_task(main())
+            ])
+
+            # Running coroutines
+            loop.run_until_complete(coro)
+            startup_timings['init'] = time.perf_counter() - started
     except KeyboardInterrupt:
         pass
 
@@ -0,0 +1,237 @@
+# [[ NATIVE ]]
+import argparse
+import asyncio
+import sys
+
+# [[ DATABASE ]]
+import database as db
+
+# [[ SETTINGS ]]
+from settings import DB_SNAPSHOT
+
+
+def print_progress(migration, step, done: int, total: int) -> None:
+    """
+    Printing progress of migration
+    :param migration: Migration object
+    :param step: Step of migration
+    :param done: Count of done units
+    :param total: Count of all units
+    :return:
+    """
+    percent = done / total * 100 if total else 100
+    print('[{:>3}] {}: {} {:>6.1f}% ({}/{})'.format(migration.version, migration.name, step.name, percent, done, total))
+
+
+async def migrate(args: argparse.Namespace) -> None:
+    """
+    Applying migrations
+    :param args: Arguments of command
+    :return:
+    """
+    version = await db.db.migrate(progress=print_progress)
+    print('Schema version: {}'.format(version))
+
+
+async def version(args: argparse.Namespace) -> None:
+    """
+    Showing version of schema
+    :param args: Arguments of command
+    :return:
+    """
+    print('Schema version: {} (latest {})'.format(await db.db.schema_version(), db.SCHEMA_VERSION))
+
+
+def print_pages(done: int, total: int) -> None:
+    """
+    Printing progress of backup or restore
+    :param done: Count of copied pages
+    :param total: Count of all pages
+    :return:
+    """
+    print('\r{:>6.1f}% ({}/{} pages)'.format(done / total * 100 if total else 100, done, total), end='', flush=True)
+
+
+def print_metrics(metrics: dict) -> None:
+    """
+    Printing metrics of backup or restore
+    :param metrics: Metrics
+    :return:
+    """
+    print('\n{} pages ({:.1f} MB) in {:.2f}s: {:.0f} pages/s, {:.1f} MB/s'.format(
+        metrics['pages'], metrics['bytes'] / 2 ** 20, metrics['seconds'], metrics['pages_per_second'],
+        metrics['bytes_per_second'] / 2 ** 20))
+    if 'file_bytes' in metrics:
+        print('Backup file: {:.1f} MB, compression {:.1f}x'.format(metrics['file_bytes'] / 2 ** 20,
+                                                                   metrics['compression']))
+
+
+async def backup(args: argparse.Namespace) -> None:
+    """
+    Online backup of database
+    :param args: Arguments of command
+    :return:
+    """
+    print_metrics(await db.backup(args.path, pages=args.pages, pause=args.pause, compress=args.compress,
+                                  progress=print_pages, library=args.library))
+
+
+async def restore(args: argparse.Namespace) -> None:
+    """
+    Restoring database from backup
+    :param args: Arguments of command
+    :return:
+    """
+    print_metrics(await db.restore(args.path, pages=args.pages, pause=args.pause, progress=print_pages,
+                                   library=args.library))
+
+
+async def dedup(args: argparse.Namespace) -> None:
+    """
+    Merging duplicate books
+    :param args: Arguments of command
+    :return:
+    """
+    def progress(done: int, total: int) -> None:
+        print('\r{:>6.1f}% ({}/{} IDs)'.format(done / total * 100 if total else 100, done, total), end='', flush=True)
+
+    result = await db.books_dedup(batch_size=args.batch_size, progress=progress, library=args.library)
+    print('\nChecked {checked} books, merged {merged} duplicates'.format(**result))
+
+
+async def import_books(args: argparse.Namespace) -> None:
+    """
+    Importing books from CSV or JSON lines file
+    :param args: Arguments of command
+    :return:
+    """
+    def progress(books: int, invalid: int) -> None:
+        print('\r{} books, {} invalid'.format(books, invalid), end='', flush=True)
+
+    result = await db.books_import(args.path, fmt=args.format, processes=args.processes, chunk_size=args.chunk_size,
+                                   ordered=not args.unordered, on_duplicate=args.on_duplicate, progress=progress,
+                                   library=args.library)
+    print('\nImported {books} books ({invalid} invalid, {genres} new genres) in {seconds:.1f}s, '
+          '{books_per_second:.0f} books/s'.format(**result))
+
+
+async def compress(args: argparse.Namespace) -> None:
+    """
+    Compressing existing descriptions and reporting size and reading time of descriptions
+    :param args: Arguments of command
+    :return:
+    """
+    def progress(done: int, total: int) -> None:
+        print('\r{:>6.1f}% ({}/{} IDs)'.format(done / total * 100 if total else 100, done, total), end='', flush=True)
+
+    if not args.report:
+        result = await db.books_compress(compress=not args.decompress, batch_size=args.batch_size, progress=progress,
+                                         library=args.library)
+        print('\nChecked {checked} books, changed {changed} descriptions'.format(**result))
+
+    report = await db.descriptions_report(library=args.library)
+    print('Descriptions: {} books, {} compressed'.format(report['books'], report['compressed']))
+    print('Size: {:.1f} MB plain, {:.1f} MB stored, ratio {:.2f}x'.format(
+        report['plain_bytes'] / 2 ** 20, report['stored_bytes'] / 2 ** 20, report['ratio']))
+    print('Reading: {:.3f}s, decompressing: {:.3f}s ({:.1f} us per book)'.format(
+        report['read_seconds'], report['decompress_seconds'],
+        report['decompress_seconds'] / report['books'] * 1e6 if report['books'] else 0))
+
+
+async def stats(args: argparse.Namespace) -> None:
+    """
+    Showing statistics of catalog, counters can be recomputed for consistency check
+    :param args: Arguments of command
+    :return:
+    """
+    if args.recompute:
+        result = await db.stats_recompute(library=args.library)
+        print('Recomputed {counters} counters, fixed {fixed}'.format(**result))
+
+    result = await db.stats_get(top=args.top, library=args.library)
+    print('Books: {}'.format(result['books']))
+    print('\nGenres:')
+    for genre in result['genres']:
+        print('{:>8}  {}'.format(genre['books'], genre['name']))
+    print('\nTop authors:')
+    for author in result['authors']:
+        print('{:>8}  {}'.format(author['books'], author['name']))
+
+
+async def snapshot(args: argparse.Namespace) -> None:
+    """
+    Writing snapshot of catalog for instant start of application
+    :param args: Arguments of command
+    :return:
+    """
+    result = await db.snapshot(args.path, library=args.library)
+    print('Snapshot: {} books, {} genres, {:.1f} MB'.format(result['books'], result['genres'],
+                                                            result['bytes'] / 2 ** 20))
+
+
+def main() -> None:
+    """
+    Parsing arguments and running command
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Managing library database')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('migrate', help='apply migrations, interrupted migration continues').set_defaults(func=migrate)
+    commands.add_parser('version', help='show version of schema').set_defaults(func=version)
+
+    for name, func, help_text in (('backup', backup, 'online backup of SQLite database'),
+                                  ('restore', restore, 'restore SQLite database from backup')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('path', help='path of backup')
+        command.add_argument('--pages', type=int, default=100, help='pages copied in one step')
+        command.add_argument('--pause', type=float, default=0.005, help='sleep between steps in seconds')
+        command.add_argument('--library', help='key of branch library')
+        if name == 'backup':
+            command.add_argument('--compress', action='store_true', help='compress backup by gzip')
+        command.set_defaults(func=func)
+
+    command = commands.add_parser('dedup', help='merge duplicate books, which have no content hash yet')
+    command.add_argument('--batch-size', type=int, default=1000, help='IDs committed in one transaction')
+    command.add_argument('--library', help='key of branch library')
+    command.set_defaults(func=dedup)
+
+    command = commands.add_parser('import', help='import books from CSV or JSON lines file')
+    command.add_argument('path', help='path of file, columns: title, author, description, genres (separated by ;)')
+    command.add_argument('--format', choices=('csv', 'jsonl'), help='format of file, detected by extension')
+    command.add_argument('--processes', type=int, help='worker processes for parsing, count of CPUs by default')
+    command.add_argument('--chunk-size', type=int, default=1000, help='books parsed and committed together')
+    command.add_argument('--unordered', action='store_true', help='write chunks as they are parsed')
+    command.add_argument('--on-duplicate', choices=db.ON_DUPLICATE, default='skip', help='mode for duplicate books')
+    command.add_argument('--library', help='key of branch library')
+    command.set_defaults(func=import_books)
+
+    command = commands.add_parser('compress', help='compress existing descriptions and report their size')
+    command.add_argument('--decompress', action='store_true', help='decompress descriptions instead')
+    command.add_argument('--report', action='store_true', help='only report size and reading time')
+    command.add_argument('--batch-size', type=int, default=1000, help='IDs committed in one transaction')
+    command.add_argument('--library', help='key of branch library')
+    command.set_defaults(func=compress)
+
+    command = commands.add_parser('stats', help='show statistics of catalog')
+    command.add_argument('--recompute', action='store_true', help='recompute counters by counting rows')
+    command.add_argument('--top', type=int, default=10, help='count of top authors')
+    command.add_argument('--library', help='key of branch library')
+    command.set_defaults(func=stats)
+
+    command = commands.add_parser('snapshot', help='write read-only snapshot of catalog for instant start')
+    command.add_argument('path', nargs='?', default=DB_SNAPSHOT, help='path of snapshot')
+    command.add_argument('--library', help='key of branch library')
+    command.set_defaults(func=snapshot)
+
+    args = parser.parse_args()
+
+    # Fix for Windows
+    if sys.platform in ('win32', 'cygwin',):
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    asyncio.run(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
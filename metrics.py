@@ -0,0 +1,308 @@
+# [[ NATIVE ]]
+from typing import Sequence, Callable, Dict, Tuple
+from bisect import bisect_left
+import logging
+import asyncio
+import os
+
+
+# Upper bounds of latency buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    """
+    Formatting labels of sample in Prometheus text format
+    :param names: Names of labels
+    :param values: Values of labels
+    :param extra: Additional label, already formatted (e.g. le of histogram)
+    :return: Labels in braces, or empty string if there are no labels
+    """
+    labels = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+              for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def format_value(value: float) -> str:
+    """
+    Formatting value of sample
+    :param value: Value
+    :return: Value as text
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Metric with labels, values are kept by tuples of label values
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        """
+        :param name: Name of metric
+        :param description: Help text
+        :param labels: Names of labels
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+
+    def samples(self) -> list:
+        """
+        Samples of metric
+        :return: Lines of Prometheus text format without help and type
+        """
+        return list()
+
+    def render(self) -> str:
+        """
+        Metric in Prometheus text format
+        :return: Text
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.description), '# TYPE {} {}'.format(self.name, self.kind)]
+        return '\n'.join(lines + self.samples()) + '\n'
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super(Counter, self).__init__(name, description, labels)
+        self.values: Dict[tuple, float] = dict()
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        """
+        Increasing value
+        :param labels: Values of labels, in order of names
+        :param amount: Increment
+        :return:
+        """
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> list:
+        return ['{}{} {}'.format(self.name, format_labels(self.labels, labels), format_value(value))
+                for labels, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    """
+    Distribution of values by buckets, with sum and count
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+        # Counts by buckets (not cumulative, last one is +Inf) and sum of values
+        self.values: Dict[tuple, Tuple[list, list]] = dict()
+
+    def observe(self, labels: tuple, value: float) -> None:
+        """
+        Adding value
+        :param labels: Values of labels, in order of names
+        :param value: Value, e.g. latency in seconds
+        :return:
+        """
+        item = self.values.get(labels)
+        if item is None:
+            item = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        item[0][bisect_left(self.buckets, value)] += 1
+        item[1][0] += value
+
+    def samples(self) -> list:
+        lines = list()
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, format_labels(self.labels, labels, 'le="{}"'.format(format_value(bound))), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, format_labels(self.labels, labels), format_value(total[0])))
+            lines.append('{}_count{} {}'.format(self.name, format_labels(self.labels, labels), cumulative))
+        return lines
+
+
+class Gauge(Metric):
+    """
+    Current value, collected by function at export
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 collect: Callable[[], Dict[tuple, float]] = None):
+        """
+        :param collect: Function returning values by tuples of label values
+        """
+        super(Gauge, self).__init__(name, description, labels)
+        self.collect = collect or dict
+
+    def samples(self) -> list:
+        return ['{}{} {}'.format(self.name, format_labels(self.labels, labels), format_value(value))
+                for labels, value in sorted(self.collect().items())]
+
+
+class Registry:
+    """
+    Registry of metrics with export in Prometheus text format to file or HTTP endpoint
+    Callers check enabled before measuring, so disabled metrics cost one attribute lookup
+    """
+    def __init__(self, enabled: bool = False, path: str = None, interval: float = 15.0,
+                 host: str = '127.0.0.1', port: int = None):
+        """
+        :param enabled: Collecting metrics
+        :param path: File for export, written every interval seconds
+        :param interval: Interval of writing file in seconds
+        :param host: Host of HTTP endpoint
+        :param port: Port of HTTP endpoint, None for no endpoint
+        """
+        self.enabled = enabled
+        self.path = path
+        self.interval = interval
+        self.host = host
+        self.port = port
+
+        self.metrics: Dict[str, Metric] = dict()
+
+        # Exporters are bound to event loop
+        self.__loop = None
+        self.__tasks: list = list()
+
+    def add(self, metric: Metric) -> Metric:
+        """
+        Registering metric
+        :param metric: Metric object
+        :return: Metric object
+        """
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        """
+        Registering counter
+        :param name: Name of metric
+        :param description: Help text
+        :param labels: Names of labels
+        :return: Counter
+        """
+        return self.add(Counter(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        """
+        Registering histogram
+        :param name: Name of metric
+        :param description: Help text
+        :param labels: Names of labels
+        :param buckets: Upper bounds of buckets
+        :return: Histogram
+        """
+        return self.add(Histogram(name, description, labels, buckets))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = (),
+              collect: Callable[[], Dict[tuple, float]] = None) -> Gauge:
+        """
+        Registering gauge
+        :param name: Name of metric
+        :param description: Help text
+        :param labels: Names of labels
+        :param collect: Function returning values by tuples of label values
+        :return: Gauge
+        """
+        return self.add(Gauge(name, description, labels, collect))
+
+    def render(self) -> str:
+        """
+        All metrics in Prometheus text format
+        :return: Text
+        """
+        return ''.join(metric.render() for metric in self.metrics.values())
+
+    def write(self, path: str = None) -> None:
+        """
+        Writing metrics to file, file is replaced at once, so scraper never reads partial file
+        :param path: Path of file, path of registry by default
+        :return:
+        """
+        path = path or self.path
+        with open(path + '.tmp', 'w') as file:
+            file.write(self.render())
+        os.replace(path + '.tmp', path)
+
+    def start(self) -> None:
+        """
+        Starting exporters in current event loop, if they are not started yet
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        if not self.enabled or self.__loop is loop:
+            return
+        self.__loop = loop
+
+        self.__tasks = list()
+        if self.path:
+            self.__tasks.append(loop.create_task(self.__write_periodically()))
+        if self.port:
+            self.__tasks.append(loop.create_task(self.serve(self.host, self.port)))
+
+    async def __write_periodically(self) -> None:
+        """
+        Writing file every interval, and last time when exporter is cancelled
+        :return:
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                self.write()
+        finally:
+            self.write()
+
+    async def serve(self, host: str, port: int) -> None:
+        """
+        Serving metrics over HTTP for scraping, any path returns metrics
+        :param host: Host
+        :param port: Port
+        :return:
+        """
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            try:
+                # Request is not needed, head is read only for correct closing of connection
+                while (await reader.readline()).strip():
+                    pass
+                body = self.render().encode()
+                writer.write(('HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                              'Content-Length: {}\r\nConnection: close\r\n\r\n'.format(len(body))).encode() + body)
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        try:
+            server = await asyncio.start_server(handle, host, port)
+        except OSError as exc:
+            logging.warning('Metrics endpoint is not started: {}'.format(exc))
+            return
+        logging.info('Metrics on http://{}:{}/metrics'.format(host, port))
+
+        async with server:
+            await server.serve_forever()
+
+    async def stop(self) -> None:
+        """
+        Stopping exporters, file is written last time
+        :return:
+        """
+        tasks, self.__tasks = self.__tasks, list()
+        self.__loop = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
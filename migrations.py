@@ -0,0 +1,327 @@
+# [[ NATIVE ]]
+from typing import Sequence, Callable, Awaitable, Any, Type
+import traceback
+import logging
+import asyncio
+
+# [[ SQLALCHEMY ]]
+from sqlalchemy import text
+
+# [[ SETTINGS ]]
+from settings import DBType
+
+
+async def execute(db, sql: str, params: dict = None) -> list:
+    """
+    Executing raw SQL in unit of work of database
+    :param db: Database object
+    :param sql: Query, parameters are written as :name
+    :param params: Values of parameters
+    :return: Rows
+    """
+    # SELECT outside unit of work does not take write lock of SQLite
+    async with db.transaction(savepoint=False, write=not sql.lstrip().upper().startswith('SELECT')) as conn:
+        if db.db_type == DBType.SQLITE:
+            result = await conn.execute(text(sql), params)
+            return list(result.fetchall()) if result.returns_rows else list()
+        elif db.db_type == DBType.MYSQL:
+            result = await conn.execute(text(sql), params or {})
+            return list(await result.fetchall()) if result.returns_rows else list()
+
+
+def log_progress(migration: 'Migration', step: 'Step', done: int, total: int) -> None:
+    """
+    Default progress reporting, writing to log
+    :param migration: Migration object
+    :param step: Step of migration
+    :param done: Count of done units (rows or statements)
+    :param total: Count of all units
+    :return:
+    """
+    logging.info('Migration {} ({}): {} {}/{}'.format(migration.version, migration.name, step.name, done, total))
+
+
+class Step:
+    """
+    Part of migration, every step must be safe for running again, because migration can be interrupted
+    """
+    name = 'step'
+
+    async def run(self, db, migration: 'Migration', position: int,
+                  checkpoint: Callable[[int], Awaitable], progress: Callable) -> None:
+        """
+        Running step
+        :param db: Database object
+        :param migration: Migration of this step
+        :param position: Saved position of interrupted step, 0 for new step
+        :param checkpoint: Saving position, must be called inside transaction of done work
+        :param progress: Function for progress reporting
+        :return:
+        """
+        ...
+
+
+class CreateTables(Step):
+    """
+    Creating tables if not exists
+    """
+    def __init__(self, tables: Sequence[Type[Any]]):
+        self.tables = tables
+        self.name = 'create tables ' + ', '.join(table.__tablename__ for table in tables)
+
+    async def run(self, db, migration, position, checkpoint, progress) -> None:
+        progress(migration, self, 0, len(self.tables))
+
+        if db.db_type == DBType.SQLITE:
+            async with db.transaction(savepoint=False) as session:
+                await session.run_sync(lambda sync_session: self.tables[0].metadata.create_all(
+                    sync_session.connection(), tables=[table.__table__ for table in self.tables]))
+        elif db.db_type == DBType.MYSQL:  # Fix for mysql, because SQLAlchemy cannot create table by metadata
+            for table in self.tables:
+                try:
+                    logging.info('Initializing table {}'.format(table.__tablename__))
+                    await execute(db, table.mysql())
+                except Exception as exc:
+                    print(traceback.format_exception(exc))
+                    print(table.mysql())
+                    raise exc
+
+        progress(migration, self, len(self.tables), len(self.tables))
+
+
+class AddColumn(Step):
+    """
+    Adding column to table if not exists
+    """
+    def __init__(self, table: str, column: str, sqlite: str, mysql: str):
+        """
+        :param table: Name of table
+        :param column: Name of column
+        :param sqlite: Definition of column for SQLite
+        :param mysql: Definition of column for MySQL
+        """
+        self.table = table
+        self.column = column
+        self.definition = {DBType.SQLITE: sqlite, DBType.MYSQL: mysql}
+        self.name = 'add column {}.{}'.format(table, column)
+
+    async def exists(self, db) -> bool:
+        """
+        Checking column
+        :param db: Database object
+        :return: Column exists
+        """
+        if db.db_type == DBType.SQLITE:
+            rows = await execute(db, 'PRAGMA table_info({})'.format(self.table))
+            return any(row[1] == self.column for row in rows)
+        elif db.db_type == DBType.MYSQL:
+            rows = await execute(db, 'SELECT 1 FROM information_schema.columns '
+                                     'WHERE table_schema = DATABASE() AND table_name = :table AND column_name = :column',
+                                 {'table': self.table, 'column': self.column})
+            return bool(rows)
+
+    async def run(self, db, migration, position, checkpoint, progress) -> None:
+        progress(migration, self, 0, 1)
+
+        if not await self.exists(db):
+            sql = 'ALTER TABLE {} ADD COLUMN {} {}'.format(self.table, self.column, self.definition[db.db_type])
+            # Online DDL, table is not locked while column is added
+            if db.db_type == DBType.MYSQL:
+                sql += ', ALGORITHM=INPLACE, LOCK=NONE'
+            await execute(db, sql)
+
+        progress(migration, self, 1, 1)
+
+
+class ModifyColumn(Step):
+    """
+    Changing type of column (MySQL), if column has other type
+    Change of type is not supported by online DDL, so table is copied and writes wait until it is done
+    """
+    def __init__(self, table: str, column: str, data_type: str, mysql: str):
+        """
+        :param table: Name of table
+        :param column: Name of column
+        :param data_type: New type of column, as DATA_TYPE of information_schema (e.g. longblob)
+        :param mysql: Definition of column for MySQL
+        """
+        self.table = table
+        self.column = column
+        self.data_type = data_type
+        self.definition = mysql
+        self.name = 'modify column {}.{}'.format(table, column)
+
+    async def changed(self, db) -> bool:
+        """
+        Checking type of column
+        :param db: Database object
+        :return: Column has new type already
+        """
+        rows = await execute(db, 'SELECT data_type FROM information_schema.columns '
+                                 'WHERE table_schema = DATABASE() AND table_name = :table AND column_name = :column',
+                             {'table': self.table, 'column': self.column})
+        return bool(rows) and rows[0][0].lower() == self.data_type
+
+    async def run(self, db, migration, position, checkpoint, progress) -> None:
+        progress(migration, self, 0, 1)
+
+        # SQLite does not check types of values, so column is not changed
+        if db.db_type == DBType.MYSQL and not await self.changed(db):
+            # Reads are not blocked while table is copied
+            await execute(db, 'ALTER TABLE {} MODIFY {} {}, ALGORITHM=COPY, LOCK=SHARED'.format(
+                self.table, self.column, self.definition))
+
+        progress(migration, self, 1, 1)
+
+
+async def index_exists(db, name: str, table: str) -> bool:
+    """
+    Checking index
+    :param db: Database object
+    :param name: Name of index
+    :param table: Name of table
+    :return: Index exists
+    """
+    if db.db_type == DBType.SQLITE:
+        rows = await execute(db, "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name", {'name': name})
+    else:
+        rows = await execute(db, 'SELECT 1 FROM information_schema.statistics '
+                                 'WHERE table_schema = DATABASE() AND table_name = :table AND index_name = :name',
+                             {'table': table, 'name': name})
+    return bool(rows)
+
+
+class CreateIndex(Step):
+    """
+    Creating index if not exists
+    For MySQL index is built online, without locking table for writes
+    """
+    def __init__(self, name: str, table: str, columns: Sequence[str], unique: bool = False,
+                 mysql_columns: Sequence[str] = None, backends: Sequence[int] = (DBType.SQLITE, DBType.MYSQL)):
+        """
+        :param name: Name of index
+        :param table: Name of table
+        :param columns: Columns of index
+        :param unique: Unique index
+        :param mysql_columns: Columns for MySQL, if prefix length is needed for TEXT
+        :param backends: Database types where index is needed
+        """
+        self.index = name
+        self.table = table
+        self.columns = columns
+        self.unique = unique
+        self.mysql_columns = mysql_columns or columns
+        self.backends = backends
+        self.name = 'create index ' + name
+
+    async def run(self, db, migration, position, checkpoint, progress) -> None:
+        progress(migration, self, 0, 1)
+
+        if db.db_type in self.backends and not await index_exists(db, self.index, self.table):
+            unique = 'UNIQUE ' if self.unique else ''
+            if db.db_type == DBType.SQLITE:
+                await execute(db, 'CREATE {}INDEX IF NOT EXISTS {} ON {} ({})'.format(
+                    unique, self.index, self.table, ', '.join(self.columns)))
+            elif db.db_type == DBType.MYSQL:
+                await execute(db, 'ALTER TABLE {} ADD {}INDEX {} ({}), ALGORITHM=INPLACE, LOCK=NONE'.format(
+                    self.table, unique, self.index, ', '.join(self.mysql_columns)))
+
+        progress(migration, self, 1, 1)
+
+
+class DropIndex(Step):
+    """
+    Dropping index if exists
+    """
+    def __init__(self, name: str, table: str, backends: Sequence[int] = (DBType.SQLITE, DBType.MYSQL)):
+        """
+        :param name: Name of index
+        :param table: Name of table
+        :param backends: Database types where index exists
+        """
+        self.index = name
+        self.table = table
+        self.backends = backends
+        self.name = 'drop index ' + name
+
+    async def run(self, db, migration, position, checkpoint, progress) -> None:
+        progress(migration, self, 0, 1)
+
+        if db.db_type in self.backends and await index_exists(db, self.index, self.table):
+            if db.db_type == DBType.SQLITE:
+                await execute(db, 'DROP INDEX IF EXISTS {}'.format(self.index))
+            elif db.db_type == DBType.MYSQL:
+                await execute(db, 'ALTER TABLE {} DROP INDEX {}, ALGORITHM=INPLACE, LOCK=NONE'.format(
+                    self.table, self.index))
+
+        progress(migration, self, 1, 1)
+
+
+class Batched(Step):
+    """
+    Changing rows of table in batches by ranges of ID, every batch is committed with its position,
+    so interrupted step continues from last batch
+    """
+    def __init__(self, name: str, table: str, apply: Callable[[Any, int, int], Awaitable],
+                 batch_size: int = 10000, pause: float = 0):
+        """
+        :param name: Name of step
+        :param table: Name of table
+        :param apply: Coroutine function changing rows with first_id < id <= last_id
+        :param batch_size: Count of IDs in one batch
+        :param pause: Sleep between batches in seconds, for giving time to other queries
+        """
+        self.name = name
+        self.table = table
+        self.apply = apply
+        self.batch_size = batch_size
+        self.pause = pause
+
+    async def run(self, db, migration, position, checkpoint, progress) -> None:
+        total = (await execute(db, 'SELECT MAX(id) FROM {}'.format(self.table)))[0][0] or 0
+
+        while position < total:
+            last_id = min(position + self.batch_size, total)
+            async with db.transaction(savepoint=False):
+                await self.apply(db, position, last_id)
+                await checkpoint(last_id)
+            position = last_id
+
+            progress(migration, self, position, total)
+            if self.pause:
+                await asyncio.sleep(self.pause)
+
+        progress(migration, self, total, total)
+
+
+class Call(Step):
+    """
+    Running coroutine function with database, e.g. for filling new table from existing rows
+    """
+    def __init__(self, name: str, func: Callable[[Any], Awaitable]):
+        """
+        :param name: Name of step
+        :param func: Coroutine function, gets database object, must be safe for running again
+        """
+        self.name = name
+        self.func = func
+
+    async def run(self, db, migration, position, checkpoint, progress) -> None:
+        progress(migration, self, 0, 1)
+        await self.func(db)
+        progress(migration, self, 1, 1)
+
+
+class Migration:
+    """
+    Versioned change of database schema
+    """
+    def __init__(self, version: int, name: str, steps: Sequence[Step]):
+        """
+        :param version: Version of schema after migration
+        :param name: Name of migration
+        :param steps: Steps of migration
+        """
+        self.version = version
+        self.name = name
+        self.steps = steps
@@ -0,0 +1,251 @@
+# [[ NATIVE ]]
+from typing import Callable, Optional, Dict, List
+from collections import defaultdict, Counter
+from functools import wraps
+import threading
+import cProfile
+import inspect
+import logging
+import time
+import sys
+import os
+
+
+class Sampler(threading.Thread):
+    """
+    Sampling stacks of thread, for collapsed stacks of flame graph
+    """
+    def __init__(self, thread_id: int, interval: float):
+        """
+        :param thread_id: ID of sampled thread
+        :param interval: Time between samples in seconds
+        """
+        super(Sampler, self).__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = list()
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        """
+        Stopping sampling
+        :return: Count of samples by stack
+        """
+        self.stopped.set()
+        self.join()
+        return self.stacks
+
+
+class Action:
+    """
+    One profiled call of UI event handler, with layout and drawing of next frame
+    """
+    def __init__(self, index: int, name: str, interval: float):
+        self.index = index
+        self.name = name
+        self.started = time.perf_counter()
+        self.handler = 0.0
+        self.finished = False
+
+        # Time when at least one database call is running, calls of gather() are overlapped
+        self.db = 0.0
+        self.db_active = 0
+        self.db_started = 0.0
+
+        self.profile = cProfile.Profile()
+        self.sampler = Sampler(threading.get_ident(), interval)
+
+
+class Profiler:
+    """
+    Profiling of UI actions: wall time by phases (database, widgets, layout), cProfile and collapsed stacks
+    """
+    def __init__(self, output: str, next_frame: Callable[[Callable[[], None]], None] = None, interval: float = 0.001):
+        """
+        :param output: Directory for results
+        :param next_frame: Function calling callback after next frame is drawn, for layout phase
+        :param interval: Time between samples of stacks in seconds
+        """
+        self.output = output
+        self.next_frame = next_frame
+        self.interval = interval
+
+        self.count = 0
+        self.current: Optional[Action] = None
+        # Action waiting for next frame
+        self.pending: Optional[Action] = None
+        self.actions: Dict[str, List[dict]] = defaultdict(list)
+
+        os.makedirs(output, exist_ok=True)
+        with open(os.path.join(output, 'actions.csv'), 'w') as file:
+            file.write('index,name,total_ms,db_ms,widget_ms,layout_ms\n')
+
+    def handler(self, name: str) -> Callable:
+        """
+        Decorator for UI event handler
+        :param name: Name of action
+        :return: Decorator
+        """
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                # Handler called by other handler is part of its action
+                if self.current is not None:
+                    return func(*args, **kwargs)
+
+                action = self.start(name)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    action.handler = time.perf_counter() - action.started
+                    self.current = None
+
+                    # Layout is done by Kivy before next frame
+                    if self.next_frame is not None:
+                        self.pending = action
+                        self.next_frame(lambda: self.finish(action))
+                    else:
+                        self.finish(action)
+            return wrapper
+        return decorator
+
+    def database_call(self, func: Callable) -> Callable:
+        """
+        Wrapper of coroutine function of database
+        :param func: Coroutine function
+        :return: Wrapper
+        """
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            action = self.current
+            if action is None:
+                return await func(*args, **kwargs)
+
+            action.db_active += 1
+            if action.db_active == 1:
+                action.db_started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                action.db_active -= 1
+                if action.db_active == 0:
+                    action.db += time.perf_counter() - action.db_started
+        return wrapper
+
+    def wrap_module(self, module, exclude: tuple = ()) -> None:
+        """
+        Wrapping public coroutine functions of module, callers must use them as attributes of module
+        :param module: Module, e.g. database
+        :param exclude: Names of functions, which are not database calls
+        :return:
+        """
+        for name, func in list(vars(module).items()):
+            if name.startswith('_') or name in exclude or not inspect.iscoroutinefunction(func):
+                continue
+            if func.__module__ == module.__name__:
+                setattr(module, name, self.database_call(func))
+
+    def start(self, name: str) -> Action:
+        """
+        Starting action
+        :param name: Name of action
+        :return: Action
+        """
+        # Only one cProfile can be enabled, previous action is finished without waiting for frame
+        if self.pending is not None:
+            self.finish(self.pending)
+
+        self.count += 1
+        action = Action(self.count, name, self.interval)
+        self.current = action
+
+        action.sampler.start()
+        action.profile.enable()
+        return action
+
+    def finish(self, action: Action) -> None:
+        """
+        Finishing action and saving its results
+        :param action: Action
+        :return:
+        """
+        if action.finished:
+            return
+        action.finished = True
+        if self.pending is action:
+            self.pending = None
+
+        action.profile.disable()
+        stacks = action.sampler.stop()
+        total = time.perf_counter() - action.started
+
+        phases = {'total': total, 'db': action.db, 'widget': action.handler - action.db,
+                  'layout': total - action.handler}
+        self.actions[action.name].append(phases)
+
+        prefix = os.path.join(self.output, '{:04d}-{}'.format(action.index, action.name))
+        action.profile.dump_stats(prefix + '.prof')
+        with open(prefix + '.collapsed', 'w') as file:
+            for stack, count in stacks.items():
+                file.write('{} {}\n'.format(stack, count))
+        with open(os.path.join(self.output, 'actions.csv'), 'a') as file:
+            file.write('{},{},{:.3f},{:.3f},{:.3f},{:.3f}\n'.format(action.index, action.name, total * 1000,
+                                                                   phases['db'] * 1000, phases['widget'] * 1000,
+                                                                   phases['layout'] * 1000))
+
+        logging.info('Profile {}: {:.1f}ms (db {:.1f}ms, widget {:.1f}ms, layout {:.1f}ms)'.format(
+            action.name, total * 1000, phases['db'] * 1000, phases['widget'] * 1000, phases['layout'] * 1000))
+
+    def report(self) -> None:
+        """
+        Writing average time of actions to log
+        :return:
+        """
+        if self.pending is not None:
+            self.finish(self.pending)
+
+        for name, actions in sorted(self.actions.items()):
+            average = {phase: sum(item[phase] for item in actions) / len(actions) * 1000 for phase in actions[0]}
+            logging.info('Profile {} x{}: average {total:.1f}ms (db {db:.1f}ms, widget {widget:.1f}ms, '
+                         'layout {layout:.1f}ms)'.format(name, len(actions), **average))
+        logging.info('Profiles are saved to {}'.format(os.path.abspath(self.output)))
+
+
+# Profiler of application, None if profiling is disabled
+profiler: Optional[Profiler] = None
+
+
+def enable(output: str, next_frame: Callable[[Callable[[], None]], None] = None) -> Profiler:
+    """
+    Enabling profiling, must be called before classes with handlers are defined
+    :param output: Directory for results
+    :param next_frame: Function calling callback after next frame is drawn
+    :return: Profiler
+    """
+    global profiler
+    profiler = Profiler(output, next_frame)
+    return profiler
+
+
+def handler(name: str) -> Callable:
+    """
+    Decorator for UI event handler, handler is not changed if profiling is disabled
+    :param name: Name of action
+    :return: Decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        if profiler is None:
+            return func
+        return profiler.handler(name)(func)
+    return decorator
@@ -0,0 +1,511 @@
+# [[ NATIVE ]]
+from typing import Any, AsyncIterator, Callable, Awaitable, List, Tuple, Optional
+from urllib.parse import urlsplit, parse_qs
+from http import HTTPStatus
+import argparse
+import logging
+import asyncio
+import json
+import time
+import sys
+import re
+
+# [[ DATABASE ]]
+import database as db
+
+# [[ LATENCY ]]
+from latency import percentile
+
+# [[ SETTINGS ]]
+from settings import SERVER_HOST, SERVER_PORT, SERVER_MAX_BODY
+
+
+class HTTPError(Exception):
+    """
+    Error with HTTP status for client
+    """
+    def __init__(self, status: HTTPStatus, message: str = None):
+        super(HTTPError, self).__init__(message or status.phrase)
+        self.status = status
+        self.message = message or status.phrase
+
+
+class Request:
+    """
+    Parsed HTTP request
+    """
+    def __init__(self, method: str, target: str, version: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+
+        self.method = method
+        self.path = url.path
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+        # HTTP/1.1 keeps connection by default, HTTP/1.0 only if asked
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            self.keep_alive = connection != 'close'
+        else:
+            self.keep_alive = connection == 'keep-alive'
+
+    def json(self) -> dict:
+        """
+        Body of request as JSON object
+        :return: Object
+        """
+        try:
+            data = json.loads(self.body or b'{}')
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Body is not JSON')
+        if not isinstance(data, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Body must be JSON object')
+        return data
+
+    def integer(self, name: str) -> Optional[int]:
+        """
+        Integer parameter of query string
+        :param name: Name of parameter
+        :return: Value or None
+        """
+        if name not in self.query:
+            return None
+        try:
+            return int(self.query[name])
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, '{} must be integer'.format(name))
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """
+    Reading HTTP request from connection
+    :param reader: Stream of connection
+    :return: Request or None if connection is closed
+    """
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Bad request line')
+
+    headers = dict()
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    body = b''
+    if 'content-length' in headers:
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Bad Content-Length')
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Bad Content-Length')
+        if length > SERVER_MAX_BODY:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            'Body must not be larger than {} bytes'.format(SERVER_MAX_BODY))
+
+        try:
+            body = await reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    return Request(method, target, version, headers, body)
+
+
+class Server:
+    """
+    HTTP/JSON service for library database, all requests share one pooled engine
+    """
+    def __init__(self, host: str = SERVER_HOST, port: int = SERVER_PORT, chunk_size: int = 500):
+        self.host = host
+        self.port = port
+        self.chunk_size = chunk_size
+
+        # Routes as (method, path pattern, handler)
+        self.routes: List[Tuple[str, re.Pattern, Callable[..., Awaitable]]] = [
+            ('GET', re.compile(r'/books'), self.books_search),
+            ('POST', re.compile(r'/books'), self.books_create),
+            ('GET', re.compile(r'/books/(\d+)'), self.books_get),
+            ('DELETE', re.compile(r'/books/(\d+)'), self.books_delete),
+            ('GET', re.compile(r'/genres'), self.genres_search),
+            ('POST', re.compile(r'/genres'), self.genres_create),
+            ('GET', re.compile(r'/genres/(\d+)'), self.genres_get),
+            ('DELETE', re.compile(r'/genres/(\d+)'), self.genres_delete),
+            ('GET', re.compile(r'/stats'), self.stats_get),
+        ]
+
+    async def serve(self) -> None:
+        """
+        Running server until it is cancelled
+        :return:
+        """
+        await db.db.initialize()
+
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        logging.info('Serving on http://{}:{}'.format(self.host, self.port))
+
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Handling connection, requests are read while client keeps connection
+        :param reader: Stream for reading
+        :param writer: Stream for writing
+        :return:
+        """
+        # Every client reads its writes, even if replicas are behind
+        db.begin_session()
+
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    await self.dispatch(request, writer)
+                    keep_alive = request.keep_alive
+                except HTTPError as exc:
+                    keep_alive = False
+                    await self.respond(writer, exc.status, {'error': exc.message}, keep_alive)
+
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request: Request, writer: asyncio.StreamWriter) -> None:
+        """
+        Calling handler of request and writing response
+        :param request: Request object
+        :param writer: Stream for writing
+        :return:
+        """
+        allowed = False
+        for method, pattern, handler in self.routes:
+            match = pattern.fullmatch(request.path)
+            if match is None:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+
+            try:
+                status, result = await handler(request, *(int(group) for group in match.groups()))
+            except HTTPError:
+                raise
+            except Exception as exc:
+                logging.exception(exc)
+                raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR)
+
+            if hasattr(result, '__aiter__'):
+                # Fix for HTTP/1.0, client does not know chunked encoding, so body ends by closing of connection
+                chunked = request.version == 'HTTP/1.1'
+                request.keep_alive = request.keep_alive and chunked
+                await self.respond_stream(writer, status, result, request.keep_alive, chunked)
+            else:
+                await self.respond(writer, status, result, request.keep_alive)
+            return
+
+        raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED if allowed else HTTPStatus.NOT_FOUND)
+
+    @staticmethod
+    def head(status: HTTPStatus, keep_alive: bool, headers: dict) -> bytes:
+        """
+        Building head of response
+        :param status: Status of response
+        :param keep_alive: Keep connection after response
+        :param headers: Headers of response
+        :return: Head
+        """
+        headers = {'Content-Type': 'application/json',
+                   'Connection': 'keep-alive' if keep_alive else 'close',
+                   **headers}
+        lines = ['HTTP/1.1 {} {}'.format(status.value, status.phrase)]
+        lines += ['{}: {}'.format(name, value) for name, value in headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def respond(self, writer: asyncio.StreamWriter, status: HTTPStatus, result: Any, keep_alive: bool) -> None:
+        """
+        Writing response with JSON body
+        :param writer: Stream for writing
+        :param status: Status of response
+        :param result: Object for JSON body, None for empty body
+        :param keep_alive: Keep connection after response
+        :return:
+        """
+        body = b'' if result is None else json.dumps(result).encode()
+        writer.write(self.head(status, keep_alive, {'Content-Length': len(body)}) + body)
+
+    async def respond_stream(self, writer: asyncio.StreamWriter, status: HTTPStatus,
+                             chunks: AsyncIterator[list], keep_alive: bool, chunked: bool = True) -> None:
+        """
+        Writing response with JSON array by chunks, rows are sent while next rows are read from database
+        :param writer: Stream for writing
+        :param status: Status of response
+        :param chunks: Chunks of rows
+        :param keep_alive: Keep connection after response
+        :param chunked: Use chunked encoding, else body is written as is and connection must be closed after it
+        :return:
+        """
+        writer.write(self.head(status, keep_alive, {'Transfer-Encoding': 'chunked'} if chunked else {}))
+
+        separator = b'['
+        try:
+            async for rows in chunks:
+                if not rows:
+                    continue
+                data = separator + b','.join(json.dumps(row).encode() for row in rows)
+                separator = b','
+                writer.write(b'%x\r\n%s\r\n' % (len(data), data) if chunked else data)
+                await writer.drain()
+        except ConnectionError:
+            raise
+        except Exception as exc:
+            # Head is already sent, client sees unfinished body
+            logging.exception(exc)
+            raise ConnectionError('Response is interrupted')
+
+        data = b']' if separator == b',' else b'[]'
+        writer.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(data), data) if chunked else data)
+
+    # [[ BOOKS ]]
+    async def books_search(self, request: Request) -> tuple:
+        """
+        GET /books?search=&title=&author=&genre_id=&order=&desc=&limit=&offset=
+        :param request: Request object
+        :return: Status and chunks of books
+        """
+        search = request.query.get('search')
+        title = request.query.get('title', search)
+        author = request.query.get('author', search)
+
+        order = request.query.get('order', 'id')
+        if order not in db.BOOKS_ORDER:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'order must be one of {}'.format(', '.join(db.BOOKS_ORDER)))
+        descending = request.query.get('desc', '0').lower() in ('1', 'true')
+
+        return HTTPStatus.OK, db.books_stream(title=title, author=author, genre_id=request.integer('genre_id'),
+                                              size=self.chunk_size, order=order, descending=descending,
+                                              limit=request.integer('limit'), offset=request.integer('offset') or 0)
+
+    async def books_get(self, request: Request, _id: int) -> tuple:
+        """
+        GET /books/<id>
+        :param request: Request object
+        :param _id: Row ID
+        :return: Status and book with genres
+        """
+        book = await db.books_get(_id=_id)
+        if not book:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        book['genres_id'] = [row['genre_id'] for row in await db.book_genre_get(book_id=_id)]
+        return HTTPStatus.OK, book
+
+    async def books_create(self, request: Request) -> tuple:
+        """
+        POST /books {"title", "author", "description", "genres_id"}
+        :param request: Request object
+        :return: Status and ID of new book
+        """
+        data = request.json()
+        try:
+            title, author, description = str(data['title']), str(data['author']), str(data['description'])
+            genres_id = [int(genre_id) for genre_id in data.get('genres_id', [])]
+        except (KeyError, TypeError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'title, author, description and genres_id are required')
+
+        book_id = await db.books_add(title=title, author=author, description=description, genres_id=genres_id)
+        return HTTPStatus.CREATED, {'id': book_id}
+
+    async def books_delete(self, request: Request, _id: int) -> tuple:
+        """
+        DELETE /books/<id>
+        :param request: Request object
+        :param _id: Row ID
+        :return: Status
+        """
+        await db.books_delete(_id=_id)
+        return HTTPStatus.NO_CONTENT, None
+
+    # [[ GENRES ]]
+    async def genres_search(self, request: Request) -> tuple:
+        """
+        GET /genres?name=
+        :param request: Request object
+        :return: Status and genres
+        """
+        return HTTPStatus.OK, await db.genres_get(name=request.query.get('name'))
+
+    async def genres_get(self, request: Request, _id: int) -> tuple:
+        """
+        GET /genres/<id>
+        :param request: Request object
+        :param _id: Row ID
+        :return: Status and genre
+        """
+        genre = await db.genres_get(_id=_id)
+        if not genre:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        return HTTPStatus.OK, genre
+
+    async def genres_create(self, request: Request) -> tuple:
+        """
+        POST /genres {"name"}
+        :param request: Request object
+        :return: Status and ID of new genre
+        """
+        name = request.json().get('name')
+        if not isinstance(name, str) or not name:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'name is required')
+
+        return HTTPStatus.CREATED, {'id': await db.genres_add(name=name)}
+
+    async def genres_delete(self, request: Request, _id: int) -> tuple:
+        """
+        DELETE /genres/<id>
+        :param request: Request object
+        :param _id: Row ID
+        :return: Status
+        """
+        await db.genres_delete(_id=_id)
+        return HTTPStatus.NO_CONTENT, None
+
+    # [[ STATISTICS ]]
+    async def stats_get(self, request: Request) -> tuple:
+        """
+        GET /stats?top=
+        :param request: Request object
+        :return: Status and statistics
+        """
+        try:
+            top = int(request.query.get('top', 10))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'top must be integer')
+
+        return HTTPStatus.OK, await db.stats_get(top=top)
+
+
+# [[ LOAD TEST ]]
+async def read_response(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """
+    Reading HTTP response, with Content-Length or chunked body, or body until end of connection
+    :param reader: Stream of connection
+    :return: Status and body
+    """
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split(' ')[1])
+    headers = {line.split(':', 1)[0].lower(): line.split(':', 1)[1].strip() for line in head[1:] if ':' in line}
+
+    if headers.get('transfer-encoding') == 'chunked':
+        body = b''
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                return status, body
+            body += chunk[:-2]
+
+    if 'content-length' not in headers:
+        return status, await reader.read()
+    return status, await reader.readexactly(int(headers['content-length']))
+
+
+async def bench(host: str, port: int, path: str, requests: int, concurrency: int) -> dict:
+    """
+    Load test of running server, every client sends requests one by one on kept connection
+    :param host: Host of server
+    :param port: Port of server
+    :param path: Path of GET request
+    :param requests: Count of all requests
+    :param concurrency: Count of clients
+    :return: Report
+    """
+    latencies = list()
+    errors = 0
+    request = 'GET {} HTTP/1.1\r\nHost: {}\r\nConnection: keep-alive\r\n\r\n'.format(path, host).encode()
+
+    async def client(count: int) -> None:
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                writer.write(request)
+                status, _ = await read_response(reader)
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors += 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(requests // concurrency + (i < requests % concurrency))
+                           for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def main() -> None:
+    """
+    Parsing arguments and running server or load test
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='HTTP/JSON service for library database')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='run server')
+    serve_parser.add_argument('--host', default=SERVER_HOST)
+    serve_parser.add_argument('--port', type=int, default=SERVER_PORT)
+    serve_parser.add_argument('--chunk-size', type=int, default=500, help='rows in one chunk of streamed response')
+
+    bench_parser = commands.add_parser('bench', help='load test of running server')
+    bench_parser.add_argument('--host', default=SERVER_HOST)
+    bench_parser.add_argument('--port', type=int, default=SERVER_PORT)
+    bench_parser.add_argument('--path', default='/books')
+    bench_parser.add_argument('--requests', type=int, default=1000)
+    bench_parser.add_argument('--concurrency', type=int, default=16)
+
+    args = parser.parse_args()
+
+    # Fix for Windows
+    if sys.platform in ('win32', 'cygwin',):
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(Server(args.host, args.port, args.chunk_size).serve())
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'bench':
+        report = asyncio.run(bench(args.host, args.port, args.path, args.requests, args.concurrency))
+        print('{requests} requests, {errors} errors in {seconds:.2f}s: '
+              '{rps:.1f} req/s, p50 {p50_ms:.2f} ms, p99 {p99_ms:.2f} ms'.format(**report))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,3 +11,68 @@ DB_HOST = '127.0.0.1'
 DB_USER = 'library_user'
 DB_PASS = 'library_pass'
 DB_NAME = 'library'
+
+# Read replicas, hosts (MySQL) or names of database copies (SQLite), reads are routed to them
+DB_REPLICAS = []
+# Choosing replica: 'round_robin' or 'least_connections'
+DB_REPLICA_SELECTION = 'round_robin'
+# Interval of health checks of replicas in seconds
+DB_REPLICA_CHECK_INTERVAL = 5.0
+# Reads of session go to primary for this time after its write, in seconds
+DB_READ_YOUR_WRITES = 2.0
+
+# Branch libraries, key of library and name of its database file (SQLite) or schema (MySQL)
+DB_LIBRARIES = {}
+# Max count of open SQLite databases of branch libraries, least recently used are closed
+DB_MAX_OPEN = 16
+
+# Read-only snapshot of catalog, application shows it at once while database is started, None for no snapshot
+DB_SNAPSHOT = 'library.snapshot'
+
+# SQLite databases are kept in memory, all sessions share one connection; with DB_MEMORY_SNAPSHOT database is loaded
+# from its file at start and saved back every DB_MEMORY_FLUSH_INTERVAL seconds (0 for saving only on close)
+DB_MEMORY = False
+DB_MEMORY_SNAPSHOT = True
+DB_MEMORY_FLUSH_INTERVAL = 60.0
+
+# Count of independent queries executed concurrently, see Database.gather()
+DB_PARALLELISM = {
+    DBType.SQLITE: 4,
+    DBType.MYSQL: 8,
+}
+
+# Write-behind queue, writes are saved by group commits every DB_WRITE_QUEUE_DELAY seconds
+# or every DB_WRITE_QUEUE_ROWS writes, writers wait while queue has DB_WRITE_QUEUE_SIZE writes
+DB_WRITE_QUEUE = False
+DB_WRITE_QUEUE_DELAY = 0.01
+DB_WRITE_QUEUE_ROWS = 100
+DB_WRITE_QUEUE_SIZE = 1000
+
+# Retries of units of work after lock waits, deadlocks and lost connections: at most DB_RETRY_ATTEMPTS attempts,
+# random delay grows from DB_RETRY_DELAY twice with every attempt, up to DB_RETRY_MAX_DELAY seconds
+DB_RETRY_ATTEMPTS = 5
+DB_RETRY_DELAY = 0.02
+DB_RETRY_MAX_DELAY = 1.0
+
+# Seconds of waiting for write lock of other connection of SQLite, before error 'database is locked'
+DB_BUSY_TIMEOUT = 5.0
+
+# Metrics of database in Prometheus text format, written to DB_METRICS_FILE every DB_METRICS_INTERVAL seconds
+# and served on DB_METRICS_PORT (None for no file or no endpoint)
+DB_METRICS = False
+DB_METRICS_FILE = None
+DB_METRICS_INTERVAL = 15.0
+DB_METRICS_PORT = None
+
+# Compression of book descriptions by zlib, descriptions of at least DB_COMPRESS_MIN_LENGTH bytes are compressed
+# with DB_COMPRESS_LEVEL on write, existing descriptions are compressed by `manage.py compress`
+DB_COMPRESS_DESCRIPTIONS = False
+DB_COMPRESS_MIN_LENGTH = 256
+DB_COMPRESS_LEVEL = 6
+
+
+# [[ SETTINGS . SERVER ]]
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8080
+# Max size of request body in bytes, bigger requests are rejected before reading body
+SERVER_MAX_BODY = 1024 * 1024
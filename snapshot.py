@@ -0,0 +1,311 @@
+# [[ NATIVE ]]
+from typing import Sequence, Optional, Dict, List
+from bisect import bisect_right
+from array import array
+import tempfile
+import struct
+import mmap
+import sys
+import os
+
+
+# Marker and version of snapshot file
+MAGIC = b'LIBSNAP1'
+
+# Sections of file in order of header, every section is array of int64 (int32 for orders) or UTF-8 blob
+# Descriptions are not included, they are read from database by book
+SECTIONS = (
+    'book_ids',
+    'title_offsets', 'titles',
+    'author_offsets', 'authors',
+    # Title and author of every book in lower case (ASCII, like LIKE of SQLite), separated by FIELD_SEPARATOR
+    'search_offsets', 'search',
+    # Genres of book i are genre_ids[genre_offsets[i]:genre_offsets[i + 1]]
+    'genre_offsets', 'book_genre_ids',
+    # Indexes of books sorted by title and by author
+    'order_title', 'order_author',
+    'genre_ids', 'genre_name_offsets', 'genre_names',
+)
+
+# Header: magic, byte order, count of books, count of genres, then offset and length of every section
+HEADER = struct.Struct('<8s8sQQ' + 'QQ' * len(SECTIONS))
+
+FIELD_SEPARATOR = b'\x1f'
+
+
+def pack_strings(values: Sequence[str]) -> tuple:
+    """
+    Packing strings into offsets and UTF-8 blob
+    :param values: Strings
+    :return: Offsets (count of strings + 1) and blob
+    """
+    offsets = array('q', [0])
+    blob = bytearray()
+    for value in values:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets.tobytes(), bytes(blob)
+
+
+def sort_key(value: str) -> bytes:
+    """
+    Key for sorting like COLLATE NOCASE of SQLite, only ASCII letters are folded
+    :param value: String
+    :return: Key
+    """
+    return value.encode('utf-8').lower()
+
+
+def write_snapshot(path: str, books: Sequence[tuple], genres: Sequence[tuple], links: Sequence[tuple]) -> dict:
+    """
+    Writing snapshot of catalog, file is replaced only by finished snapshot
+    :param path: Path of snapshot
+    :param books: Books as (id, title, author), sorted by id
+    :param genres: Genres as (id, name)
+    :param links: Genres of books as (book_id, genre_id), sorted by book_id
+    :return: Count of books, genres and size of file
+    """
+    sections: Dict[str, bytes] = dict()
+
+    sections['book_ids'] = array('q', [book[0] for book in books]).tobytes()
+    for index, name in ((1, 'title'), (2, 'author')):
+        sections[name + '_offsets'], sections[name + 's'] = pack_strings([book[index] for book in books])
+    sections['search_offsets'], sections['search'] = pack_strings(
+        ['{}\x1f{}'.format(book[1], book[2]) for book in books])
+    sections['search'] = sections['search'].lower()
+
+    # Links are grouped by books, books without genres have empty range
+    genre_offsets = array('q', [0])
+    book_genre_ids = array('q')
+    position = 0
+    for book in books:
+        while position < len(links) and links[position][0] < book[0]:
+            position += 1
+        while position < len(links) and links[position][0] == book[0]:
+            book_genre_ids.append(links[position][1])
+            position += 1
+        genre_offsets.append(len(book_genre_ids))
+    sections['genre_offsets'] = genre_offsets.tobytes()
+    sections['book_genre_ids'] = book_genre_ids.tobytes()
+
+    for index, name in ((1, 'title'), (2, 'author')):
+        order = sorted(range(len(books)), key=lambda i: (sort_key(books[i][index]), books[i][0]))
+        sections['order_' + name] = array('i', order).tobytes()
+
+    sections['genre_ids'] = array('q', [genre[0] for genre in genres]).tobytes()
+    sections['genre_name_offsets'], sections['genre_names'] = pack_strings([genre[1] for genre in genres])
+
+    # Sections are aligned by 8 bytes, so arrays can be read from memory map without copying
+    table = list()
+    position = HEADER.size
+    for name in SECTIONS:
+        position += -position % 8
+        table += [position, len(sections[name])]
+        position += len(sections[name])
+
+    handle, temp_path = tempfile.mkstemp(suffix='.snapshot', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, sys.byteorder.encode().ljust(8), len(books), len(genres), *table))
+            for name in SECTIONS:
+                file.write(b'\x00' * (-file.tell() % 8))
+                file.write(sections[name])
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return {'books': len(books), 'genres': len(genres), 'bytes': os.path.getsize(path)}
+
+
+class Snapshot:
+    """
+    Read-only snapshot of catalog, file is memory-mapped, so it is opened without reading
+    Methods return rows like functions of database module
+    """
+    def __init__(self, path: str):
+        """
+        :param path: Path of snapshot
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Views must be released before memory map is closed
+        self.views: List[memoryview] = list()
+        try:
+            # Fix for truncated file, header and sections must be inside file
+            if len(self.map) < HEADER.size:
+                raise ValueError('Snapshot {} is truncated'.format(path))
+            magic, byteorder, self.books_count, self.genres_count, *table = HEADER.unpack_from(self.map)
+            if magic != MAGIC:
+                raise ValueError('{} is not snapshot of catalog'.format(path))
+            if byteorder.strip() != sys.byteorder.encode():
+                raise ValueError('Snapshot {} is written with other byte order'.format(path))
+
+            self.sections: Dict[str, tuple] = {name: (table[index * 2], table[index * 2 + 1])
+                                               for index, name in enumerate(SECTIONS)}
+            if any(offset + length > len(self.map) for offset, length in self.sections.values()):
+                raise ValueError('Snapshot {} is truncated'.format(path))
+
+            self.book_ids = self.__array('book_ids', 'q')
+            self.genre_offsets = self.__array('genre_offsets', 'q')
+            self.book_genre_ids = self.__array('book_genre_ids', 'q')
+            self.search_offsets = self.__array('search_offsets', 'q')
+            self.genre_ids = self.__array('genre_ids', 'q')
+            self.orders = {'id': None, 'title': self.__array('order_title', 'i'),
+                           'author': self.__array('order_author', 'i')}
+            self.offsets = {name: self.__array(name + '_offsets', 'q') for name in ('title', 'author', 'genre_name')}
+        except Exception:
+            self.close()
+            raise
+
+        # Names of genres are few, they are decoded at once
+        self.genres = {self.genre_ids[index]: self.__string('genre_name', 'genre_names', index)
+                       for index in range(self.genres_count)}
+
+    def __array(self, name: str, kind: str) -> memoryview:
+        """
+        Array of section without copying
+        :param name: Name of section
+        :param kind: Type of items, like in array module
+        :return: View of array
+        """
+        offset, length = self.sections[name]
+        view = memoryview(self.map)[offset:offset + length].cast(kind)
+        self.views.append(view)
+        return view
+
+    def __string(self, name: str, section: str, index: int) -> str:
+        """
+        Decoding string of blob
+        :param name: Name of strings (prefix of offsets section)
+        :param section: Name of blob section
+        :param index: Index of string
+        :return: String
+        """
+        offsets = self.offsets[name]
+        base = self.sections[section][0]
+        return self.map[base + offsets[index]:base + offsets[index + 1]].decode('utf-8')
+
+    def book(self, index: int) -> dict:
+        """
+        Row of book by index
+        :param index: Index of book in snapshot
+        :return: Row
+        """
+        return {
+            'id': self.book_ids[index],
+            'title': self.__string('title', 'titles', index),
+            'author': self.__string('author', 'authors', index),
+        }
+
+    def __search(self, text: str, title: bool, author: bool) -> set:
+        """
+        Searching text in titles and authors, case of ASCII letters is ignored like by LIKE of SQLite
+        :param text: Text
+        :param title: Search in titles
+        :param author: Search in authors
+        :return: Indexes of found books
+        """
+        needle = text.encode('utf-8').lower()
+        base, length = self.sections['search']
+        end = base + length
+
+        found = set()
+        position = self.map.find(needle, base, end)
+        while position != -1:
+            index = bisect_right(self.search_offsets, position - base) - 1
+            start = base + self.search_offsets[index]
+
+            # Fix for match across books, there is no separator between author and title of next book
+            if position + len(needle) > base + self.search_offsets[index + 1]:
+                position = self.map.find(needle, position + 1, end)
+                continue
+
+            in_author = self.map.find(FIELD_SEPARATOR, start, position) != -1
+            if (author and in_author) or (title and not in_author):
+                found.add(index)
+                # Next match is searched in next book
+                position = self.map.find(needle, base + self.search_offsets[index + 1], end)
+            else:
+                position = self.map.find(needle, position + 1, end)
+        return found
+
+    def books_get(self, title: str = None, author: str = None, genre_id: int = None, order: str = 'id',
+                  descending: bool = False) -> list:
+        """
+        Getting books like database.books_get
+        :param title: Part of title
+        :param author: Part of author
+        :param genre_id: Genre ID of book
+        :param order: Sorting by id, title or author
+        :param descending: Sorting in descending order
+        :return: Rows
+        """
+        if order not in self.orders:
+            raise ValueError('Unknown order {}, expected one of {}'.format(order, ', '.join(self.orders)))
+
+        # If selecting book by Title or Author
+        found: Optional[set] = None
+        if title is not None and title == author:
+            found = self.__search(title, True, True)
+        else:
+            if title is not None:
+                found = self.__search(title, True, False)
+            if author is not None:
+                found = self.__search(author, False, True) & (found if found is not None else
+                                                               set(range(self.books_count)))
+
+        indexes = self.orders[order] or range(self.books_count)
+        if descending:
+            indexes = reversed(indexes)
+
+        rows = list()
+        for index in indexes:
+            if found is not None and index not in found:
+                continue
+            if genre_id is not None and genre_id not in self.book_genres_ids(index):
+                continue
+            rows.append(self.book(index))
+        return rows
+
+    def book_genres_ids(self, index: int) -> memoryview:
+        """
+        Genre IDs of book by index
+        :param index: Index of book in snapshot
+        :return: Genre IDs
+        """
+        return self.book_genre_ids[self.genre_offsets[index]:self.genre_offsets[index + 1]]
+
+    def book_genres(self, book_id: int) -> list:
+        """
+        Genres of book
+        :param book_id: Row ID of book
+        :return: Rows of genres
+        """
+        index = bisect_right(self.book_ids, book_id) - 1
+        if index < 0 or self.book_ids[index] != book_id:
+            return list()
+        return [{'id': genre_id, 'name': self.genres.get(genre_id, '')} for genre_id in self.book_genres_ids(index)]
+
+    def genres_get(self, name: str = None) -> list:
+        """
+        Getting genres like database.genres_get
+        :param name: Name of genre
+        :return: Rows
+        """
+        # Part of name is found like by LIKE of SQLite
+        part = name.encode('utf-8').lower() if name is not None else b''
+        return [{'id': genre_id, 'name': genre_name} for genre_id, genre_name in self.genres.items()
+                if part in genre_name.encode('utf-8').lower()]
+
+    def close(self) -> None:
+        """
+        Closing memory map
+        :return:
+        """
+        for view in self.views:
+            view.release()
+        self.views = list()
+        self.map.close()
@@ -0,0 +1,19 @@
+# [[ NATIVE ]]
+import pytest
+
+# [[ DATABASE ]]
+import database
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch) -> database.Database:
+    """
+    SQLite database in temporary directory, used by functions of database module
+    :param tmp_path: Temporary directory
+    :param monkeypatch: Fixture for patching
+    :return: Database object
+    """
+    monkeypatch.chdir(tmp_path)
+    db = database.Database(db_name='test', replicas=[], memory=False)
+    monkeypatch.setattr(database, 'libraries', database.Libraries(db))
+    return db
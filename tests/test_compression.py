@@ -0,0 +1,54 @@
+# [[ NATIVE ]]
+import asyncio
+
+# [[ DATABASE ]]
+import database
+
+
+def test_compressed_text_round_trip():
+    """
+    Long text is compressed, short text is kept plain, both are read as they were written
+    :return:
+    """
+    column = database.CompressedText(enabled=True, min_length=64)
+    long_text = 'Long description of book. ' * 20
+
+    stored = column.process_bind_param(long_text, None)
+    assert database.is_compressed(stored)
+    assert len(stored) < len(long_text)
+    assert column.process_result_value(stored, None) == long_text
+
+    assert column.process_bind_param('Short', None) == 'Short'
+    assert column.process_result_value('Short', None) == 'Short'
+    assert column.process_bind_param(None, None) is None
+
+
+def test_text_beginning_with_marker():
+    """
+    Plain text beginning with marker is compressed even if compression is disabled, so it is not read as compressed
+    :return:
+    """
+    text = database.COMPRESSED_MARKER.decode() + 'ip'
+    for enabled in (True, False):
+        column = database.CompressedText(enabled=enabled)
+        assert column.process_result_value(column.process_bind_param(text, None), None) == text
+
+
+def test_descriptions_in_database(library):
+    """
+    Descriptions are read from database as they were written
+    :param library: Database object
+    :return:
+    """
+    descriptions = ['Short', 'Long description of book. ' * 100, database.COMPRESSED_MARKER.decode() + 'ip']
+
+    async def run():
+        genre_id = await database.genres_add(name='Fantasy')
+        ids = [await database.books_add(title='Title {}'.format(i), author='Author', description=description,
+                                        genres_id=[genre_id]) for i, description in enumerate(descriptions)]
+        books = [await database.books_get(_id=_id) for _id in ids]
+        await database.libraries.close()
+        return books
+
+    books = asyncio.run(run())
+    assert [book['description'] for book in books] == descriptions
@@ -0,0 +1,44 @@
+# [[ NATIVE ]]
+import asyncio
+
+# [[ DATABASE ]]
+import database
+
+
+def test_duplicate_modes(library):
+    """
+    Book with equal normalized content is skipped or updated, or raises error
+    :param library: Database object
+    :return:
+    """
+    async def run():
+        genre_id = await database.genres_add(name='Fantasy')
+        book_id = await database.books_add(title='Dune', author='Frank Herbert', description='Desert planet',
+                                           genres_id=[genre_id])
+
+        # Case, whitespace and Unicode forms are not taken into account
+        skipped = await database.books_add(title=' dune', author='FRANK  HERBERT', description='Desert planet ',
+                                           genres_id=[genre_id], on_duplicate='skip')
+        title_after_skip = (await database.books_get(_id=book_id))['title']
+
+        upserted = await database.books_add(title='DUNE', author='Frank Herbert', description='Desert planet',
+                                            genres_id=[genre_id], on_duplicate='upsert')
+        title_after_upsert = (await database.books_get(_id=book_id))['title']
+
+        try:
+            await database.books_add(title='Dune', author='Frank Herbert', description='Desert planet',
+                                     genres_id=[genre_id], on_duplicate='error')
+            error = None
+        except Exception as exc:
+            error = exc
+
+        count = len(await database.books_get())
+        await database.libraries.close()
+        return book_id, skipped, title_after_skip, upserted, title_after_upsert, error, count
+
+    book_id, skipped, title_after_skip, upserted, title_after_upsert, error, count = asyncio.run(run())
+    assert skipped == upserted == book_id
+    assert title_after_skip == 'Dune'
+    assert title_after_upsert == 'DUNE'
+    assert error is not None
+    assert count == 1
@@ -0,0 +1,29 @@
+# [[ NATIVE ]]
+import asyncio
+
+# [[ DATABASE ]]
+import database
+
+
+def test_assign_existing_genre(library):
+    """
+    Assigning genre, which book has already, does not change counter of genre
+    :param library: Database object
+    :return:
+    """
+    async def run():
+        genre_id = await database.genres_add(name='Fantasy')
+        book_id = await database.books_add(title='Dune', author='Herbert', description='Desert planet',
+                                           genres_id=[genre_id])
+
+        added = await database.assign_genre(genre_id=genre_id, book_ids=[book_id])
+        await database.books_add(title='Dune', author='Herbert', description='Desert planet', genres_id=[genre_id])
+        stats = await database.stats_get()
+        fixed = (await database.stats_recompute())['fixed']
+        await database.libraries.close()
+        return added, stats, fixed
+
+    added, stats, fixed = asyncio.run(run())
+    assert added == 0
+    assert stats['genres'][0]['books'] == 1
+    assert fixed == 0
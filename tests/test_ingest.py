@@ -0,0 +1,62 @@
+# [[ NATIVE ]]
+import asyncio
+import csv
+
+# [[ DATABASE ]]
+import database
+
+# [[ INGEST ]]
+from ingest import prepare_books
+
+
+def test_import_keeps_order(library, tmp_path):
+    """
+    Ordered import adds books in order of file, counters are equal to recomputed ones
+    :param library: Database object
+    :param tmp_path: Temporary directory
+    :return:
+    """
+    path = str(tmp_path / 'books.csv')
+    titles = ['Title {}'.format(i) for i in range(40)]
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['title', 'author', 'description', 'genres'])
+        for i, title in enumerate(titles):
+            writer.writerow([title, 'Author {}'.format(i % 3), 'Description\nof {}'.format(title),
+                             'Fantasy;Drama' if i % 2 else ' fantasy '])
+        # Duplicate and invalid records
+        writer.writerow([titles[0], 'Author 0', 'Description\nof {}'.format(titles[0]), 'Fantasy'])
+        writer.writerow(['', 'Author', 'Description', ''])
+
+    async def run():
+        result = await database.books_import(path, processes=2, chunk_size=7, ordered=True)
+        books = await database.books_get(order='id')
+        genres = await database.genres_get()
+        fixed = (await database.stats_recompute())['fixed']
+        await database.libraries.close()
+        return result, books, genres, fixed
+
+    result, books, genres, fixed = asyncio.run(run())
+    assert [book['title'] for book in books] == titles
+    assert result['invalid'] == 1
+    # First spelling of genre is used, stripped
+    assert sorted(genre['name'] for genre in genres if genre['name'].lower() in ('fantasy', 'drama')) == \
+        ['Drama', 'fantasy']
+    assert fixed == 0
+
+
+def test_prepare_books():
+    """
+    Records are cleaned and normalized by workers, genres are resolved by normalized names
+    :return:
+    """
+    lines = ['{"title": " Dune ", "author": "Frank  Herbert", "description": "Desert", "genres": ["Sci-Fi", "sci-fi"]}\n',
+             '{"title": "", "author": "Nobody", "description": ""}\n',
+             'not json\n']
+    books, invalid, genres = prepare_books(lines, 'jsonl', [])
+
+    assert invalid == 2
+    assert books[0]['title'] == 'Dune'
+    assert books[0]['author_key'] == 'frank herbert'
+    assert books[0]['genres'] == ['sci-fi']
+    assert genres == {'sci-fi': 'Sci-Fi'}
@@ -0,0 +1,52 @@
+# [[ NATIVE ]]
+import asyncio
+
+# [[ DATABASE ]]
+import database
+from migrations import Migration, Batched
+
+
+def test_batched_step_resumes(library, monkeypatch):
+    """
+    Interrupted batched step continues from saved position, applied migration is not run again
+    :param library: Database object
+    :param monkeypatch: Fixture for patching
+    :return:
+    """
+    batches = list()
+    interrupt = {'at': 4}
+
+    async def apply(db, first_id: int, last_id: int) -> None:
+        if first_id == interrupt['at']:
+            raise RuntimeError('Migration is interrupted')
+        batches.append((first_id, last_id))
+
+    migration = Migration(database.SCHEMA_VERSION + 1, 'test', [Batched('apply', 'books', apply, batch_size=2)])
+
+    async def run():
+        await library.initialize()
+        genre_id = await database.genres_add(name='Fantasy')
+        for i in range(7):
+            await database.books_add(title='Title {}'.format(i), author='Author', description='Description',
+                                     genres_id=[genre_id])
+
+        monkeypatch.setattr(database, 'MIGRATIONS', database.MIGRATIONS + (migration, ))
+        try:
+            await library.migrate()
+        except RuntimeError:
+            pass
+        interrupted = list(batches)
+
+        interrupt['at'] = None
+        version = await library.migrate()
+        resumed = batches[len(interrupted):]
+
+        again = await library.migrate()
+        await database.libraries.close()
+        return interrupted, resumed, version, again
+
+    interrupted, resumed, version, again = asyncio.run(run())
+    assert interrupted == [(0, 2), (2, 4)]
+    assert resumed == [(4, 6), (6, 7)]
+    assert version == again == database.SCHEMA_VERSION + 1
+    assert len(batches) == 4
@@ -0,0 +1,34 @@
+# [[ NATIVE ]]
+import asyncio
+
+# [[ DATABASE ]]
+import database
+
+
+def test_reads_after_write_go_to_primary(library):
+    """
+    Reads of session after its write are routed to primary, later reads go to replica
+    :param library: Database object
+    :return:
+    """
+    async def run():
+        # Replica is other file, so it does not have rows written to primary
+        replica = database.Database(db_name='replica', replicas=[], memory=False)
+        await replica.initialize()
+        await library.initialize()
+        library.set_replicas([replica])
+
+        library.begin_session()
+        await database.genres_add(name='Fresh')
+        after_write = await database.genres_get(name='Fresh')
+
+        library.read_your_writes = 0
+        later = await database.genres_get(name='Fresh')
+
+        await database.libraries.close()
+        await replica.close()
+        return after_write, later
+
+    after_write, later = asyncio.run(run())
+    assert [genre['name'] for genre in after_write] == ['Fresh']
+    assert later == []
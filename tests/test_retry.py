@@ -0,0 +1,82 @@
+# [[ NATIVE ]]
+import sqlite3
+import asyncio
+import pytest
+
+# [[ SQLALCHEMY ]]
+from sqlalchemy.exc import OperationalError
+
+# [[ DATABASE ]]
+import database
+
+
+@pytest.mark.parametrize('message, reason', [
+    ('database is locked', 'busy'),
+    ('database table is locked: books', 'locked'),
+    ('database schema has changed', 'schema_changed'),
+    ('no such table: books', None),
+    ('disk I/O error', None),
+])
+def test_classify_sqlite_error(message, reason):
+    """
+    Errors of SQLite are classified by message, also if they are wrapped by SQLAlchemy
+    :param message: Message of error
+    :param reason: Expected reason of retry, None for fatal error
+    :return:
+    """
+    error = sqlite3.OperationalError(message)
+    assert database.classify_error(error) == reason
+    assert database.classify_error(OperationalError('SELECT 1', {}, error)) == reason
+
+
+def test_classify_sqlite_integrity_error():
+    """
+    Constraint violation of SQLite is fatal
+    :return:
+    """
+    assert database.classify_error(sqlite3.IntegrityError('UNIQUE constraint failed: genres.name')) is None
+
+
+@pytest.mark.parametrize('code, reason', [
+    (1205, 'lock_timeout'),
+    (1213, 'deadlock'),
+    (1040, 'too_many_connections'),
+    (2003, 'connect'),
+    (2006, 'connection_lost'),
+    (2013, 'connection_lost'),
+    (1062, None),
+    (1146, None),
+])
+def test_classify_mysql_error(code, reason):
+    """
+    Errors of MySQL are classified by code
+    :param code: Code of error
+    :param reason: Expected reason of retry, None for fatal error
+    :return:
+    """
+    error = Exception(code, 'Error {}'.format(code))
+    assert database.classify_error(error) == reason
+    assert database.classify_error(OperationalError('SELECT 1', {}, error)) == reason
+
+
+def test_concurrent_books_add(library):
+    """
+    Concurrent units of work, which read and then write, must not fail with lock errors of SQLite
+    :param library: Database object
+    :return:
+    """
+    async def run():
+        genre_id = await database.genres_add(name='Fantasy')
+        await asyncio.gather(*[database.books_add(title='Title {}'.format(i), author='Author {}'.format(i % 10),
+                                                  description='Description {}'.format(i), genres_id=[genre_id])
+                               for i in range(300)])
+
+        stats = await database.stats_recompute()
+        books = await database.books_get()
+        await database.libraries.close()
+        return stats, books
+
+    stats, books = asyncio.run(run())
+    assert len(books) == 300
+    assert stats['fixed'] == 0
+    assert sum(library.retries.values()) == 0
@@ -0,0 +1,42 @@
+# [[ NATIVE ]]
+import pytest
+
+# [[ SNAPSHOT ]]
+from snapshot import write_snapshot, Snapshot
+
+
+def test_search_does_not_cross_books(tmp_path):
+    """
+    Text at end of one book and beginning of next book is not found
+    :param tmp_path: Temporary directory
+    :return:
+    """
+    path = str(tmp_path / 'library.snapshot')
+    write_snapshot(path, [(1, 'The Hobbit', 'Tolkien'), (2, 'Dune', 'Herbert')], [], [])
+
+    snapshot = Snapshot(path)
+    try:
+        assert snapshot.books_get(title='endu', author='endu') == []
+        assert snapshot.books_get(author='endu') == []
+        assert [book['id'] for book in snapshot.books_get(title='dun')] == [2]
+        assert [book['id'] for book in snapshot.books_get(author='kien')] == [1]
+    finally:
+        snapshot.close()
+
+
+def test_truncated_snapshot(tmp_path):
+    """
+    Truncated file is not opened, error is ValueError like for other invalid snapshots
+    :param tmp_path: Temporary directory
+    :return:
+    """
+    path = str(tmp_path / 'library.snapshot')
+    write_snapshot(path, [(1, 'The Hobbit', 'Tolkien'), (2, 'Dune', 'Herbert')], [(1, 'Fantasy')], [(1, 1)])
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    for size in (0, 10, len(data) - 1):
+        with open(path, 'wb') as file:
+            file.write(data[:size])
+        with pytest.raises(ValueError):
+            Snapshot(path)
@@ -0,0 +1,56 @@
+# [[ NATIVE ]]
+import asyncio
+
+# [[ DATABASE ]]
+import database
+
+
+def test_savepoint_rollback(library):
+    """
+    Error of nested unit of work rolls back only its SAVEPOINT, outer unit of work is committed
+    :param library: Database object
+    :return:
+    """
+    async def run():
+        await library.initialize()
+        async with database.transaction():
+            await database.genres_add(name='Kept')
+            try:
+                async with database.transaction():
+                    await database.genres_add(name='Lost')
+                    raise ValueError('Nested unit of work failed')
+            except ValueError:
+                pass
+
+        names = [genre['name'] for genre in await database.genres_get()]
+        await database.libraries.close()
+        return names
+
+    names = asyncio.run(run())
+    assert 'Kept' in names
+    assert 'Lost' not in names
+
+
+def test_transaction_rollback(library):
+    """
+    Error of unit of work rolls back all its queries
+    :param library: Database object
+    :return:
+    """
+    async def run():
+        await library.initialize()
+        try:
+            async with database.transaction():
+                await database.genres_add(name='First')
+                await database.genres_add(name='Second')
+                raise ValueError('Unit of work failed')
+        except ValueError:
+            pass
+
+        names = [genre['name'] for genre in await database.genres_get()]
+        await database.libraries.close()
+        return names
+
+    names = asyncio.run(run())
+    assert 'First' not in names
+    assert 'Second' not in names
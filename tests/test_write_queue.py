@@ -0,0 +1,63 @@
+# [[ NATIVE ]]
+import asyncio
+
+# [[ DATABASE ]]
+import database
+
+
+def test_failed_write_is_isolated(library):
+    """
+    Failed write of group commit is rolled back by its SAVEPOINT, other writes are committed
+    :param library: Database object
+    :return:
+    """
+    async def fail() -> None:
+        await database.genres_add(name='Broken')
+        raise ValueError('Write failed')
+
+    async def run():
+        await library.initialize()
+        library.enable_write_queue(delay=0.05)
+        results = await asyncio.gather(database.genres_add(name='First'), library.run_in_transaction(fail),
+                                       database.genres_add(name='Second'), return_exceptions=True)
+
+        names = [genre['name'] for genre in await database.genres_get()]
+        await database.libraries.close()
+        return results, names
+
+    results, names = asyncio.run(run())
+    assert isinstance(results[0], int) and isinstance(results[2], int)
+    assert isinstance(results[1], ValueError)
+    assert 'First' in names and 'Second' in names
+    assert 'Broken' not in names
+    assert library.retries['write_queue_savepoints'] == 1
+
+
+def test_failed_commit_resolves_futures(library, monkeypatch):
+    """
+    Writers get error of failed commit, writer task keeps running and queue is flushed
+    :param library: Database object
+    :param monkeypatch: Fixture for patching
+    :return:
+    """
+    async def commit(self, batch: list) -> None:
+        raise RuntimeError('Commit failed')
+
+    async def run():
+        await library.initialize()
+        library.enable_write_queue(delay=0.05)
+        monkeypatch.setattr(database.WriteQueue, '_WriteQueue__commit', commit)
+
+        results = await asyncio.wait_for(asyncio.gather(database.genres_add(name='First'),
+                                                        database.genres_add(name='Second'),
+                                                        return_exceptions=True), 5)
+        await asyncio.wait_for(library.write_queue.flush(), 5)
+
+        task = library.write_queue.task
+        await library.disable_write_queue()
+        await database.libraries.close()
+        return results, task
+
+    results, task = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert task.done()